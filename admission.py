@@ -0,0 +1,203 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+# 重阶段准入控制：重封装 / 音频与字幕提取 / 本地推理开始前采样系统负载、可用内存、磁盘繁忙度和剩余空间，
+# 超过阈值就原地等待并写明原因，而不是一起上把机器拖垮。阈值为 0 表示不检查该项。
+
+DEFAULT_LIMITS = {
+    'admission_max_load_pct': 150,
+    'admission_min_mem_mb': 1024,
+    'admission_max_disk_util': 90,
+    'admission_min_free_gb': 5,
+    'admission_max_wait': 1800,
+}
+STAGE_LABELS = {'remux': '重封装', 'extract': '提取', 'inference': '本地推理'}
+POLL_SECONDS = 2.0
+IO_SAMPLE_SECONDS = 0.5
+IO_BASELINE_MAX_AGE = 10.0
+# 负载指标有滞后：最近 PRESSURE_HOLD_SECONDS 内有指标接近阈值 (NEAR_LIMIT_RATIO) 时，
+# 两次重封装/提取之间至少间隔 ADMIT_SPACING_SECONDS 才放行，防止等待者在同一轮采样里一起涌入；空闲时不限速
+ADMIT_SPACING_SECONDS = 3.0
+SPACED_STAGES = ('remux', 'extract')
+NEAR_LIMIT_RATIO = 0.8
+PRESSURE_HOLD_SECONDS = 30.0
+REPORT_INTERVAL = 60.0
+
+
+def read_mem_available():
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def read_load_pct():
+    try:
+        return os.getloadavg()[0] * 100.0 / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+
+def block_device_name(path):
+    try:
+        st_dev = os.stat(path).st_dev
+        target = os.path.realpath(f"/sys/dev/block/{os.major(st_dev)}:{os.minor(st_dev)}")
+    except (OSError, AttributeError):
+        return None
+    name = os.path.basename(target)
+    return name if name and os.path.exists(target) else None
+
+
+def read_io_ticks(device):
+    # /proc/diskstats 第 13 列：设备处于 I/O 中的累计毫秒数
+    try:
+        with open('/proc/diskstats') as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 12 and fields[2] == device:
+                    return int(fields[12])
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class AdmissionController:
+    def __init__(self):
+        # lock 只保护放行间隔；采样 (含磁盘繁忙度的短暂 sleep) 在锁外进行，io_lock 只护住采样缓存
+        self.lock = threading.Lock()
+        self.io_lock = threading.Lock()
+        self.limits = dict(DEFAULT_LIMITS)
+        self.io_samples = {}
+        self.last_admit = 0.0
+        self.pressure_at = 0.0
+
+    def update_limits(self, config):
+        limits = dict(DEFAULT_LIMITS)
+        for key in DEFAULT_LIMITS:
+            try:
+                limits[key] = max(0, int(config.get(key, DEFAULT_LIMITS[key])))
+            except (TypeError, ValueError):
+                pass
+        self.limits = limits
+
+    def disk_util(self, path):
+        # 相邻两次采样之间 io_ticks 的增量折算成繁忙百分比；没有近期基线时现场补采一次
+        device = block_device_name(path)
+        if not device:
+            return None
+        now = time.time()
+        ticks = read_io_ticks(device)
+        if ticks is None:
+            return None
+        with self.io_lock:
+            previous = self.io_samples.get(device)
+        if not previous or now - previous[0] > IO_BASELINE_MAX_AGE:
+            time.sleep(IO_SAMPLE_SECONDS)
+            previous = (now, ticks)
+            now = time.time()
+            ticks = read_io_ticks(device)
+            if ticks is None:
+                return None
+        with self.io_lock:
+            latest = self.io_samples.get(device)
+            if not latest or latest[0] < now:
+                self.io_samples[device] = (now, ticks)
+        elapsed = now - previous[0]
+        if elapsed <= 0:
+            return None
+        return min(100.0, (ticks - previous[1]) / (elapsed * 10.0))
+
+    def check(self, stage, path, need_bytes=0):
+        # 返回未满足的原因列表；顺带记录是否有指标已接近阈值，供放行间隔判断
+        limits = self.limits
+        reasons = []
+        near = False
+        load_pct = read_load_pct()
+        if limits['admission_max_load_pct'] and load_pct is not None:
+            near |= load_pct > limits['admission_max_load_pct'] * NEAR_LIMIT_RATIO
+            if load_pct > limits['admission_max_load_pct']:
+                reasons.append(f"CPU 负载 {load_pct:.0f}% > {limits['admission_max_load_pct']}%")
+        mem_available = read_mem_available()
+        if limits['admission_min_mem_mb'] and mem_available is not None:
+            near |= mem_available * NEAR_LIMIT_RATIO < limits['admission_min_mem_mb'] * 1048576
+            if mem_available < limits['admission_min_mem_mb'] * 1048576:
+                reasons.append(f"可用内存 {mem_available / 1048576:.0f}MB < {limits['admission_min_mem_mb']}MB")
+        if stage in ('remux', 'extract') and path:
+            util = self.disk_util(path) if limits['admission_max_disk_util'] else None
+            if util is not None:
+                near |= util > limits['admission_max_disk_util'] * NEAR_LIMIT_RATIO
+                if util > limits['admission_max_disk_util']:
+                    reasons.append(f"磁盘繁忙 {util:.0f}% > {limits['admission_max_disk_util']}%")
+            # 重封装把新文件写在源文件旁；提取的临时音频/字幕写在系统临时目录
+            target = os.path.dirname(path) if stage == 'remux' else tempfile.gettempdir()
+            min_free = limits['admission_min_free_gb'] * 1073741824
+            if min_free or need_bytes:
+                try:
+                    free = shutil.disk_usage(target).free
+                except OSError:
+                    free = None
+                if free is not None and free < min_free + need_bytes:
+                    reasons.append(f"剩余空间 {free / 1073741824:.1f}GB < {(min_free + need_bytes) / 1073741824:.1f}GB ({target})")
+        if near or reasons:
+            self.pressure_at = time.time()
+        return reasons
+
+    def wait(self, stage, path, need_bytes, should_stop, log, hint=None):
+        # 返回 False 表示等待期间收到停止指令；超过 admission_max_wait 仍不满足则强制放行。
+        # hint(text) 把当前等待原因挂到任务上给面板显示，结束时 hint(None) 清除
+        hint = hint or (lambda text: None)
+        label = STAGE_LABELS.get(stage, stage)
+        if not any(self.limits[key] for key in DEFAULT_LIMITS if key != 'admission_max_wait'):
+            return not should_stop()
+        try:
+            return self._wait(label, stage, path, need_bytes, should_stop, log, hint)
+        finally:
+            hint(None)
+
+    def _wait(self, label, stage, path, need_bytes, should_stop, log, hint):
+        started_at = time.time()
+        reported_at = 0.0
+        waited = False
+        while True:
+            if should_stop():
+                return False
+            reasons = self.check(stage, path, need_bytes)
+            with self.lock:
+                now = time.time()
+                max_wait = self.limits['admission_max_wait']
+                timed_out = bool(max_wait) and now - started_at > max_wait
+                spaced = stage in SPACED_STAGES and now - self.pressure_at < PRESSURE_HOLD_SECONDS
+                spacing = ADMIT_SPACING_SECONDS - (now - self.last_admit) if spaced else 0
+                if (not reasons and spacing <= 0) or timed_out:
+                    if stage in SPACED_STAGES:
+                        self.last_admit = now
+                    break
+            if not reasons:
+                # 资源充足只是离上次放行太近：静默短等后复查
+                time.sleep(min(spacing, POLL_SECONDS))
+                continue
+            now = time.time()
+            hint(f"等待资源 [{label}]: {'; '.join(reasons)}")
+            if not waited:
+                log(f"⏳ 等待系统资源 [{label}]: {'; '.join(reasons)}")
+                waited = True
+                reported_at = now
+            elif now - reported_at >= REPORT_INTERVAL:
+                log(f"⏳ 仍在等待系统资源 [{label}] (已等待 {now - started_at:.0f}s): {'; '.join(reasons)}")
+                reported_at = now
+            time.sleep(POLL_SECONDS)
+        if timed_out and reasons:
+            log(f"⚠️ 等待系统资源超过 {max_wait}s，强制开始{label}: {'; '.join(reasons)}")
+        elif waited:
+            log(f"✅ 系统资源就绪，开始{label} (等待 {time.time() - started_at:.0f}s)")
+        return True
+
+
+admission_controller = AdmissionController()
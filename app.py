@@ -11,14 +11,20 @@ import random
 import re
 import socket
 import concurrent.futures
+import heapq
+import select
+from types import MappingProxyType
 import requests
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, redirect, url_for, send_from_directory
+from flask import Flask, request, jsonify, render_template, redirect, url_for, send_from_directory, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
-from database import db, Task, Config, Keyword, User
-from core_logic import ScannerCore, sensevoice_gguf_ready, VIDEO_EXTENSIONS
-from sqlalchemy import text
+from database import db, Task, Config, Keyword, User, TaskLogLine
+from core_logic import ScannerCore, sensevoice_gguf_ready, VIDEO_EXTENSIONS, clear_keyword_matchers
+from throughput import estimate_rate
+from migrations import run_migrations
+from sqlalchemy import text, event, or_, and_, func
+from sqlalchemy.orm import Session
 
 app = Flask(__name__)
 APP_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -54,48 +60,365 @@ login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
 
-class FrontQueue(queue.Queue):
+class DetectScheduler(queue.Queue):
+    # 检测队列调度：按 预估耗时 + 来源加权 排序 (短任务优先)，并按入队时间老化防止饿死。
+    # 老化对所有任务同速生效，所以 "cost + penalty - aging * 等待时长" 的相对顺序只取决于
+    # cost + penalty + aging * 入队时刻，可以直接用堆。put_front 保留原语义：插到最前 (后插先出)。
+    # 条目为 (层级, 排序键, 序号, cost, item)；cost 单独存一份，后台补算出准确耗时后可 reprioritize。
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self._seq = 0
+
+    def _init(self, maxsize):
+        self.queue = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, entry):
+        heapq.heappush(self.queue, entry)
+
+    def _get(self):
+        return heapq.heappop(self.queue)[-1]
+
+    def _next_seq(self):
+        with self.mutex:
+            self._seq += 1
+            return self._seq
+
+    def put(self, item, block=True, timeout=None, cost=0.0, penalty=0.0):
+        seq = self._next_seq()
+        key = float(cost) + float(penalty) + DETECT_AGING_FACTOR * time.time()
+        super().put((0, key, seq, float(cost), item), block, timeout)
+
     def put_front(self, item, block=True, timeout=None):
-        with self.not_full:
-            if self.maxsize > 0:
-                if not block:
-                    if self._qsize() >= self.maxsize:
-                        raise queue.Full
-                elif timeout is None:
-                    while self._qsize() >= self.maxsize:
-                        self.not_full.wait()
-                elif timeout < 0:
-                    raise ValueError("'timeout' must be a non-negative number")
+        seq = self._next_seq()
+        super().put((-1, 0.0, -seq, 0.0, item), block, timeout)
+
+    def reprioritize(self, item, cost):
+        # 用新的预估耗时替换排队中条目的 cost，来源加权和入队时刻 (老化) 不变；插队条目不受影响
+        cost = float(cost)
+        with self.mutex:
+            changed = False
+            for i, entry in enumerate(self.queue):
+                if entry[-1] == item and entry[0] == 0:
+                    self.queue[i] = (0, entry[1] - entry[3] + cost, entry[2], cost, item)
+                    changed = True
+            if changed:
+                heapq.heapify(self.queue)
+            return changed
+
+    def snapshot(self, limit=None):
+        with self.mutex:
+            entries = heapq.nsmallest(limit, self.queue) if limit else sorted(self.queue)
+        return [entry[-1] for entry in entries]
+
+
+class WorkerPool:
+    # 可在线伸缩的 worker 线程组：扩容立即起新线程；缩容只登记退役名额，
+    # worker 在两个任务之间 (retire_requested) 领取名额后自行退出，不打断进行中的任务。
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+        self.lock = threading.Lock()
+        self.threads = set()
+        self.retiring = 0
+        self.desired = 0
+
+    def _run(self):
+        try:
+            self.target()
+        finally:
+            with self.lock:
+                self.threads.discard(threading.current_thread())
+
+    def resize(self, size):
+        size = max(1, int(size))
+        with self.lock:
+            self.desired = size
+            effective = len(self.threads) - self.retiring
+            if size > effective:
+                revoked = min(self.retiring, size - effective)
+                self.retiring -= revoked
+                effective += revoked
+                for _ in range(size - effective):
+                    thread = threading.Thread(target=self._run, daemon=True, name=f"{self.name}-worker")
+                    self.threads.add(thread)
+                    thread.start()
+            elif size < effective:
+                self.retiring += effective - size
+        return self.status()
+
+    def retire_requested(self):
+        with self.lock:
+            if self.retiring > 0:
+                self.retiring -= 1
+                self.threads.discard(threading.current_thread())
+                return True
+            return False
+
+    def status(self):
+        with self.lock:
+            return {'desired': self.desired, 'alive': len(self.threads), 'retiring': self.retiring}
+
+
+PROGRESS_PERSIST_INTERVAL = 30.0
+
+
+class ProgressRegistry:
+    # 运行中任务的进度 / 速度 / ETA 只记在内存，/api/tasks 返回时覆盖数据库里的值。
+    # 阶段切换由 worker 直接写库；运行中每 PROGRESS_PERSIST_INTERVAL 秒才落一次库，只为重启后还有个大概进度
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.hints = {}
+
+    def set_hint(self, task_id, hint):
+        # 运行中的状态提示 (例如准入等待原因)，只给面板显示，不落库
+        with self.lock:
+            if (hint or None) == self.hints.get(task_id):
+                return
+            if hint:
+                self.hints[task_id] = hint
+            else:
+                self.hints.pop(task_id, None)
+            task_changes.mark([task_id])
+
+    def get_hints(self):
+        with self.lock:
+            return dict(self.hints)
+
+    def update(self, task_id, stage, progress, speed=None, eta=None):
+        # 返回需要落库的条目副本；未到落库间隔返回 None
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(task_id)
+            if entry is None or entry['stage'] != stage:
+                entry = {'stage': stage, 'progress': 0, 'upload_speed': '', 'upload_eta': '', 'persisted_at': now}
+                self.entries[task_id] = entry
+            entry['progress'] = progress
+            if speed is not None:
+                entry['upload_speed'] = speed
+            if eta is not None:
+                entry['upload_eta'] = eta
+            entry['updated_at'] = now
+            task_changes.mark([task_id])
+            if now - entry['persisted_at'] < PROGRESS_PERSIST_INTERVAL:
+                return None
+            entry['persisted_at'] = now
+            return dict(entry)
+
+    def get(self, task_id):
+        with self.lock:
+            entry = self.entries.get(task_id)
+            return dict(entry) if entry else None
+
+    def snapshot(self):
+        with self.lock:
+            return {task_id: dict(entry) for task_id, entry in self.entries.items()}
+
+    def pop(self, task_id):
+        with self.lock:
+            self.hints.pop(task_id, None)
+            return self.entries.pop(task_id, None)
+
+
+class TaskChangeJournal:
+    # 任务行的变更版本号：ORM 提交、内存进度和日志落库都会登记，/api/tasks?since= 据此只返回变化的行。
+    # 版本从毫秒时间戳起步，重启后仍单调递增；早于 floor 的 since 无法补齐，客户端需整页重载
+    def __init__(self, max_deleted=5000):
+        self.lock = threading.Lock()
+        self.version = int(time.time() * 1000)
+        self.floor = self.version
+        self.changed = {}
+        self.deleted = {}
+        self.max_deleted = max_deleted
+
+    def mark(self, task_ids, deleted=False):
+        with self.lock:
+            for task_id in task_ids:
+                self.version += 1
+                if deleted:
+                    self.changed.pop(task_id, None)
+                    self.deleted[task_id] = self.version
                 else:
-                    endtime = time.time() + timeout
-                    while self._qsize() >= self.maxsize:
-                        remaining = endtime - time.time()
-                        if remaining <= 0.0:
-                            raise queue.Full
-                        self.not_full.wait(remaining)
-            self.queue.appendleft(item)
-            self.unfinished_tasks += 1
-            self.not_empty.notify()
-
-
-detect_queue = FrontQueue()
+                    self.deleted.pop(task_id, None)
+                    self.changed[task_id] = self.version
+            if len(self.deleted) > self.max_deleted:
+                expired = sorted(self.deleted.items(), key=lambda item: item[1])[:len(self.deleted) - self.max_deleted // 2]
+                for task_id, version in expired:
+                    del self.deleted[task_id]
+                    self.floor = max(self.floor, version)
+            return self.version
+
+    def current(self):
+        with self.lock:
+            return self.version
+
+    def since(self, version):
+        # 返回 (当前版本, 变化的 id, 删除的 id)；无法增量时后两项为 None
+        with self.lock:
+            if version < self.floor or version > self.version:
+                return self.version, None, None
+            changed = [task_id for task_id, v in self.changed.items() if v > version]
+            deleted = [task_id for task_id, v in self.deleted.items() if v > version]
+            return self.version, changed, deleted
+
+
+EVENT_QUEUE_SIZE = 1000
+EVENT_UPSTREAM_RETRY_SECONDS = 5
+
+
+class EventBus:
+    # 进程内事件总线：每个 SSE 连接一个有界队列；各类上游 (任务变更、Aria2 统计、系统日志) 只在有订阅者时
+    # 各跑一个线程，打开多少个页面都只有一份上游开销。消费过慢的连接会被清空队列并收到 reset，前端整页重载
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.upstreams = {}
+        self.running = set()
+
+    def register_upstream(self, name, target):
+        self.upstreams[name] = target
+
+    def _start_upstreams(self):
+        for name, target in self.upstreams.items():
+            if name not in self.running:
+                self.running.add(name)
+                threading.Thread(target=self._run_upstream, args=(name, target), daemon=True,
+                                 name=f"events-{name}").start()
+
+    def _run_upstream(self, name, target):
+        while True:
+            try:
+                target()
+            except Exception as e:
+                print(f"⚠️ 事件上游异常[{name}]: {e}")
+            with self.lock:
+                if not self.subscribers:
+                    self.running.discard(name)
+                    return
+            # 上游自行退出 (例如 journalctl 不可用) 但仍有订阅者：稍后重试
+            time.sleep(EVENT_UPSTREAM_RETRY_SECONDS)
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self.lock:
+            self.subscribers.add(subscriber)
+            self._start_upstreams()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+
+    def has_subscribers(self):
+        with self.lock:
+            return bool(self.subscribers)
+
+    def publish(self, event, data):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        if not subscribers:
+            return
+        payload = json.dumps(data, ensure_ascii=False)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, payload))
+            except queue.Full:
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait(('reset', '{}'))
+
+
+detect_queue = DetectScheduler()
 upload_queue = queue.Queue()
+detect_cost_queue = queue.Queue()
 running_tasks = {}
+progress_registry = ProgressRegistry()
+task_changes = TaskChangeJournal()
+event_bus = EventBus()
 active_detect_tasks = set()
 active_upload_tasks = set()
+dir_upload_units = {}
 task_state_lock = threading.Lock()
+dir_task_lock = threading.Lock()
 trigger_task_lock = threading.Lock()
 download_proc = None;
 download_logs = [];
 download_lock = threading.Lock()
+keywords_config_lock = threading.Lock()
+keywords_config_cache = {'version': 0, 'loaded': -1, 'data': None}
+config_snapshot_lock = threading.Lock()
+config_snapshot_cache = {'version': 0, 'loaded': -1, 'data': None, 'merged': {}}
+CONFIG_MERGE_CACHE_SIZE = 4096
 LOGIN_ATTEMPTS = {}
 
 
-def enqueue_detect_task(task_id, priority=False):
-    if priority:
-        detect_queue.put_front(task_id)
-    else:
-        detect_queue.put(task_id)
+# 检测调度参数：cost 单位为预估秒数；来源加权为负即提前。老化系数 1 表示每等待 1 秒抵消 1 秒预估耗时
+DETECT_AGING_FACTOR = 1.0
+DETECT_SOURCE_PENALTY = {'manual': -3600.0, 'aria2': 0.0, 'retry': 600.0, 'orphan': 1800.0}
+DETECT_FILE_OVERHEAD_SECONDS = 30.0
+DETECT_COST_PER_MEDIA_SECOND = 0.02
+DETECT_DEFAULT_COST = 300.0
+
+
+def estimate_detect_cost(path, file_count=1, probe=True):
+    # 预估检测耗时 (秒)：整读一遍的 IO (按卷实测吞吐) + 每文件固定开销 + 按时长计的识别开销
+    # 只探测最大的一个视频文件的时长，其余按体积比例折算
+    try:
+        if os.path.isdir(path):
+            files = list_directory_task_files(path)
+        else:
+            files = [path]
+        sizes = {p: os.path.getsize(p) for p in files}
+    except OSError:
+        return DETECT_DEFAULT_COST
+    total_bytes = sum(sizes.values())
+    file_count = max(len(files), int(file_count or 1), 1)
+    videos = [p for p in files if os.path.splitext(p)[1].lower() in VIDEO_EXTENSIONS]
+    media_seconds = 0.0
+    if videos and probe:
+        largest = max(videos, key=lambda p: sizes[p])
+        info = ScannerCore(logger_callback=lambda msg: None).probe_media(largest)
+        if info and info.duration > 0 and sizes[largest] > 0:
+            media_seconds = info.duration * sum(sizes[p] for p in videos) / sizes[largest]
+    cost = (total_bytes / max(1.0, estimate_rate(path)) + DETECT_FILE_OVERHEAD_SECONDS * file_count
+            + DETECT_COST_PER_MEDIA_SECOND * media_seconds)
+    if file_count > 1:
+        try:
+            cost /= max(1, min(file_count, int(get_final_config(None).get('dir_task_concurrency', 2) or 1)))
+        except:
+            pass
+    return round(cost, 1)
+
+
+def enqueue_detect_task(task_id, priority=False, source=None):
+    # priority=True 表示人工操作 (沿用原调用方式)；source 省略时沿用任务创建时记录的来源
+    cost = DETECT_DEFAULT_COST
+    policy = 'sjf'
+    try:
+        policy = get_final_config(None).get('detect_schedule_policy', 'sjf')
+        task = Task.query.get(task_id)
+        ov = get_task_overrides(task) if task else {}
+        source = 'manual' if priority else (source or ov.get('_detect_class') or 'aria2')
+        if ov.get('_detect_cost') is not None:
+            cost = float(ov['_detect_cost'])
+        elif task and task.filepath:
+            # 先按体积粗估入队，ffprobe 时长探测交给 detect_cost_worker，不阻塞创建任务的请求
+            cost = estimate_detect_cost(task.filepath, ov.get('_dir_total_files', 1), probe=False)
+            if policy != 'fifo':
+                detect_cost_queue.put(task_id)
+    except:
+        source = 'manual' if priority else (source or 'aria2')
+    if policy == 'fifo':
+        # 旧行为：人工/重试插队，其余先进先出
+        if source in ('manual', 'retry'):
+            detect_queue.put_front(task_id)
+        else:
+            detect_queue.put(task_id)
+        return
+    detect_queue.put(task_id, cost=cost, penalty=DETECT_SOURCE_PENALTY.get(source, 0.0))
 
 
 def claim_task_stage(task_id, stage):
@@ -114,15 +437,96 @@ def release_task_stage(task_id, stage):
         current_set.discard(task_id)
 
 
+def get_dir_task_limit(config):
+    try:
+        return max(1, int(config.get('dir_task_concurrency', 2) or 1))
+    except:
+        return 1
+
+
+def dispatch_directory_uploads(task_id, ready_files, failed_files, limit):
+    # 目录任务检测通过的文件各自作为 (task_id, path) 上传单元进入 upload_queue，由上传池按 concurrency_upload 执行；
+    # 同一任务在途 (含排队) 的单元不超过 limit，完成一个再补一个
+    queued = []
+    with task_state_lock:
+        units = dir_upload_units.setdefault(task_id, {})
+        for path in ready_files:
+            if len(units) >= limit:
+                break
+            if path in units or path in failed_files:
+                continue
+            units[path] = {'core': None, 'fraction': 0.0}
+            queued.append(path)
+        if not units:
+            dir_upload_units.pop(task_id, None)
+    for path in queued:
+        upload_queue.put((task_id, path))
+    return len(queued)
+
+
+def count_directory_uploads(task_id):
+    with task_state_lock:
+        return len(dir_upload_units.get(task_id) or {})
+
+
+def get_directory_upload_fraction(task_id):
+    with task_state_lock:
+        return sum(unit['fraction'] for unit in (dir_upload_units.get(task_id) or {}).values())
+
+
+def stop_directory_uploads(task_id):
+    # 撤销排队中的单元并停止在途上传；出队时找不到登记的单元即直接丢弃
+    with task_state_lock:
+        units = dir_upload_units.pop(task_id, None) or {}
+    for unit in units.values():
+        if unit['core']:
+            unit['core'].stop()
+
+
+def stop_running_task(task_id):
+    core = running_tasks.get(task_id)
+    if core:
+        core.stop()
+    stop_directory_uploads(task_id)
+
+
 def clear_running_task(task_id, core):
     with task_state_lock:
         if running_tasks.get(task_id) is core:
             del running_tasks[task_id]
 
 
+def apply_task_progress(task, entry):
+    task.progress = entry['progress']
+    if entry['stage'] == 'upload':
+        task.upload_speed = entry['upload_speed']
+        task.upload_eta = entry['upload_eta']
+
+
+def report_task_progress(task_id, stage, progress, speed=None, eta=None):
+    entry = progress_registry.update(task_id, stage, progress, speed, eta)
+    if not entry:
+        return
+    try:
+        t = Task.query.get(task_id)
+        if t:
+            apply_task_progress(t, entry)
+            safe_db_commit(f"{stage} progress {task_id}")
+    except Exception as e:
+        safe_db_rollback(f"{stage} progress {task_id}")
+        print(f"⚠️ 保存任务进度失败[{task_id}]: {e}")
+
+
+def settle_task_progress(task_id, task):
+    # 阶段结束时丢弃内存进度；成功路径已显式写入最终进度，失败/取消则把最后的内存进度落到任务上
+    entry = progress_registry.pop(task_id)
+    if entry and task is not None and task.status in ('error', 'cancelled'):
+        apply_task_progress(task, entry)
+
+
 def get_active_task_ids():
     with task_state_lock:
-        return set(running_tasks.keys()) | set(active_detect_tasks) | set(active_upload_tasks)
+        return set(running_tasks.keys()) | set(active_detect_tasks) | set(active_upload_tasks) | set(dir_upload_units.keys())
 
 
 def safe_db_rollback(context="db"):
@@ -142,6 +546,152 @@ def safe_db_commit(context="db"):
         return False
 
 
+@event.listens_for(Session, 'after_flush')
+def collect_task_changes(session, flush_context):
+    pending = session.info.setdefault('task_changes', {'changed': set(), 'deleted': set()})
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Task) and obj.id is not None:
+            pending['changed'].add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Task) and obj.id is not None:
+            pending['deleted'].add(obj.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_task_changes(session):
+    # 提交成功后才推进版本，避免客户端在提交前拿到新版本号却读到旧数据
+    pending = session.info.pop('task_changes', None)
+    if pending:
+        task_changes.mark(pending['changed'] - pending['deleted'])
+        task_changes.mark(pending['deleted'], deleted=True)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_task_changes(session):
+    session.info.pop('task_changes', None)
+
+
+TASK_LOG_FLUSH_INTERVAL = 1.0
+TASK_LOG_FLUSH_BATCH = 500
+task_log_buffer = []
+task_log_lock = threading.Lock()
+# 串行化整个落库过程：后台线程和 worker 的 finally 可能同时 flush，否则行 id 会交错、失败回填会乱序
+task_log_flush_lock = threading.Lock()
+task_log_wakeup = threading.Event()
+
+
+def append_task_log(task_id, text):
+    # 只进内存缓冲，由后台线程按间隔批量 INSERT；阶段结束时调用 flush_task_logs 立即落库
+    if not task_id or not text:
+        return
+    with task_log_lock:
+        task_log_buffer.append((task_id, text, datetime.now()))
+        if len(task_log_buffer) >= TASK_LOG_FLUSH_BATCH:
+            task_log_wakeup.set()
+
+
+def flush_task_logs(context="task log"):
+    # 用独立 Session 写入：调用方 (worker) 的 db.session 里可能有未完成的修改，不能被日志落库顺带提交
+    with task_log_flush_lock:
+        with task_log_lock:
+            pending = task_log_buffer[:]
+            task_log_buffer.clear()
+        if not pending:
+            return True
+        try:
+            with Session(db.engine) as session:
+                rows = [
+                    TaskLogLine(task_id=task_id, content=text, created_at=created_at,
+                                upload_marker=any(marker in text for marker in UPLOAD_LOG_MARKERS))
+                    for task_id, text, created_at in pending
+                ]
+                session.add_all(rows)
+                session.flush()
+                line_ids = [row.id for row in rows]
+                session.commit()
+        except Exception as e:
+            with task_log_lock:
+                task_log_buffer[:0] = pending
+            print(f"⚠️ 写入任务日志失败[{context}]: {e}")
+            return False
+        task_changes.mark({task_id for task_id, _, _ in pending})
+        if event_bus.has_subscribers():
+            # 每次落库只推一个事件，按任务分组；逐行推送会很快塞满订阅队列，触发 reset 整页重载
+            lines = {}
+            for line_id, (task_id, text, _) in zip(line_ids, pending):
+                lines.setdefault(task_id, []).append({'line_id': line_id, 'text': text})
+            event_bus.publish('task_log', {'tasks': lines})
+        return True
+
+
+def task_log_flush_worker():
+    while True:
+        task_log_wakeup.wait(TASK_LOG_FLUSH_INTERVAL)
+        task_log_wakeup.clear()
+        with app.app_context():
+            flush_task_logs("task log flush")
+
+
+def delete_task_logs(task_ids):
+    task_ids = set(task_ids)
+    if not task_ids:
+        return
+    with task_log_lock:
+        task_log_buffer[:] = [entry for entry in task_log_buffer if entry[0] not in task_ids]
+    TaskLogLine.query.filter(TaskLogLine.task_id.in_(task_ids)).delete(synchronize_session=False)
+
+
+TASK_LOG_TAIL_LINES = 8
+SAMPLE_PLAN_MARKER = '动态抽样开启'
+
+
+def get_task_log_tails(tasks, lines=TASK_LOG_TAIL_LINES):
+    # 列表只带每个任务最后几行日志；追加行不够时再从 Task.log (首行/旧数据) 末尾补齐。
+    # 整页一次查询：按 task_id 分区倒序编号，只取每个任务的前 lines 行
+    rows_by_task = {t.id: [] for t in tasks}
+    if tasks:
+        ranked = db.session.query(
+            TaskLogLine.task_id, TaskLogLine.id, TaskLogLine.content,
+            func.row_number().over(partition_by=TaskLogLine.task_id, order_by=TaskLogLine.id.desc()).label('rank')
+        ).filter(TaskLogLine.task_id.in_(list(rows_by_task))).subquery()
+        for task_id, content in db.session.query(ranked.c.task_id, ranked.c.content).filter(
+                ranked.c.rank <= lines).order_by(ranked.c.task_id, ranked.c.id):
+            rows_by_task[task_id].append(content)
+    tails = {}
+    for t in tasks:
+        rows = rows_by_task[t.id]
+        kept = [line for line in ''.join(content or '' for content in rows).split('\n') if line.strip()]
+        if len(kept) < lines and len(rows) < lines:
+            kept = [line for line in (t.log or '').split('\n') if line.strip()] + kept
+        tails[t.id] = '\n'.join(kept[-lines:])
+    return tails
+
+
+def get_task_sample_plans(tasks):
+    # 前端画抽样进度点需要“动态抽样开启”那一行，单独取出来，列表里就不必带整段日志
+    plans = {}
+    for t in tasks:
+        for line in (t.log or '').split('\n'):
+            if SAMPLE_PLAN_MARKER in line:
+                plans[t.id] = line.strip()
+    if tasks:
+        rows = db.session.query(TaskLogLine.task_id, TaskLogLine.content).filter(
+            TaskLogLine.task_id.in_([t.id for t in tasks]),
+            TaskLogLine.content.like(f"%{SAMPLE_PLAN_MARKER}%")).order_by(TaskLogLine.id).all()
+        for task_id, content in rows:
+            for line in (content or '').split('\n'):
+                if SAMPLE_PLAN_MARKER in line:
+                    plans[task_id] = line.strip()
+    return plans
+
+
+def get_upload_marked_task_ids(task_ids=None):
+    query = db.session.query(TaskLogLine.task_id).filter(TaskLogLine.upload_marker.is_(True))
+    if task_ids is not None:
+        query = query.filter(TaskLogLine.task_id.in_(list(task_ids)))
+    return {row[0] for row in query.distinct().all()}
+
+
 def check_ip_ban(ip):
     now = datetime.now()
     if ip in LOGIN_ATTEMPTS:
@@ -183,6 +733,31 @@ SUB_META_BLACKLIST_INIT = ["http", "www", "weixin", "Telegram", "TG@", "TG频道
                             "Mandarin", "HDSky", "HDsky", "Feibanyama", "==無雙==", "Cxuan", "HiveWeb", "禁止转载"]
 
 
+def bump_keywords_version():
+    with keywords_config_lock:
+        keywords_config_cache['version'] += 1
+        keywords_config_cache['data'] = None
+    clear_keyword_matchers()
+
+
+def get_keywords_config():
+    # 关键词集按版本缓存，只有 /api/keywords、/api/keyword/<id>、备份恢复和初始化会让版本失效
+    with keywords_config_lock:
+        version = keywords_config_cache['version']
+        if keywords_config_cache['data'] is not None and keywords_config_cache['loaded'] == version:
+            return keywords_config_cache['data']
+    grouped = {'audio': [], 'subtitle': [], 'meta': []}
+    for k in Keyword.query.filter_by(enabled=True).order_by(Keyword.id.asc()).all():
+        if k.type in grouped:
+            grouped[k.type].append(k.content)
+    data = {kw_type: tuple(items) for kw_type, items in grouped.items()}
+    with keywords_config_lock:
+        if keywords_config_cache['version'] == version:
+            keywords_config_cache['data'] = data
+            keywords_config_cache['loaded'] = version
+    return data
+
+
 def seed_default_keywords():
     try:
         for kw in AUDIO_BLACKLIST_INIT:
@@ -195,15 +770,17 @@ def seed_default_keywords():
             if not Keyword.query.filter_by(type='meta', content=kw).first(): db.session.add(
                 Keyword(type='meta', content=kw, enabled=True))
         db.session.commit()
+        bump_keywords_version()
     except:
         pass
 
 
-def get_final_config(overrides_json=None):
+def load_base_config():
     final_conf = {
         "check_audio": True, "check_subtitles": True, "sanitize_metadata": True, "enable_cloud_asr": True,
         "cloud_asr_proxy_enabled": False,
         "enable_local_model": False, "detailed_mode": False, "asr_use_flac": False, "audio_double_sample": False,
+        "enable_audio_vad": True,
         "tg_bot_token": "", "tg_chat_id": "",
         "audio_threshold_multi": 600, "audio_threshold_long": 3600,
         "audio_len_head": 240, "audio_len_mid": 240, "audio_len_tail": 300, "audio_len_tail_long": 600,
@@ -221,20 +798,23 @@ def get_final_config(overrides_json=None):
         "cleanup_detect_dirty": True, "cleanup_detect_error": True, "cleanup_detect_cancelled": True,
         "cleanup_upload_uploaded": True, "cleanup_upload_error": True, "cleanup_upload_cancelled": True,
         "cleanup_aria2_completed": True,
-        "concurrency_detect": 2, "concurrency_upload": 9, "detect_retry_limit": 3,
-        "local_model_concurrency": 2
+        "concurrency_detect": 2, "concurrency_upload": 9, "dir_task_concurrency": 2, "detect_retry_limit": 3,
+        "detect_schedule_policy": "sjf", "admission_max_load_pct": 150, "admission_min_mem_mb": 1024,
+        "admission_max_disk_util": 90, "admission_min_free_gb": 5, "admission_max_wait": 1800,
+        "local_model_concurrency": 2, "asr_transcript_cache_mb": 64, "memory_trim_watermark_mb": 1024
     }
     db_configs = {c.key: c.value for c in Config.query.all()}
     for k, v in db_configs.items():
         if k in ["download_proxy", "cleanup_upload_dirty"]:
             continue
-        if k in ["check_audio", "check_subtitles", "sanitize_metadata", "enable_cloud_asr", "cloud_asr_proxy_enabled", "enable_local_model", "detailed_mode", "asr_use_flac", "audio_double_sample", "upload_remote_hijack_enabled",
+        if k in ["check_audio", "check_subtitles", "sanitize_metadata", "enable_cloud_asr", "cloud_asr_proxy_enabled", "enable_local_model", "detailed_mode", "asr_use_flac", "audio_double_sample", "enable_audio_vad", "upload_remote_hijack_enabled",
                    "notify_upload_success", "notify_errors", "cleanup_scanner_history", "cleanup_scanner_uploaded", "cleanup_scanner_dirty", "cleanup_scanner_error", "cleanup_scanner_cancelled",
                    "cleanup_detect_dirty", "cleanup_detect_error", "cleanup_detect_cancelled", "cleanup_upload_uploaded", "cleanup_upload_error", "cleanup_upload_cancelled", "cleanup_aria2_completed"]:
             final_conf[k] = (str(v).lower() == 'true')
         elif k in ["audio_threshold_multi", "audio_threshold_long", "audio_len_head", "audio_len_mid", "audio_len_tail",
-                   "audio_len_tail_long", "audio_segment_len", "audio_max_segments", "cloud_asr_max_duration", "cloud_asr_concurrency", "cloud_asr_upload_timeout", "cloud_asr_read_timeout", "cloud_asr_long_read_timeout", "concurrency_detect", "concurrency_upload", "detect_retry_limit",
-                   "local_model_concurrency"]:
+                   "audio_len_tail_long", "audio_segment_len", "audio_max_segments", "cloud_asr_max_duration", "cloud_asr_concurrency", "cloud_asr_upload_timeout", "cloud_asr_read_timeout", "cloud_asr_long_read_timeout", "concurrency_detect", "concurrency_upload", "dir_task_concurrency", "detect_retry_limit",
+                   "local_model_concurrency", "asr_transcript_cache_mb", "memory_trim_watermark_mb", "admission_max_load_pct",
+                   "admission_min_mem_mb", "admission_max_disk_util", "admission_min_free_gb", "admission_max_wait"]:
             try:
                 final_conf[k] = int(v)
             except:
@@ -262,6 +842,11 @@ def get_final_config(overrides_json=None):
                 legacy_cleanup_enabled = str(db_configs[legacy_key]).lower() == 'true'
                 for key in target_keys:
                     final_conf[key] = legacy_cleanup_enabled
+    return final_conf
+
+
+def merge_config_overrides(base_conf, overrides_json):
+    final_conf = dict(base_conf)
     if overrides_json:
         try:
             ov = json.loads(overrides_json)
@@ -278,11 +863,46 @@ def get_final_config(overrides_json=None):
                         final_conf[k] = v
         except:
             pass
-    return final_conf
+    return MappingProxyType(final_conf)
+
+
+def bump_config_version():
+    with config_snapshot_lock:
+        config_snapshot_cache['version'] += 1
+        config_snapshot_cache['data'] = None
+        config_snapshot_cache['merged'] = {}
+
+
+def get_config_snapshot(overrides_json=None):
+    # 全局配置按版本缓存成只读快照，只有 /api/settings、备份恢复和远端劫持开关会让版本失效；
+    # 任务级合并结果按 overrides 原文记忆，同样的覆盖项不再重复解析
+    with config_snapshot_lock:
+        version = config_snapshot_cache['version']
+        base = config_snapshot_cache['data'] if config_snapshot_cache['loaded'] == version else None
+        if base is not None:
+            merged = config_snapshot_cache['merged'].get(overrides_json or '')
+            if merged is not None:
+                return merged
+    if base is None:
+        base = MappingProxyType(load_base_config())
+    merged = base if not overrides_json else merge_config_overrides(base, overrides_json)
+    with config_snapshot_lock:
+        if config_snapshot_cache['version'] == version:
+            config_snapshot_cache['data'] = base
+            config_snapshot_cache['loaded'] = version
+            if len(config_snapshot_cache['merged']) >= CONFIG_MERGE_CACHE_SIZE:
+                config_snapshot_cache['merged'] = {}
+            config_snapshot_cache['merged'][overrides_json or ''] = merged
+    return merged
+
+
+def get_final_config(overrides_json=None):
+    # 返回可修改的副本，调用方可以在上面追加临时字段
+    return dict(get_config_snapshot(overrides_json))
 
 
 def get_runtime_cloud_asr_config(overrides_json=None):
-    conf = get_final_config(overrides_json)
+    conf = get_config_snapshot(overrides_json)
     return {
         'cloud_asr_proxy_enabled': conf.get('cloud_asr_proxy_enabled', False),
         'cloud_asr_proxy': conf.get('cloud_asr_proxy', '')
@@ -358,7 +978,7 @@ UPLOAD_LOG_MARKERS = (
 )
 
 
-def is_upload_task(task, overrides=None):
+def is_upload_task(task, overrides=None, upload_marked=None):
     ov = overrides if overrides is not None else get_task_overrides(task)
     if task.status in ['pending_upload', 'uploading', 'uploaded']:
         return True
@@ -374,6 +994,10 @@ def is_upload_task(task, overrides=None):
         log = task.log or ''
         if any(marker in log for marker in UPLOAD_LOG_MARKERS):
             return True
+        if upload_marked is None:
+            upload_marked = get_upload_marked_task_ids([task.id])
+        if task.id in upload_marked:
+            return True
     return False
 
 
@@ -387,7 +1011,7 @@ def apply_upload_remote_hijack(task, source):
         return False
     overrides['upload_remote'] = remote
     set_task_overrides(task, overrides)
-    task.log = (task.log or '') + f"\n=== 远端劫持: {remote}: ({source}) ===\n"
+    append_task_log(task.id, f"\n=== 远端劫持: {remote}: ({source}) ===\n")
     return True
 
 
@@ -565,6 +1189,24 @@ def call_aria2_rpc(method, params):
     return payload['result']
 
 
+def aria2_owns_file(path):
+    # 文件是否仍被 aria2 持有 (下载中/做种/排队/暂停)：旁边有 .aria2 控制文件，或出现在活动/等待任务的文件列表里。
+    # RPC 连不上说明 aria2 没在跑，只凭控制文件判断
+    path = os.path.abspath(path)
+    if os.path.exists(path + '.aria2'):
+        return True
+    try:
+        items = list(call_aria2_rpc('aria2.tellActive', [['files']]) or [])
+        items += list(call_aria2_rpc('aria2.tellWaiting', [0, 1000, ['files']]) or [])
+    except RuntimeError:
+        return False
+    for item in items:
+        for entry in (item.get('files') or []) if isinstance(item, dict) else []:
+            if isinstance(entry, dict) and entry.get('path') and os.path.abspath(entry['path']) == path:
+                return True
+    return False
+
+
 def remove_aria2_download_results(gids):
     if not gids:
         return 0, 0
@@ -640,7 +1282,9 @@ def get_next_persistent_id():
     if next_id > 9999: next_id = 1
     existing = Task.query.get(next_id)
     if existing:
-        if next_id in running_tasks: running_tasks[next_id].stop(); del running_tasks[next_id]
+        stop_running_task(next_id)
+        running_tasks.pop(next_id, None)
+        delete_task_logs([next_id])
         db.session.delete(existing);
         db.session.commit()
     c.value = str(next_id);
@@ -649,7 +1293,7 @@ def get_next_persistent_id():
     return next_id
 
 
-def create_trigger_task(path, file_count=1, upload_remote='', aria_gid='', source=''):
+def create_trigger_task(path, file_count=1, upload_remote='', aria_gid='', source='', schedule_class='aria2'):
     if not path or not os.path.exists(path):
         return None, False
 
@@ -674,15 +1318,13 @@ def create_trigger_task(path, file_count=1, upload_remote='', aria_gid='', sourc
         }
     if upload_remote:
         task_overrides['upload_remote'] = upload_remote
-    if aria_gid:
-        task_overrides['_aria_gid'] = str(aria_gid)
+    task_overrides['_detect_class'] = schedule_class
 
     # Aria2 may complete several files in the same second. Reserve the custom
     # task ID and commit the task as one critical section to prevent collisions.
     with trigger_task_lock:
         if aria_gid:
-            gid_marker = f'"_aria_gid": "{aria_gid}"'
-            existing = Task.query.filter(Task.overrides.like(f'%{gid_marker}%')).first()
+            existing = Task.query.filter(Task.aria_gid == str(aria_gid)).first()
             if existing:
                 return existing, False
 
@@ -699,11 +1341,12 @@ def create_trigger_task(path, file_count=1, upload_remote='', aria_gid='', sourc
             filepath=task_path,
             status='pending',
             log=f"=== {source} ===\n" if source else '',
-            overrides=json.dumps(task_overrides) if task_overrides else None
+            overrides=json.dumps(task_overrides) if task_overrides else None,
+            aria_gid=str(aria_gid) if aria_gid else None
         )
         db.session.add(task)
         db.session.commit()
-        detect_queue.put(task.id)
+        enqueue_detect_task(task.id)
         return task, True
 
 
@@ -749,13 +1392,33 @@ def reconcile_orphan_downloads():
             if covered:
                 continue
 
-            task, created = create_trigger_task(path, source='补偿扫描：发现未入队的已完成文件')
+            task, created = create_trigger_task(path, source='补偿扫描：发现未入队的已完成文件', schedule_class='orphan')
             if created:
                 known_tasks.append((normalized_path, False))
                 queued += 1
     return queued
 
 
+def detect_cost_worker():
+    # 补算排队任务的检测耗时 (含 ffprobe)，写回 _detect_cost 并调整其在检测队列里的位置
+    while True:
+        task_id = detect_cost_queue.get()
+        try:
+            with app.app_context():
+                task = Task.query.get(task_id)
+                if not task or task.status != 'pending':
+                    continue
+                ov = get_task_overrides(task)
+                if ov.get('_detect_cost') is not None:
+                    continue
+                cost = estimate_detect_cost(task.filepath, ov.get('_dir_total_files', 1))
+                update_task_overrides(task, {'_detect_cost': cost})
+                if safe_db_commit(f"detect cost {task_id}"):
+                    detect_queue.reprioritize(task_id, cost)
+        except Exception as e:
+            print(f"⚠️ 预估检测耗时失败[{task_id}]: {e}")
+
+
 def orphan_reconcile_worker():
     while True:
         time.sleep(300)
@@ -768,14 +1431,317 @@ def orphan_reconcile_worker():
             print(f"⚠️ 补偿扫描失败: {e}")
 
 
+def finish_directory_task(core, task, final_settings, dest_remote, db_logger):
+    task.status = 'uploaded';
+    task.progress = 100;
+    task.upload_eta = "完成";
+    task.finished_at = datetime.now();
+    db_logger("✅ 目录任务上传完成")
+    if os.path.isdir(task.filepath):
+        shutil.rmtree(task.filepath, ignore_errors=True)
+    if final_settings.get('notify_upload_success', False): send_task_tg_msg(
+        core, final_settings, task, f"🎉 上传成功: {task.filename}\n☁️ 节点: {dest_remote}"
+    )
+
+
+def get_directory_ready_files(overrides):
+    return [p for p in (overrides.get('_dir_ready') or []) if isinstance(p, str) and os.path.exists(p)]
+
+
+def get_fresh_task(task_id):
+    # 目录任务会被检测线程和多个上传单元同时改写 overrides，持 dir_task_lock 时先按库里最新值刷新再改
+    task = Task.query.get(task_id)
+    if task:
+        db.session.refresh(task)
+    return task
+
+
+def get_directory_progress(task_id, ov, detect_fraction=0.0):
+    # 已上传计 1，检测通过计 0.5，检测中 / 上传中的文件按各自进度折算
+    total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
+    done_count = (int(ov.get('_dir_uploaded_count', 0) or 0) + 0.5 * len(ov.get('_dir_ready') or [])
+                  + 0.5 * get_directory_upload_fraction(task_id) + detect_fraction)
+    return int(min(99, (done_count / total_files) * 100))
+
+
+def settle_directory_task(core, task, final_settings, db_logger):
+    # 目录任务检测已结束时调用 (需持 dir_task_lock)：仍有待传文件就继续派发上传单元，
+    # 全部落定后收尾 —— 全部完成 / 有文件上传失败 / 目录里还有未检测的文件则重新排队检测
+    ov = get_task_overrides(task)
+    ready_files = get_directory_ready_files(ov)
+    failed_files = set(ov.get('_dir_upload_failed') or [])
+    upload_files = [p for p in ready_files if p not in failed_files]
+    if upload_files or count_directory_uploads(task.id):
+        apply_upload_remote_hijack(task, '检测通过入队')
+        task.status = 'uploading'
+        task.progress = get_directory_progress(task.id, ov)
+        update_task_overrides(task, {'_dir_stage': 'upload'}, remove_keys=['_current_item'])
+        if safe_db_commit(f"dir upload wait {task.id}"):
+            dispatch_directory_uploads(task.id, upload_files, failed_files, get_dir_task_limit(final_settings))
+        return
+    progress_registry.pop(task.id)
+    task.upload_speed = ""
+    task.upload_eta = "-"
+    if ready_files:
+        task.status = 'error'
+        task.finished_at = datetime.now()
+        db_logger(f"❌ {len(ready_files)} 个文件上传失败")
+        if final_settings.get('notify_errors', True): send_task_tg_msg(
+            core, final_settings, task, f"❌ 上传失败: {task.filename}"
+        )
+        safe_db_commit(f"dir upload failed {task.id}")
+    elif not list_directory_task_files(task.filepath):
+        dest_remote = str(ov.get('upload_remote') or '').strip() or final_settings.get('rclone_remote', 's25')
+        finish_directory_task(core, task, final_settings, dest_remote, db_logger)
+        safe_db_commit(f"dir finish {task.id}")
+    else:
+        task.status = 'pending'
+        task.progress = get_directory_progress(task.id, ov)
+        db_logger("🔁 目录中仍有未处理文件，继续排队")
+        if safe_db_commit(f"dir continue {task.id}"):
+            enqueue_detect_task(task.id)
+
+
+def run_directory_upload_unit(task_id, path):
+    # 目录任务单个文件的上传单元，与本任务的检测及其他文件的上传并行；
+    # 结束后在 dir_task_lock 内累加 _dir_uploaded_count，检测已结束且是最后一个在途单元时负责收尾
+    with task_state_lock:
+        unit = (dir_upload_units.get(task_id) or {}).get(path)
+    if unit is None:
+        return
+    core = None
+    ok = False
+    task = get_fresh_task(task_id)
+    try:
+        if task and task.status in ('processing', 'uploading') and os.path.exists(path):
+            final_settings = get_final_config(task.overrides)
+            scan_path = final_settings.get('scan_path', '/root/downloads')
+            rclone_remote = final_settings.get('rclone_remote', 's25')
+            current_root_name = os.path.basename(scan_path.rstrip('/'))
+            upload_remote = str(get_task_overrides(task).get('upload_remote') or '').strip()
+            dest_remote, remote_path = build_directory_remote_path(task.filepath, path, current_root_name,
+                                                                    rclone_remote, remote_override=upload_remote)
+            name = os.path.relpath(path, task.filepath)
+            core = ScannerCore(logger_callback=lambda msg: append_task_log(task_id, f"[⬆️ {name}] {msg}\n"),
+                               task_id=task_id, root_dir_name=current_root_name, rclone_remote=rclone_remote)
+
+            def upload_prog(pct, speed, eta):
+                unit['fraction'] = pct / 100.0
+                with task_state_lock:
+                    detecting = task_id in active_detect_tasks
+                if not detecting:
+                    t = Task.query.get(task_id)
+                    if t:
+                        report_task_progress(task_id, 'upload', get_directory_progress(task_id, get_task_overrides(t)), speed, eta)
+
+            core.prog_cb = upload_prog
+            with task_state_lock:
+                registered = (dir_upload_units.get(task_id) or {}).get(path) is unit
+                if registered:
+                    unit['core'] = core
+            if registered:
+                ok = core.upload_with_progress(path, remote_path=remote_path)
+    except Exception as e:
+        safe_db_rollback(f"dir upload unit {task_id}")
+        append_task_log(task_id, f"上传异常 [{os.path.basename(path)}]: {e}\n")
+    finally:
+        with dir_task_lock:
+            with task_state_lock:
+                units = dir_upload_units.get(task_id) or {}
+                if units.get(path) is unit:
+                    units.pop(path)
+                if not units:
+                    dir_upload_units.pop(task_id, None)
+            complete_directory_upload_unit(task_id, path, core, ok)
+        flush_task_logs(f"dir upload unit {task_id}")
+
+
+def complete_directory_upload_unit(task_id, path, core, ok):
+    def db_logger(msg):
+        append_task_log(task_id, f"{msg}\n")
+
+    task = get_fresh_task(task_id)
+    if not task:
+        return
+    final_settings = get_final_config(task.overrides)
+    if core is None:
+        # 单元未真正开始 (任务已不在检测/上传中或文件已不存在)；若它是最后一个在途单元仍需收尾
+        if task.status == 'uploading':
+            settle_directory_task(ScannerCore(logger_callback=db_logger, task_id=task_id), task, final_settings, db_logger)
+        return
+    ov = get_task_overrides(task)
+    total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
+    if ok:
+        core.cleanup_empty_dirs(path)
+        ov = update_task_overrides(task, {
+            '_dir_uploaded_count': int(ov.get('_dir_uploaded_count', 0) or 0) + 1,
+            '_dir_ready': [p for p in (ov.get('_dir_ready') or []) if p != path]
+        })
+        db_logger(f"✅ 文件上传成功 ({ov['_dir_uploaded_count']}/{total_files}): {os.path.relpath(path, task.filepath)}")
+    elif core._stopped or task.status not in ('processing', 'uploading'):
+        db_logger(f"⏹ 上传已停止: {os.path.basename(path)}")
+        return
+    else:
+        failed_files = [p for p in (ov.get('_dir_upload_failed') or []) if p != path] + [path]
+        ov = update_task_overrides(task, {'_dir_upload_failed': failed_files})
+        db_logger(f"❌ 上传失败: {os.path.relpath(path, task.filepath)}")
+    if task.status == 'uploading':
+        settle_directory_task(core, task, final_settings, db_logger)
+        return
+    if safe_db_commit(f"dir upload unit done {task_id}") and task.status == 'processing':
+        dispatch_directory_uploads(task_id, get_directory_ready_files(ov), set(ov.get('_dir_upload_failed') or []),
+                                   get_dir_task_limit(final_settings))
+
+
+def run_directory_task_files(task_id, core, files, final_settings, keywords_config, db_logger, limit):
+    # 目录任务按文件拆成子作业并发检测，子线程只产出事件，数据库读写全部在本 worker 线程里处理。
+    # 通过的文件记入 _dir_ready 并立即作为独立上传单元交给上传池，与其余文件的检测并行；
+    # 首个命中即停止其余子作业和本任务在途的上传；检测失败则等在途作业结束后交回重试逻辑。
+    # 返回 {"status": "done" | "dirty" | "error" | "cancelled", ...}
+    task = Task.query.get(task_id)
+    task_root = task.filepath
+    checkpoints = get_task_overrides(task).get('_dir_passed') or {}
+    events = queue.Queue()
+    children = {}
+    fractions = {}
+    pending = list(files)
+    futures = {}
+    outcome = None
+
+    def run_file(job_no, path, passed_segments):
+        child = core.spawn_child_core(lambda msg: events.put(('log', job_no, msg)))
+        children[job_no] = child
+        if outcome is not None and outcome['status'] == 'dirty':
+            child.stop()
+        try:
+            child.prog_cb = lambda pct, msg, _: events.put(('progress', job_no, pct / 200.0))
+            res = child.process_file(
+                path, dict(final_settings), keywords_config,
+                passed_segments=passed_segments,
+                checkpoint_cb=lambda seg_name, status='passed', reason=None: events.put(('checkpoint', job_no, (path, seg_name, status))),
+                rename_cb=lambda new_path: events.put(('rename', job_no, (path, new_path)))
+            )
+            if res['status'] == 'ready_to_upload':
+                return {'status': 'passed', 'path': res.get('new_filepath') or path}
+            res['path'] = path
+            return res
+        finally:
+            core._unregister_child_core(child)
+
+    def handle_event(kind, job_no, payload):
+        nonlocal checkpoints
+        if kind == 'log':
+            db_logger(f"[#{job_no}] {payload}")
+        elif kind == 'progress':
+            if job_no in fractions:
+                fractions[job_no] = payload
+        elif kind in ('checkpoint', 'rename'):
+            with dir_task_lock:
+                t = get_fresh_task(task_id)
+                if not t:
+                    return
+                ov = get_task_overrides(t)
+                checkpoints = ov.get('_dir_passed') or {}
+                if kind == 'checkpoint':
+                    path, seg_name, status = payload
+                    passed = [name for name in checkpoints.get(path, []) if name != seg_name]
+                    if status == 'passed':
+                        passed.append(seg_name)
+                    checkpoints[path] = passed
+                else:
+                    old_path, new_path = payload
+                    if old_path in checkpoints:
+                        checkpoints[new_path] = checkpoints.pop(old_path)
+                    append_task_log(task_id, f"🔄 [#{job_no}] 文件已更新为: {os.path.basename(new_path)}\n")
+                update_task_overrides(t, {'_dir_passed': checkpoints})
+                safe_db_commit(f"detect dir event {task_id}")
+
+    def drain_events():
+        while True:
+            try:
+                handle_event(*events.get_nowait())
+            except queue.Empty:
+                break
+
+    def update_progress(ov):
+        report_task_progress(task_id, 'detect', get_directory_progress(task_id, ov, sum(fractions.values())))
+
+    db_logger(f"🧵 目录任务并行处理: 待处理 {len(files)} 个文件，并发 {limit}")
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=limit)
+    job_no = 0
+    try:
+        while pending or futures:
+            while pending and len(futures) < limit and outcome is None and not core._stopped:
+                path = pending.pop(0)
+                job_no += 1
+                fractions[job_no] = 0.0
+                db_logger(f"▶️ [#{job_no}] 开始处理: {os.path.relpath(path, task_root)}")
+                futures[executor.submit(run_file, job_no, path, list(checkpoints.get(path, [])))] = job_no
+            if not futures:
+                break
+            done, _ = concurrent.futures.wait(futures.keys(), timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED)
+            drain_events()
+            for future in done:
+                done_no = futures.pop(future)
+                fractions.pop(done_no, None)
+                try:
+                    res = future.result()
+                except Exception as e:
+                    res = {'status': 'error', 'msg': str(e)}
+                status = res['status']
+                if status == 'passed':
+                    with dir_task_lock:
+                        t = get_fresh_task(task_id)
+                        ov = get_task_overrides(t)
+                        checkpoints = ov.get('_dir_passed') or {}
+                        checkpoints.pop(res['path'], None)
+                        ready_files = [p for p in (ov.get('_dir_ready') or []) if p != res['path']] + [res['path']]
+                        ov = update_task_overrides(t, {'_dir_ready': ready_files, '_dir_passed': checkpoints})
+                        apply_upload_remote_hijack(t, '检测通过入队')
+                        committed = safe_db_commit(f"detect dir passed {task_id}")
+                    if committed and outcome is None and not core._stopped:
+                        db_logger(f"✅ [#{done_no}] 文件检测通过，加入上传队列: {os.path.relpath(res['path'], task_root)}")
+                        dispatch_directory_uploads(task_id, get_directory_ready_files(ov),
+                                                   set(ov.get('_dir_upload_failed') or []), limit)
+                elif outcome is None and status != 'cancelled':
+                    outcome = res
+                    if status == 'dirty':
+                        # 命中即整任务拦截，其余在途子作业和本任务在途的上传立即停止
+                        for other_no, child in list(children.items()):
+                            if other_no != done_no:
+                                child.stop()
+                        stop_directory_uploads(task_id)
+                    else:
+                        db_logger(f"⚠️ [#{done_no}] 处理失败，等待在途文件结束: {res.get('msg', '')}")
+            if core._stopped:
+                for future in futures:
+                    future.cancel()
+            t = Task.query.get(task_id)
+            update_progress(get_task_overrides(t) if t else {})
+    finally:
+        executor.shutdown(wait=True)
+        drain_events()
+
+    if core._stopped:
+        return {'status': 'cancelled'}
+    if outcome is not None:
+        return outcome
+    return {'status': 'done'}
+
+
 # ----------------- Worker Functions -----------------
 def detection_worker():
     with app.app_context():
         seed_default_keywords()
         while True:
             task_id = None
+            if detect_pool.retire_requested():
+                return
             try:
-                task_id = detect_queue.get()
+                try:
+                    task_id = detect_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
                 if not claim_task_stage(task_id, 'detect'):
                     detect_queue.task_done()
                     continue
@@ -790,7 +1756,7 @@ def detection_worker():
                     release_task_stage(task_id, 'detect')
                     detect_queue.task_done()
                     time.sleep(1)
-                    enqueue_detect_task(task_id, priority=True)
+                    detect_queue.put_front(task_id)
                     print(f"⚠️ 检测启动状态保存失败，已重新入队: {task_id}")
                     continue
 
@@ -822,28 +1788,35 @@ def detection_worker():
                     with app.app_context():
                         return get_runtime_cloud_asr_config(runtime_overrides_json)
 
-                audio_kws = [k.content for k in Keyword.query.filter_by(type='audio', enabled=True).all()]
-                sub_kws = [k.content for k in Keyword.query.filter_by(type='subtitle', enabled=True).all()]
-                meta_kws = [k.content for k in Keyword.query.filter_by(type='meta', enabled=True).all()]
-                keywords_config = {'audio': audio_kws, 'subtitle': sub_kws, 'meta': meta_kws}
+                keywords_config = get_keywords_config()
 
                 def db_logger(msg):
-                    try:
-                        t = Task.query.get(task_id)
-                        if t:
-                            t.log = (t.log or "") + f"{msg}\n"
-                            safe_db_commit(f"detect log {task_id}")
-                    except Exception as e:
-                        safe_db_rollback(f"detect log {task_id}")
-                        print(f"⚠️ 写入检测日志失败[{task_id}]: {e}")
+                    append_task_log(task_id, f"{msg}\n")
 
                 task_overrides = get_task_overrides(task)
                 dir_task = is_directory_task(task, task_overrides)
                 current_process_path = task.filepath
                 passed_segments = []
+                parallel_files = None
 
                 if dir_task:
-                    remaining_files = list_directory_task_files(task.filepath)
+                    dir_limit = get_dir_task_limit(final_settings)
+                    ready_files = get_directory_ready_files(task_overrides)
+                    remaining_files = [p for p in list_directory_task_files(task.filepath) if p not in ready_files]
+                    if task_overrides.get('_dir_upload_failed'):
+                        # 重新检测即视为重试，上次上传失败的文件重新派发
+                        with dir_task_lock:
+                            task = get_fresh_task(task_id)
+                            task_overrides = update_task_overrides(task, remove_keys=['_dir_upload_failed'])
+                            safe_db_commit(f"detect dir retry uploads {task_id}")
+                    if not remaining_files and ready_files:
+                        with dir_task_lock:
+                            task = get_fresh_task(task_id)
+                            settle_directory_task(ScannerCore(logger_callback=db_logger, task_id=task_id),
+                                                  task, final_settings, db_logger)
+                        release_task_stage(task_id, 'detect')
+                        detect_queue.task_done()
+                        continue
                     if not remaining_files:
                         total_files = max(1, int(task_overrides.get('_dir_total_files', 1) or 1))
                         uploaded_count = int(task_overrides.get('_dir_uploaded_count', 0) or 0)
@@ -856,8 +1829,23 @@ def detection_worker():
                         detect_queue.task_done()
                         continue
 
+                    if ready_files:
+                        # 上次运行已通过但尚未上传的文件，与本次检测并行上传
+                        dispatch_directory_uploads(task_id, ready_files, set(), dir_limit)
                     current_process_path = remaining_files[0]
-                    if task_overrides.get('_current_item') != current_process_path or task_overrides.get('_dir_stage') != 'detect':
+                    if dir_limit > 1 and len(remaining_files) > 1:
+                        parallel_files = remaining_files
+                        if task_overrides.get('_current_item') or task_overrides.get('_dir_stage') != 'detect':
+                            # 串行阶段留下的单文件断点并入按文件记录的 _dir_passed
+                            dir_passed = task_overrides.get('_dir_passed') or {}
+                            if task_overrides.get('_passed_file') and task_overrides.get('_passed'):
+                                dir_passed[task_overrides['_passed_file']] = task_overrides['_passed']
+                            task_overrides = update_task_overrides(
+                                task, {'_dir_stage': 'detect', '_dir_passed': dir_passed},
+                                remove_keys=['_current_item', '_passed', '_passed_file', '_audio_segments', '_audio_segments_file']
+                            )
+                            safe_db_commit(f"detect dir parallel {task_id}")
+                    elif task_overrides.get('_current_item') != current_process_path or task_overrides.get('_dir_stage') != 'detect':
                         task_overrides = update_task_overrides(
                             task,
                             {'_current_item': current_process_path, '_dir_stage': 'detect'},
@@ -866,6 +1854,9 @@ def detection_worker():
                         safe_db_commit(f"detect dir current {task_id}")
                     if task_overrides.get('_passed_file') == current_process_path:
                         passed_segments = task_overrides.get('_passed', [])
+                    dir_passed = (task_overrides.get('_dir_passed') or {}).get(current_process_path)
+                    if dir_passed:
+                        passed_segments = sorted(set(passed_segments) | set(dir_passed))
                     if task_overrides.get('_audio_segments_file') == current_process_path:
                         states = task_overrides.get('_audio_segments', {})
                         if isinstance(states, dict):
@@ -877,22 +1868,13 @@ def detection_worker():
                         if isinstance(states, dict):
                             passed_segments = sorted(set(passed_segments) | {name for name, state in states.items() if isinstance(state, dict) and state.get('status') == 'passed'})
 
+                dir_total_files = max(1, int(task_overrides.get('_dir_total_files', 1) or 1))
+                dir_uploaded_count = int(task_overrides.get('_dir_uploaded_count', 0) or 0)
+
                 def detect_prog(pct, msg, _):
-                    try:
-                        t = Task.query.get(task_id)
-                        if not t:
-                            return
-                        if dir_task:
-                            ov = get_task_overrides(t)
-                            total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
-                            uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
-                            t.progress = int(min(99, ((uploaded_count + (pct / 100.0) * 0.5) / total_files) * 100))
-                        else:
-                            t.progress = pct
-                        safe_db_commit(f"detect progress {task_id}")
-                    except Exception as e:
-                        safe_db_rollback(f"detect progress {task_id}")
-                        print(f"⚠️ 更新检测进度失败[{task_id}]: {e}")
+                    if dir_task:
+                        pct = int(min(99, ((dir_uploaded_count + (pct / 100.0) * 0.5) / dir_total_files) * 100))
+                    report_task_progress(task_id, 'detect', pct)
 
                 def save_checkpoint(seg_name, status='passed', reason=None):
                     try:
@@ -944,7 +1926,7 @@ def detection_worker():
                             if ov.get('_audio_segments_file') and ov.get('_audio_segments_file') != new_path:
                                 ov['_audio_segments_file'] = new_path
                             set_task_overrides(t, ov)
-                            t.log = (t.log or "") + f"🔄 当前文件已更新为: {os.path.basename(new_path)}\n"
+                            append_task_log(task_id, f"🔄 当前文件已更新为: {os.path.basename(new_path)}\n")
                         elif t.filepath != new_path:
                             t.filepath = new_path
                             t.filename = os.path.basename(new_path)
@@ -954,7 +1936,7 @@ def detection_worker():
                             if ov.get('_audio_segments_file') and ov.get('_audio_segments_file') != new_path:
                                 ov['_audio_segments_file'] = new_path
                             set_task_overrides(t, ov)
-                            t.log = (t.log or "") + f"🔄 文件已更新为: {t.filename}\n"
+                            append_task_log(task_id, f"🔄 文件已更新为: {t.filename}\n")
                         safe_db_commit(f"detect filepath {task_id}")
                     except Exception as e:
                         safe_db_rollback(f"detect filepath {task_id}")
@@ -963,52 +1945,73 @@ def detection_worker():
                 core = ScannerCore(logger_callback=db_logger, task_id=task_id, root_dir_name=current_root_name,
                                    rclone_remote=rclone_remote, config_refresh_callback=refresh_cloud_config)
                 core.prog_cb = detect_prog
+                core.hint_cb = lambda text: progress_registry.set_hint(task_id, text)
+                core.file_in_use_cb = aria2_owns_file
                 with task_state_lock:
                     running_tasks[task_id] = core
 
                 try:
-                    res = core.process_file(
-                        current_process_path, final_settings, keywords_config,
-                        passed_segments=passed_segments,
-                        checkpoint_cb=save_checkpoint,
-                        rename_cb=update_filepath
-                    )
+                    if parallel_files:
+                        res = run_directory_task_files(task_id, core, parallel_files, final_settings, keywords_config,
+                                                       db_logger, dir_limit)
+                        current_process_path = res.get('path') or current_process_path
+                    else:
+                        res = core.process_file(
+                            current_process_path, final_settings, keywords_config,
+                            passed_segments=passed_segments,
+                            checkpoint_cb=save_checkpoint,
+                            rename_cb=update_filepath
+                        )
 
                     if res['status'] == 'cancelled':
                         task.status = 'cancelled'
                         task.finished_at = datetime.now()
                         db_logger("⏹ 任务已手动停止")
                     elif res['status'] == 'dirty':
-                        task.status = 'dirty';
-                        task.finished_at = datetime.now()
                         if dir_task:
-                            update_task_overrides(task, remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file'])
+                            stop_directory_uploads(task_id)
+                            with dir_task_lock:
+                                task = get_fresh_task(task_id)
+                                update_task_overrides(task, remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file', '_dir_passed', '_dir_ready', '_dir_upload_failed'])
+                                task.status = 'dirty';
+                                task.finished_at = datetime.now()
+                                safe_db_commit(f"detect dir dirty {task_id}")
                             db_logger(f"🚫 命中文件: {os.path.basename(current_process_path)}")
-                        elif os.path.exists(task.filepath):
-                            os.remove(task.filepath)
+                        else:
+                            task.status = 'dirty';
+                            task.finished_at = datetime.now()
+                            if os.path.exists(task.filepath):
+                                os.remove(task.filepath)
                         if final_settings.get('notify_errors', True): send_task_tg_msg(
                             core, final_settings, task, f"🚫 拦截: {task.filename}\n原因: {res['msg']}"
                         )
                     elif res['status'] == 'ready_to_upload':
-                        if dir_task:
-                            current_upload_path = res.get('new_filepath') or get_task_overrides(task).get('_current_item') or current_process_path
-                            update_task_overrides(task, {'_current_item': current_upload_path, '_dir_stage': 'upload'}, remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file'])
-                        elif res.get('new_filepath'):
-                            task.filepath = res['new_filepath'];
-                            task.filename = os.path.basename(res['new_filepath'])
-                        task.status = 'pending_upload';
-                        apply_upload_remote_hijack(task, '检测通过入队')
-                        if dir_task:
-                            ov = get_task_overrides(task)
-                            total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
-                            uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
-                            task.progress = int(min(99, ((uploaded_count + 0.5) / total_files) * 100))
-                            db_logger(f"✅ 文件检测通过，加入上传队列: {os.path.basename(current_upload_path)}")
-                        else:
-                            task.progress = 0
-                            db_logger("✅ 检测通过，加入上传队列")
-                        if safe_db_commit(f"detect ready upload {task_id}"):
-                            upload_queue.put(task_id)
+                        with dir_task_lock:
+                            if dir_task:
+                                task = get_fresh_task(task_id)
+                                current_upload_path = res.get('new_filepath') or get_task_overrides(task).get('_current_item') or current_process_path
+                                update_task_overrides(task, {'_current_item': current_upload_path, '_dir_stage': 'upload'}, remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file'])
+                            elif res.get('new_filepath'):
+                                task.filepath = res['new_filepath'];
+                                task.filename = os.path.basename(res['new_filepath'])
+                            task.status = 'pending_upload';
+                            apply_upload_remote_hijack(task, '检测通过入队')
+                            if dir_task:
+                                ov = get_task_overrides(task)
+                                total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
+                                uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
+                                task.progress = int(min(99, ((uploaded_count + 0.5) / total_files) * 100))
+                                db_logger(f"✅ 文件检测通过，加入上传队列: {os.path.basename(current_upload_path)}")
+                            else:
+                                task.progress = 0
+                                db_logger("✅ 检测通过，加入上传队列")
+                            if safe_db_commit(f"detect ready upload {task_id}"):
+                                upload_queue.put(task_id)
+                    elif res['status'] == 'done':
+                        # 检测已全部结束：还有在途上传则转为 uploading，由最后一个上传单元收尾
+                        with dir_task_lock:
+                            task = get_fresh_task(task_id)
+                            settle_directory_task(core, task, final_settings, db_logger)
                     else:
                         err_msg = str(res.get('msg', ''))
                         if task.retry_count < RETRY_LIMIT and '云端 API 已停用且本地模型未启用' not in err_msg:
@@ -1016,7 +2019,7 @@ def detection_worker():
                             task.status = 'pending'
                             db_logger(f"⚠️ 云端异常/超时 -> 重新排队 (尝试 {task.retry_count}/{RETRY_LIMIT})")
                             if safe_db_commit(f"detect retry {task_id}"):
-                                enqueue_detect_task(task_id, priority=True)
+                                enqueue_detect_task(task_id, source='retry')
                         else:
                             task.status = 'error';
                             task.finished_at = datetime.now();
@@ -1035,7 +2038,7 @@ def detection_worker():
                         task.status = 'pending'
                         db_logger(f"⚠️ 异常 -> 重新排队 (尝试 {task.retry_count}/{RETRY_LIMIT})\nErr: {str(e)}")
                         if safe_db_commit(f"detect exception retry {task_id}"):
-                            enqueue_detect_task(task_id, priority=True)
+                            enqueue_detect_task(task_id, source='retry')
                     else:
                         task.status = 'error';
                         task.finished_at = datetime.now();
@@ -1046,7 +2049,9 @@ def detection_worker():
                 finally:
                     clear_running_task(task_id, core)
                     release_task_stage(task_id, 'detect')
+                    settle_task_progress(task_id, task)
                     safe_db_commit(f"detect finally {task_id}");
+                    flush_task_logs(f"detect finally {task_id}")
                     detect_queue.task_done()
             except Exception as e:
                 safe_db_rollback("detect worker")
@@ -1063,8 +2068,22 @@ def upload_worker():
     with app.app_context():
         while True:
             task_id = None
+            if upload_pool.retire_requested():
+                return
             try:
-                task_id = upload_queue.get()
+                try:
+                    task_id = upload_queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                if isinstance(task_id, tuple):
+                    # 目录任务的单文件上传单元，不占任务级的 upload 阶段，与检测并行
+                    unit_task_id, unit_path = task_id
+                    task_id = None
+                    try:
+                        run_directory_upload_unit(unit_task_id, unit_path)
+                    finally:
+                        upload_queue.task_done()
+                    continue
                 if not claim_task_stage(task_id, 'upload'):
                     upload_queue.task_done()
                     continue
@@ -1090,6 +2109,17 @@ def upload_worker():
                 dir_task = is_directory_task(task, task_overrides)
                 current_upload_path = task_overrides.get('_current_item') if dir_task else task.filepath
 
+                if dir_task and get_directory_ready_files(task_overrides) and not task_overrides.get('_current_item'):
+                    # 并行检测留下的已通过文件 (重启恢复 / 人工重传)：重新拆成单文件上传单元
+                    with dir_task_lock:
+                        task = get_fresh_task(task_id)
+                        update_task_overrides(task, remove_keys=['_dir_upload_failed'])
+                        settle_directory_task(ScannerCore(logger_callback=lambda msg: append_task_log(task_id, f"{msg}\n"), task_id=task_id),
+                                              task, final_settings, lambda msg: append_task_log(task_id, f"{msg}\n"))
+                    release_task_stage(task_id, 'upload')
+                    upload_queue.task_done()
+                    continue
+
                 if dir_task and (not current_upload_path or not os.path.exists(current_upload_path)):
                     remaining_files = list_directory_task_files(task.filepath)
                     if remaining_files:
@@ -1100,7 +2130,7 @@ def upload_worker():
                 if dir_task and not current_upload_path:
                     task.status = 'error'
                     task.finished_at = datetime.now()
-                    task.log = (task.log or "") + "❌ 上传失败：目录任务未找到待上传文件\n"
+                    append_task_log(task_id, "❌ 上传失败：目录任务未找到待上传文件\n")
                     safe_db_commit(f"upload missing file {task_id}")
                     release_task_stage(task_id, 'upload')
                     upload_queue.task_done()
@@ -1117,31 +2147,15 @@ def upload_worker():
                     remote_path = f"{dest_remote}:{os.path.basename(current_upload_path)}" if upload_remote else None
 
                 def db_logger(msg):
-                    try:
-                        t = Task.query.get(task_id)
-                        if t:
-                            t.log = (t.log or "") + f"{msg}\n"
-                            safe_db_commit(f"upload log {task_id}")
-                    except Exception as e:
-                        safe_db_rollback(f"upload log {task_id}")
-                        print(f"⚠️ 写入上传日志失败[{task_id}]: {e}")
+                    append_task_log(task_id, f"{msg}\n")
+
+                dir_total_files = max(1, int(task_overrides.get('_dir_total_files', 1) or 1))
+                dir_uploaded_count = int(task_overrides.get('_dir_uploaded_count', 0) or 0)
 
                 def upload_prog(pct, speed, eta):
-                    try:
-                        t = Task.query.get(task_id)
-                        if not t:
-                            return
-                        if dir_task:
-                            ov = get_task_overrides(t)
-                            total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
-                            uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
-                            t.progress = int(min(99, ((uploaded_count + 0.5 + (pct / 100.0) * 0.5) / total_files) * 100))
-                        else:
-                            t.progress = pct
-                        t.upload_speed = speed; t.upload_eta = eta; safe_db_commit(f"upload progress {task_id}")
-                    except Exception as e:
-                        safe_db_rollback(f"upload progress {task_id}")
-                        print(f"⚠️ 更新上传进度失败[{task_id}]: {e}")
+                    if dir_task:
+                        pct = int(min(99, ((dir_uploaded_count + 0.5 + (pct / 100.0) * 0.5) / dir_total_files) * 100))
+                    report_task_progress(task_id, 'upload', pct, speed, eta)
 
                 core = ScannerCore(logger_callback=db_logger, task_id=task_id, root_dir_name=current_root_name,
                                    rclone_remote=rclone_remote)
@@ -1152,37 +2166,32 @@ def upload_worker():
                     if core.upload_with_progress(current_upload_path, remote_path=remote_path):
                         if dir_task:
                             core.cleanup_empty_dirs(current_upload_path)
-                            ov = update_task_overrides(
-                                task,
-                                {
-                                    '_dir_uploaded_count': int(get_task_overrides(task).get('_dir_uploaded_count', 0) or 0) + 1,
-                                    '_dir_stage': 'detect'
-                                },
-                                remove_keys=['_current_item', '_passed', '_passed_file', '_audio_segments', '_audio_segments_file']
-                            )
-                            total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
-                            uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
-                            remaining_files = list_directory_task_files(task.filepath)
-                            task.upload_speed = ""
-                            if not remaining_files:
-                                task.status = 'uploaded';
-                                task.progress = 100;
-                                task.upload_eta = "完成";
-                                task.finished_at = datetime.now();
-                                db_logger("✅ 目录任务上传完成")
-                                if os.path.isdir(task.filepath):
-                                    shutil.rmtree(task.filepath, ignore_errors=True)
-                                if final_settings.get('notify_upload_success', False): send_task_tg_msg(
-                                    core, final_settings, task, f"🎉 上传成功: {task.filename}\n☁️ 节点: {dest_remote}"
+                            with dir_task_lock:
+                                task = get_fresh_task(task_id)
+                                ov = get_task_overrides(task)
+                                ov = update_task_overrides(
+                                    task,
+                                    {
+                                        '_dir_uploaded_count': int(ov.get('_dir_uploaded_count', 0) or 0) + 1,
+                                        '_dir_stage': 'detect'
+                                    },
+                                    remove_keys=['_current_item', '_passed', '_passed_file', '_audio_segments', '_audio_segments_file']
                                 )
-                            else:
-                                task.status = 'pending'
-                                task.progress = int(min(99, (uploaded_count / total_files) * 100))
-                                task.upload_eta = "-"
-                                task.finished_at = None
-                                db_logger(f"✅ 文件上传成功 ({uploaded_count}/{total_files})，继续处理下一文件")
-                                if safe_db_commit(f"upload continue dir {task_id}"):
-                                    detect_queue.put(task_id)
+                                total_files = max(1, int(ov.get('_dir_total_files', 1) or 1))
+                                uploaded_count = int(ov.get('_dir_uploaded_count', 0) or 0)
+                                remaining_files = list_directory_task_files(task.filepath)
+                                task.upload_speed = ""
+                                if not remaining_files:
+                                    finish_directory_task(core, task, final_settings, dest_remote, db_logger)
+                                    safe_db_commit(f"upload dir finish {task_id}")
+                                else:
+                                    task.status = 'pending'
+                                    task.progress = int(min(99, (uploaded_count / total_files) * 100))
+                                    task.upload_eta = "-"
+                                    task.finished_at = None
+                                    db_logger(f"✅ 文件上传成功 ({uploaded_count}/{total_files})，继续处理下一文件")
+                                    if safe_db_commit(f"upload continue dir {task_id}"):
+                                        enqueue_detect_task(task_id)
                         else:
                             task.status = 'uploaded';
                             task.progress = 100;
@@ -1221,7 +2230,9 @@ def upload_worker():
                 finally:
                     clear_running_task(task_id, core)
                     release_task_stage(task_id, 'upload')
+                    settle_task_progress(task_id, task)
                     safe_db_commit(f"upload finally {task_id}")
+                    flush_task_logs(f"upload finally {task_id}")
                     upload_queue.task_done()
             except Exception as e:
                 safe_db_rollback("upload worker")
@@ -1234,6 +2245,37 @@ def upload_worker():
                 print(e)
 
 
+detect_pool = WorkerPool('detect', detection_worker)
+upload_pool = WorkerPool('upload', upload_worker)
+
+
+def apply_worker_pool_sizes(config=None):
+    c = config or get_final_config(None)
+    try:
+        n_d = max(1, int(c.get('concurrency_detect', 2)))
+    except:
+        n_d = 2
+    try:
+        n_u = max(1, int(c.get('concurrency_upload', 9)))
+    except:
+        n_u = 9
+    return detect_pool.resize(n_d), upload_pool.resize(n_u)
+
+
+WORKER_STATUS_QUEUE_HEAD = 10
+
+
+def get_worker_pool_status():
+    with task_state_lock:
+        busy_detect = len(active_detect_tasks)
+        busy_upload = len(active_upload_tasks)
+    return {
+        'detect': dict(detect_pool.status(), busy=busy_detect, queued=detect_queue.qsize(),
+                       head=detect_queue.snapshot(WORKER_STATUS_QUEUE_HEAD)),
+        'upload': dict(upload_pool.status(), busy=busy_upload, queued=upload_queue.qsize())
+    }
+
+
 # ----------------- Model & System Routes -----------------
 def check_local_models_exist():
     return sensevoice_gguf_ready(os.getcwd())
@@ -1506,7 +2548,7 @@ def aria_ng(filename='index.html'):
 
 
 def get_scanner_api_token():
-    token = get_final_config(None).get('api_token', '8pUoqOTHhEAhRnacl3c19')
+    token = get_config_snapshot().get('api_token', '8pUoqOTHhEAhRnacl3c19')
     token_path = os.path.join(APP_ROOT, '.token_secret')
     if os.path.exists(token_path):
         try:
@@ -1562,37 +2604,152 @@ def trigger():
     return jsonify({"code": 200, "task_id": task.id, "duplicate": not created})
 
 
+TASK_PAGE_DEFAULT = 200
+TASK_PAGE_MAX = 1000
+TASK_DELTA_CHUNK = 500
+TASK_SUMMARY_CONFIG_KEYS = ('check_audio', 'check_subtitles', 'sanitize_metadata', 'audio_double_sample',
+                            'audio_max_segments', 'direct_upload', '_audio_segments')
+
+
+def task_sort_key(t):
+    # 任务 id 会在 9999 后回绕，列表顺序和翻页游标统一用 (created_at, id)，编码成可直接按字符串比较的键
+    return f"{t.created_at.strftime('%Y%m%d%H%M%S%f')}-{t.id:010d}"
+
+
+def task_before_cursor(cursor):
+    created_part, _, id_part = cursor.partition('-')
+    created_at = datetime.strptime(created_part, '%Y%m%d%H%M%S%f')
+    tid = int(id_part)
+    return or_(Task.created_at < created_at, and_(Task.created_at == created_at, Task.id < tid))
+
+
+def build_task_summaries(tasks, upload_marked=None):
+    # 列表摘要：只带最后几行日志、抽样计划行和前端画状态点用到的几项配置
+    if upload_marked is None:
+        upload_marked = get_upload_marked_task_ids([t.id for t in tasks]) if tasks else set()
+    tails = get_task_log_tails(tasks)
+    plans = get_task_sample_plans(tasks)
+    live = progress_registry.snapshot()
+    hints = progress_registry.get_hints()
+    res = []
+    for t in tasks:
+        final_config = get_config_snapshot(t.overrides)
+        entry = live.get(t.id)
+        res.append({"id": t.id, "sort_key": task_sort_key(t), "filename": t.filename, "status": t.status,
+                    "queue": 'upload' if is_upload_task(t, upload_marked=upload_marked) else 'detect',
+                    "log_tail": tails.get(t.id, ''), "sample_plan": plans.get(t.id, ''),
+                    "created_at": t.created_at.strftime("%m-%d %H:%M"),
+                    "finished_at": t.finished_at.strftime("%H:%M:%S") if t.finished_at else "-",
+                    "progress": entry['progress'] if entry else t.progress,
+                    "upload_speed": entry['upload_speed'] if entry and entry['stage'] == 'upload' else t.upload_speed,
+                    "upload_eta": entry['upload_eta'] if entry and entry['stage'] == 'upload' else t.upload_eta,
+                    "stage": entry['stage'] if entry else '',
+                    "hint": hints.get(t.id, ''),
+                    "upload_target": get_task_upload_target(t, final_config),
+                    "config": {k: final_config[k] for k in TASK_SUMMARY_CONFIG_KEYS if k in final_config}})
+    return res
+
+
+def load_task_changes(since):
+    # 返回 (当前版本, 变化任务的摘要, 已删除的 id)；since 太旧无法增量时后两项为 None
+    version, changed, deleted = task_changes.since(since)
+    if changed is None:
+        return version, None, None
+    tasks = []
+    for i in range(0, len(changed), TASK_DELTA_CHUNK):
+        tasks.extend(Task.query.filter(Task.id.in_(changed[i:i + TASK_DELTA_CHUNK])).all())
+    tasks.sort(key=task_sort_key, reverse=True)
+    found = {t.id for t in tasks}
+    return version, build_task_summaries(tasks), set(deleted) | (set(changed) - found)
+
+
 @app.route('/api/tasks')
 @login_required
 def get_tasks():
-    # UI 需要同时展示“检测队列/上传队列”，并且两边都最多展示 N 条。
-    # 这里用与 batch 操作、前端同样的规则来判断任务属于上传还是检测。
-    LIMIT_EACH = 9999
-    SCAN_LIMIT = LIMIT_EACH * 2
-
-    scan = Task.query.order_by(Task.id.desc()).limit(SCAN_LIMIT).all()
-    detect_sel = []
-    upload_sel = []
-
-    for t in scan:
-        if is_upload_task(t):
-            if len(upload_sel) < LIMIT_EACH:
-                upload_sel.append(t)
-        else:
-            if len(detect_sel) < LIMIT_EACH:
-                detect_sel.append(t)
-        if len(detect_sel) >= LIMIT_EACH and len(upload_sel) >= LIMIT_EACH:
+    # 分页摘要：?queue=detect|upload &status=a,b &cursor=<上一页 next_cursor> &limit=N，按 (created_at, id) 倒序。
+    # ?since=<version> 只返回该版本之后变化的任务和已删除/移出筛选的 id；无法增量时 full=true，前端需从第一页重载
+    queue_filter = request.args.get('queue') or ''
+    statuses = [x for x in (request.args.get('status') or '').split(',') if x]
+    try:
+        limit = max(1, min(TASK_PAGE_MAX, int(request.args.get('limit') or TASK_PAGE_DEFAULT)))
+        cursor = task_before_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        since = int(request.args['since']) if request.args.get('since') else None
+    except ValueError:
+        return jsonify({"code": 400, "msg": "参数无效"}), 400
+
+    def matches(summary):
+        return (not queue_filter or summary['queue'] == queue_filter) and (not statuses or summary['status'] in statuses)
+
+    if since is not None:
+        version, summaries, removed = load_task_changes(since)
+        if summaries is not None:
+            removed |= {s['id'] for s in summaries if not matches(s)}
+            return jsonify({"code": 200, "version": version, "full": False,
+                            "tasks": [s for s in summaries if matches(s)], "deleted": sorted(removed),
+                            "next_cursor": None})
+
+    version = task_changes.current()
+    base = Task.query.filter(Task.status.in_(statuses)) if statuses else Task.query
+    upload_marked = get_upload_marked_task_ids() if queue_filter else None
+    selected = []
+    last_cond = cursor
+    while len(selected) < limit:
+        batch_query = base.filter(last_cond) if last_cond is not None else base
+        batch = batch_query.order_by(Task.created_at.desc(), Task.id.desc()).limit(limit).all()
+        for t in batch:
+            last_cond = task_before_cursor(task_sort_key(t))
+            if queue_filter and ('upload' if is_upload_task(t, upload_marked=upload_marked) else 'detect') != queue_filter:
+                continue
+            selected.append(t)
+            if len(selected) >= limit:
+                break
+        if len(batch) < limit:
             break
+    next_cursor = None
+    if len(selected) >= limit and base.filter(task_before_cursor(task_sort_key(selected[-1]))).first() is not None:
+        next_cursor = task_sort_key(selected[-1])
+    return jsonify({"code": 200, "version": version, "full": True, "tasks": build_task_summaries(selected, upload_marked),
+                    "deleted": [], "next_cursor": next_cursor})
 
-    res = []
-    for t in (detect_sel + upload_sel):
-        final_config = get_final_config(t.overrides)
-        res.append({"id": t.id, "filename": t.filename, "status": t.status, "log": t.log,
-                    "created_at": t.created_at.strftime("%m-%d %H:%M"),
-                    "finished_at": t.finished_at.strftime("%H:%M:%S") if t.finished_at else "-", "progress": t.progress,
-                    "upload_speed": t.upload_speed, "upload_eta": t.upload_eta,
-                    "upload_target": get_task_upload_target(t, final_config), "config": final_config})
-    return jsonify(res)
+
+@app.route('/api/task/<int:tid>')
+@login_required
+def get_task_detail(tid):
+    # 单个任务摘要 + 完整生效配置，供“调整”弹窗使用
+    t = Task.query.get(tid)
+    if not t: return jsonify({"code": 404, "msg": "任务不存在"}), 404
+    summary = build_task_summaries([t])[0]
+    summary['config'] = get_final_config(t.overrides)
+    return jsonify({"code": 200, "task": summary})
+
+
+@app.route('/api/task/<int:tid>/log')
+@login_required
+def get_task_log(tid):
+    # ?tail=N 取最后 N 行；?after=<行 id>&limit=N 取该行之后的一段，便于前端增量追加
+    t = Task.query.get(tid)
+    if not t: return jsonify({"code": 404, "msg": "任务不存在"}), 404
+    try:
+        limit = max(1, min(5000, int(request.args.get('limit') or request.args.get('tail') or 500)))
+        after = request.args.get('after')
+        after = int(after) if after not in (None, '') else None
+    except ValueError:
+        return jsonify({"code": 400, "msg": "参数无效"}), 400
+
+    query = TaskLogLine.query.filter(TaskLogLine.task_id == tid)
+    if after is not None:
+        rows = query.filter(TaskLogLine.id > after).order_by(TaskLogLine.id).limit(limit).all()
+        has_more = query.filter(TaskLogLine.id > (rows[-1].id if rows else after)).first() is not None
+    else:
+        rows = list(reversed(query.order_by(TaskLogLine.id.desc()).limit(limit).all()))
+        has_more = bool(rows) and query.filter(TaskLogLine.id < rows[0].id).first() is not None
+    return jsonify({"code": 200, "id": t.id,
+                    "head": (t.log or '') if after is None and not has_more else '',
+                    "lines": [{"id": row.id, "text": row.content or '',
+                               "time": row.created_at.strftime("%m-%d %H:%M:%S") if row.created_at else ''}
+                              for row in rows],
+                    "last_id": rows[-1].id if rows else (after or 0),
+                    "has_more": has_more})
 
 
 @app.route('/api/tasks/batch', methods=['POST'])
@@ -1615,12 +2772,12 @@ def batch_tasks():
             if action == 'retry' and t.status in ['error', 'cancelled', 'dirty'] and not is_up:
                 t.status = 'pending';
                 t.retry_count = 0;
-                t.log += "\n=== 批量重试 (检测) ===\n";
+                append_task_log(t.id, "\n=== 批量重试 (检测) ===\n")
                 detect_ids.append(t.id);
                 count += 1
 
             elif action == 'stop' and t.status in ['pending', 'processing']:
-                if t.id in running_tasks: running_tasks[t.id].stop()
+                stop_running_task(t.id)
                 t.status = 'cancelled';
                 t.finished_at = datetime.now();
                 count += 1
@@ -1629,13 +2786,13 @@ def batch_tasks():
             if action == 'retry' and t.status in ['error', 'cancelled'] and is_up:
                 t.status = 'pending_upload';
                 t.retry_count = 0;
-                t.log += "\n=== 批量重传 ===\n";
+                append_task_log(t.id, "\n=== 批量重传 ===\n")
                 apply_upload_remote_hijack(t, '批量上传重试')
                 upload_ids.append(t.id);
                 count += 1
             elif action == 'stop' and t.status in ['pending_upload', 'uploading']:
-                if t.id in running_tasks: running_tasks[t.id].stop()
-                t.log = (t.log or '') + "\n⏹ 上传已停止\n"
+                stop_running_task(t.id)
+                append_task_log(t.id, "\n⏹ 上传已停止\n")
                 t.status = 'cancelled';
                 t.finished_at = datetime.now();
                 count += 1
@@ -1673,6 +2830,7 @@ def upload_remote_hijack():
         config.value = value
         db.session.add(config)
     db.session.commit()
+    bump_config_version()
     state = f'已开启，目标 {remote}:' if enabled else '已关闭'
     return jsonify({'code': 200, 'msg': f'远端劫持{state}'})
 
@@ -1694,10 +2852,10 @@ def batch_upload_remote():
         ov['upload_remote'] = remote
         set_task_overrides(task, ov)
         if task.status == 'uploading':
-            task.log = (task.log or '') + f"\n=== 一次性修改 remote: {remote}: (上传中，下次重试生效) ===\n"
+            append_task_log(task.id, f"\n=== 一次性修改 remote: {remote}: (上传中，下次重试生效) ===\n")
             active_count += 1
         else:
-            task.log = (task.log or '') + f"\n=== 一次性修改 remote: {remote}: ===\n"
+            append_task_log(task.id, f"\n=== 一次性修改 remote: {remote}: ===\n")
         count += 1
 
     db.session.commit()
@@ -1726,7 +2884,7 @@ def retry(tid):
         is_up = True
     else:
         is_up = is_upload_task(t, ov)
-    t.log += "\n=== 人工重试 ===\n";
+    append_task_log(t.id, "\n=== 人工重试 ===\n")
     t.finished_at = None;
     t.retry_count = 0
     if is_up:
@@ -1751,8 +2909,8 @@ def direct_upload(tid):
     t = Task.query.get(tid);
     if t:
         update_task_overrides(t, {'direct_upload': True})
-        t.status = 'pending'; t.log += "\n=== 直传 ===\n"; t.finished_at = None; t.retry_count = 0; db.session.commit(); detect_queue.put(
-            t.id)
+        t.status = 'pending'; append_task_log(t.id, "\n=== 直传 ===\n"); t.finished_at = None; t.retry_count = 0; db.session.commit(); enqueue_detect_task(
+            t.id, priority=True)
     return jsonify({"code": 200})
 
 
@@ -1768,10 +2926,10 @@ def double_sample_task(tid):
     update_task_overrides(
         t,
         {'check_audio': True, 'audio_double_sample': True},
-        remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file']
+        remove_keys=['_passed', '_passed_file', '_audio_segments', '_audio_segments_file', '_dir_passed', '_dir_ready']
     )
     t.status = 'pending'
-    t.log += "\n=== 单任务动态抽样 ===\n"
+    append_task_log(t.id, "\n=== 单任务动态抽样 ===\n")
     t.finished_at = None
     t.retry_count = 0
     db.session.commit()
@@ -1785,7 +2943,7 @@ def save_and_retry(tid):
     t = Task.query.get(tid);
     if t:
         replace_public_task_overrides(t, request.json or {})
-        t.status = 'pending'; t.log += "\n=== 调整重试 ===\n"; t.finished_at = None; t.retry_count = 0; db.session.commit(); enqueue_detect_task(
+        t.status = 'pending'; append_task_log(t.id, "\n=== 调整重试 ===\n"); t.finished_at = None; t.retry_count = 0; db.session.commit(); enqueue_detect_task(
             t.id, priority=True)
     return jsonify({"code": 200})
 
@@ -1831,15 +2989,14 @@ def delete_task_file(tid):
     t = Task.query.get(tid);
     if not t: return jsonify({"code": 404})
     if tid in get_active_task_ids():
-        core = running_tasks.get(tid)
-        if core:
-            core.stop()
+        stop_running_task(tid)
         t.status = 'cancelled'
         t.finished_at = datetime.now()
         safe_db_commit(f"defer delete active task {tid}")
         return jsonify({"code": 409, "msg": "任务仍在运行，已发送停止指令；请稍后再删除记录"})
 
     deleted = remove_task_files(t)
+    delete_task_logs([t.id])
     db.session.delete(t);
     db.session.commit()
     msg = f"任务及文件已删除 ({', '.join(deleted)})" if deleted else "任务记录已删除 (未找到文件)"
@@ -1862,17 +3019,16 @@ def batch_delete_tasks():
 
     for task in selected_tasks:
         if task.id in active_ids:
-            core = running_tasks.get(task.id)
-            if core:
-                core.stop()
+            stop_running_task(task.id)
             if is_upload_task(task):
-                task.log = (task.log or '') + "\n⏹ 上传已停止\n"
+                append_task_log(task.id, "\n⏹ 上传已停止\n")
             task.status = 'cancelled'
             task.finished_at = datetime.now()
             stopped_count += 1
             continue
 
         deleted_files += len(remove_task_files(task))
+        delete_task_logs([task.id])
         db.session.delete(task)
         deleted_count += 1
 
@@ -1888,7 +3044,7 @@ def batch_delete_tasks():
 @app.route('/api/cancel/<int:tid>', methods=['POST'])
 @login_required
 def cancel(tid):
-    if tid in running_tasks: running_tasks[tid].stop()
+    stop_running_task(tid)
     t = Task.query.get(tid);
     if t: t.status = 'cancelled'; t.finished_at = datetime.now(); db.session.commit()
     return jsonify({"code": 200})
@@ -1901,7 +3057,7 @@ def settings():
         data = dict(request.json or {})
         normalize_cloud_api_key_config(data)
         for k, v in data.items():
-            if k in ["check_audio", "check_subtitles", "sanitize_metadata", "enable_cloud_asr", "cloud_asr_proxy_enabled", "enable_local_model", "detailed_mode", "asr_use_flac", "audio_double_sample",
+            if k in ["check_audio", "check_subtitles", "sanitize_metadata", "enable_cloud_asr", "cloud_asr_proxy_enabled", "enable_local_model", "detailed_mode", "asr_use_flac", "audio_double_sample", "enable_audio_vad",
                       "notify_upload_success", "notify_errors", "cleanup_scanner_history", "cleanup_scanner_uploaded", "cleanup_scanner_dirty", "cleanup_scanner_error", "cleanup_scanner_cancelled",
                       "cleanup_detect_dirty", "cleanup_detect_error", "cleanup_detect_cancelled", "cleanup_upload_uploaded", "cleanup_upload_error", "cleanup_upload_cancelled", "cleanup_aria2_completed"]:
                 val = "true" if (v is True or str(v).lower() == 'true') else "false"
@@ -1911,6 +3067,7 @@ def settings():
             c.value = val;
             db.session.add(c)
         db.session.commit()
+        bump_config_version()
         if 'api_token' in data:
             tk = str(data['api_token']).strip()
             if re.match(r'^[a-zA-Z0-9_\-]+$', tk):
@@ -1918,6 +3075,8 @@ def settings():
                     open(os.path.join(os.path.dirname(__file__), '.token_secret'), 'w').write(tk)
                 except:
                     pass
+        if ('concurrency_detect' in data or 'concurrency_upload' in data) and detect_pool.desired:
+            apply_worker_pool_sizes()
         return jsonify({"code": 200})
     c = get_final_config(None);
     c['model_exists'] = check_local_models_exist();
@@ -1981,6 +3140,9 @@ def restore_settings_backup():
             db.session.add(Keyword(type=kw_type, content=content, enabled=(enabled is True or str(enabled).lower() == 'true')))
 
     db.session.commit()
+    bump_config_version()
+    if isinstance(keywords, list):
+        bump_keywords_version()
     token = configs.get('api_token') if isinstance(configs, dict) else None
     if token:
         tk = str(token).strip()
@@ -1989,10 +3151,28 @@ def restore_settings_backup():
                 open(os.path.join(os.path.dirname(__file__), '.token_secret'), 'w').write(tk)
             except:
                 pass
+    if ('concurrency_detect' in configs or 'concurrency_upload' in configs) and detect_pool.desired:
+        apply_worker_pool_sizes()
 
     return jsonify({'code': 200})
 
 
+@app.route('/api/workers', methods=['GET', 'POST'])
+@login_required
+def worker_pools():
+    # GET 查看当前 worker 数；POST {"detect": n, "upload": m} 临时调整 (不写入配置，重启后按设置恢复)
+    if request.method == 'POST':
+        data = request.json or {}
+        try:
+            if data.get('detect') is not None:
+                detect_pool.resize(int(data['detect']))
+            if data.get('upload') is not None:
+                upload_pool.resize(int(data['upload']))
+        except (TypeError, ValueError):
+            return jsonify({"code": 400, "msg": "worker 数必须是正整数"}), 400
+    return jsonify(dict(get_worker_pool_status(), code=200))
+
+
 @app.route('/api/account/update', methods=['POST'])
 @login_required
 def update_account():
@@ -2072,6 +3252,102 @@ def clear_system_logs():
         return jsonify({"code": 500, "msg": str(e)})
 
 
+TASK_EVENT_INTERVAL = 0.5
+ARIA2_EVENT_INTERVAL = 2.0
+EVENT_HEARTBEAT_SECONDS = 15
+
+
+def task_event_upstream():
+    # 按变更版本取增量摘要推送；进度、状态和新日志都会推进版本
+    last = task_changes.current()
+    with app.app_context():
+        while event_bus.has_subscribers():
+            time.sleep(TASK_EVENT_INTERVAL)
+            try:
+                version, summaries, removed = load_task_changes(last)
+                if summaries is None:
+                    event_bus.publish('reset', {'version': version})
+                elif summaries or removed:
+                    event_bus.publish('tasks', {'from': last, 'version': version, 'tasks': summaries,
+                                                'deleted': sorted(removed)})
+                last = version
+            except Exception as e:
+                safe_db_rollback("task events")
+                print(f"⚠️ 推送任务变更失败: {e}")
+            finally:
+                db.session.remove()
+
+
+def aria2_event_upstream():
+    last = None
+    while event_bus.has_subscribers():
+        try:
+            stat = call_aria2_rpc('aria2.getGlobalStat', [])
+        except RuntimeError:
+            stat = None
+        if stat != last:
+            event_bus.publish('aria2', stat or {})
+            last = stat
+        time.sleep(ARIA2_EVENT_INTERVAL)
+
+
+def syslog_event_upstream():
+    # 一个 journalctl -f 跟随进程供所有页面共用，没有订阅者后退出
+    try:
+        proc = subprocess.Popen(['journalctl', '-t', 'arup', '-f', '-n', '0', '--no-pager', '--output', 'short-iso'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except OSError:
+        return
+    pending = b''
+    try:
+        while event_bus.has_subscribers() and proc.poll() is None:
+            ready, _, _ = select.select([proc.stdout], [], [], 1.0)
+            if not ready:
+                continue
+            chunk = os.read(proc.stdout.fileno(), 65536)
+            if not chunk:
+                break
+            *complete, pending = (pending + chunk).split(b'\n')
+            lines = []
+            for raw_line in complete:
+                line = format_system_log_line(raw_line.decode('utf-8', errors='replace'))
+                if line.strip() and not should_hide_system_log_line(line):
+                    lines.append(line)
+            if lines:
+                event_bus.publish('syslog', {'lines': lines})
+    finally:
+        proc.kill()
+        proc.wait()
+
+
+event_bus.register_upstream('tasks', task_event_upstream)
+event_bus.register_upstream('aria2', aria2_event_upstream)
+event_bus.register_upstream('syslog', syslog_event_upstream)
+
+
+@app.route('/api/events')
+@login_required
+def task_events():
+    # Server-Sent Events：tasks / task_log / aria2 / syslog / reset；无事件时定期发心跳注释保活
+    subscriber = event_bus.subscribe()
+
+    def stream():
+        try:
+            yield f"event: hello\ndata: {json.dumps({'version': task_changes.current()})}\n\n"
+            while True:
+                try:
+                    event, payload = subscriber.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event}\ndata: {payload}\n\n"
+        finally:
+            event_bus.unsubscribe(subscriber)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/keywords', methods=['GET', 'POST'])
 @login_required
 def manage_keywords():
@@ -2082,6 +3358,7 @@ def manage_keywords():
         if not Keyword.query.filter_by(type=d.get('type', 'audio'), content=i).first(): db.session.add(
             Keyword(type=d.get('type', 'audio'), content=i, enabled=True))
     db.session.commit();
+    bump_keywords_version()
     return jsonify({"code": 200})
 
 
@@ -2095,6 +3372,7 @@ def update_keyword(kid):
         else:
             k.enabled = request.json.get('enabled', k.enabled)
         db.session.commit()
+        bump_keywords_version()
     return jsonify({"code": 200})
 
 
@@ -2119,15 +3397,19 @@ def clear_tasks():
     if any(scanner_cleanup_rules.values()):
         protected_ids = get_active_task_ids()
         terminal_statuses = {status for _, status in scanner_cleanup_rules}
+        upload_marked = get_upload_marked_task_ids()
+        deleted_ids = []
         for task in Task.query.filter(Task.status.in_(terminal_statuses)).all():
-            queue = 'upload' if is_upload_task(task) else 'detect'
+            queue = 'upload' if is_upload_task(task, upload_marked=upload_marked) else 'detect'
             if not scanner_cleanup_rules.get((queue, task.status), False):
                 continue
             if task.id in protected_ids:
                 skipped += 1
                 continue
+            deleted_ids.append(task.id)
             db.session.delete(task)
             deleted += 1
+        delete_task_logs(deleted_ids)
         db.session.commit()
 
     aria2_result = {'cleaned': 0, 'failed': 0, 'error': ''}
@@ -2171,6 +3453,7 @@ def restart_service():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        run_migrations(db)
         if not User.query.first():
             initial_username = os.environ.get("SCANNER_ADMIN_USERNAME") or f"admin_{secrets.token_hex(4)}"
             initial_password = os.environ.get("SCANNER_ADMIN_PASSWORD") or secrets.token_urlsafe(18)
@@ -2198,28 +3481,27 @@ if __name__ == '__main__':
         recover_d = 0;
         recover_u = 0
         for t in Task.query.filter(Task.status.in_(['processing', 'pending'])).all():
+            if t.status == 'processing': append_task_log(t.id, "\n=== 系统重启：恢复检测 ===\n")
             t.status = 'pending';
-            detect_queue.put(t.id);
+            enqueue_detect_task(t.id);
             recover_d += 1
-            if t.status == 'processing': t.log += "\n=== 系统重启：恢复检测 ===\n"
         for t in Task.query.filter(Task.status.in_(['uploading', 'pending_upload'])).all():
+            if t.status == 'uploading': append_task_log(t.id, "\n=== 系统重启：恢复上传 ===\n")
             t.status = 'pending_upload';
             upload_queue.put(t.id);
             recover_u += 1
-            if t.status == 'uploading': t.log += "\n=== 系统重启：恢复上传 ===\n"
         db.session.commit()
+        flush_task_logs("startup recovery")
         print(f"🔄 已重新排队: {recover_d} 检测, {recover_u} 上传")
 
         orphan_count = reconcile_orphan_downloads()
         if orphan_count:
             print(f"🔎 启动补偿扫描已入队 {orphan_count} 个遗漏下载")
 
-        c = get_final_config(None);
-        n_d = max(1, c.get('concurrency_detect', 2));
-        n_u = max(1, c.get('concurrency_upload', 9))
-        print(f"🚀 启动检测: {n_d} | 上传: {n_u}")
+        detect_status, upload_status = apply_worker_pool_sizes()
+        print(f"🚀 启动检测: {detect_status['desired']} | 上传: {upload_status['desired']}")
 
-    for _ in range(n_d): threading.Thread(target=detection_worker, daemon=True).start()
-    for _ in range(n_u): threading.Thread(target=upload_worker, daemon=True).start()
     threading.Thread(target=orphan_reconcile_worker, daemon=True).start()
+    threading.Thread(target=task_log_flush_worker, daemon=True).start()
+    threading.Thread(target=detect_cost_worker, daemon=True).start()
     app.run(host='0.0.0.0', port=int(os.environ.get('SCANNER_PORT', '5000')))
@@ -5,13 +5,16 @@ import time
 import signal
 import json
 import shutil
-import gc
 import math
 import re
 import threading
 import queue
 import concurrent.futures
-import ctypes  # 🔥 [关键修改1] 必须引入这个库才能操作底层内存
+import mmap
+import struct
+import hashlib
+import codecs
+import sqlite3
 import tempfile
 from datetime import datetime
 
@@ -33,6 +36,17 @@ except ImportError:
 
     syslog = _SyslogFallback()
 
+from memory_manager import advise_dontneed, trim_if_above
+from tag_editor import clear_tags, restore_regions
+from mkv_demux import read_mkv_subtitle_texts
+from throughput import ProgressWatch, record_transfer, scaled_timeout
+from admission import admission_controller
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # ================= ⚙️ 核心配置区域 =================
 local_inference_condition = threading.Condition()
 local_inference_active = 0
@@ -46,6 +60,35 @@ MODELS_ROOT = os.path.join(BASE_DIR, "models")
 SCAN_IGNORED_CHARS_RE = re.compile(r'[\u00ad\u200b-\u200f\u202a-\u202e\u2060-\u206f\ufeff]')
 IMAGE_SUBTITLE_CODECS = {'hdmv_pgs_subtitle', 'dvd_subtitle', 'dvb_subtitle', 'xsub'}
 
+# VAD 预筛参数：偏保守，只剔除明确的静音/宽带噪声，疑似语音一律保留
+VAD_FRAME_SECONDS = 0.032
+VAD_MIN_ENERGY_DB = -55.0
+VAD_MAX_ENERGY_DB = -40.0
+VAD_NOISE_MARGIN_DB = 6.0
+VAD_MAX_FLATNESS = 0.45
+VAD_MAX_ZCR = 0.6
+VAD_HANGOVER_SECONDS = 0.3
+VAD_MIN_SPEECH_SECONDS = 0.2
+# 稳态音乐判别：频谱几乎不随帧变化 (谱通量中位数低) 且能量起伏小的区间视为持续音/器乐，不是语音。
+# 语音的音节起伏和共振峰移动会让两项都明显偏高；短于 VAD_TONAL_MIN_SECONDS 的区间证据不足，一律保留
+VAD_TONAL_MAX_FLUX = 0.1
+VAD_TONAL_MAX_ENERGY_STD_DB = 6.0
+VAD_TONAL_MIN_SECONDS = 1.0
+
+# 本地批量推理：批内各段之间插入的静音时长，以及输出行时间戳的识别格式。
+# 时间戳两端都必须带 mm:ss (可含时和毫秒)，如 [00:01:02.500 --> 00:01:04.000]，
+# 避免正文里的 "3-5个" 这类数字区间被当成时间戳
+LOCAL_BATCH_GAP_SECONDS = 1.0
+LOCAL_ASR_TIMESTAMP_PART = r'\d{1,2}(?::\d{2}){1,2}(?:[.,]\d{1,3})?'
+LOCAL_ASR_TIMESTAMP_RE = re.compile(
+    rf'^\[?\s*({LOCAL_ASR_TIMESTAMP_PART})\s*(?:-->|->|-|~)\s*({LOCAL_ASR_TIMESTAMP_PART})\s*\]?\s*[:：]?\s*(.*)$'
+)
+
+# ffmpeg 无进度判定卡死的时限：重封装持续写出；字幕提取在长段无字幕处输出会停顿，放宽
+FFMPEG_STALL_SECONDS = 60
+REMUX_STALL_SECONDS = 120
+SUBTITLE_STALL_SECONDS = 180
+
 VIDEO_EXTENSIONS = {
     '.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.webm',
     '.m4v', '.ts', '.mts', '.m2ts', '.vob', '.mpg', '.mpeg',
@@ -83,8 +126,403 @@ def sensevoice_gguf_ready(base_dir=None):
             return False
     return True
 
+# 返回 [(start, end), ...] 秒级语音区间；numpy 不可用时返回 None 表示未判定
+def detect_speech_spans(pcm):
+    if np is None:
+        return None
+    frame_len = max(1, int(pcm.sample_rate * VAD_FRAME_SECONDS))
+    with pcm.view() as raw:
+        samples = np.frombuffer(raw, dtype='<i2')[::pcm.channels]
+        frame_count = len(samples) // frame_len
+        frames = samples[:frame_count * frame_len].reshape(frame_count, frame_len).astype(np.float32) / 32768.0
+        del samples
+    if frame_count == 0:
+        return []
+
+    energy_db = 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    zcr = np.mean(np.abs(np.diff(np.signbit(frames).astype(np.int8), axis=1)), axis=1)
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(frame_len).astype(np.float32), axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(spectrum), axis=1)) / np.mean(spectrum, axis=1)
+    spectrum /= np.sum(spectrum, axis=1, keepdims=True)
+    flux = np.sum(np.abs(np.diff(spectrum, axis=0)), axis=1)
+    del spectrum
+
+    noise_floor = float(np.percentile(energy_db, 10))
+    energy_threshold = min(VAD_MAX_ENERGY_DB, max(VAD_MIN_ENERGY_DB, noise_floor + VAD_NOISE_MARGIN_DB))
+    speech = (energy_db > energy_threshold) & (flatness < VAD_MAX_FLATNESS) & (zcr < VAD_MAX_ZCR)
+
+    voiced = speech
+    hangover = int(round(VAD_HANGOVER_SECONDS / VAD_FRAME_SECONDS))
+    if hangover and speech.any():
+        speech = np.convolve(speech.astype(np.int8), np.ones(hangover * 2 + 1, dtype=np.int8), mode='same') > 0
+
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], speech.astype(np.int8), [0]))))
+    spans = []
+    frame_seconds = frame_len / float(pcm.sample_rate)
+    tonal_frames = int(round(VAD_TONAL_MIN_SECONDS / VAD_FRAME_SECONDS))
+    for begin, end in zip(edges[::2], edges[1::2]):
+        if (end - begin) * frame_seconds - hangover * 2 * frame_seconds < VAD_MIN_SPEECH_SECONDS:
+            continue
+        # 只看区间内原始判为有声的帧，避免 hangover 补进来的静音边缘拉高能量起伏
+        idx = begin + np.flatnonzero(voiced[begin:end])
+        if len(idx) >= tonal_frames and float(np.median(flux[np.minimum(idx, len(flux) - 1)])) < VAD_TONAL_MAX_FLUX \
+                and float(np.std(energy_db[idx])) < VAD_TONAL_MAX_ENERGY_STD_DB:
+            continue
+        spans.append((float(begin * frame_seconds), float(min(pcm.duration, end * frame_seconds))))
+    return spans
+
+
+def normalize_scan_text(text):
+    if not text: return ""
+    return SCAN_IGNORED_CHARS_RE.sub('', str(text)).lower()
+
+
+class KeywordMatcher:
+    # 归一化关键词上的 Aho-Corasick 自动机 (展开为 DFA)：一次遍历文本得到全部命中，按原关键词顺序返回
+    def __init__(self, keywords):
+        self.keywords = tuple(keywords)
+        delta = [{}]
+        outputs = [()]
+        for idx, kw in enumerate(self.keywords):
+            normalized_kw = normalize_scan_text(kw)
+            if not normalized_kw:
+                continue
+            state = 0
+            for ch in normalized_kw:
+                nxt = delta[state].get(ch)
+                if nxt is None:
+                    nxt = len(delta)
+                    delta[state][ch] = nxt
+                    delta.append({})
+                    outputs.append(())
+                state = nxt
+            outputs[state] += (idx,)
+
+        # BFS 计算失配指针，并把非根失配链上的转移并入本状态：扫描时每个字符至多两次字典查找
+        fail = [0] * len(delta)
+        order = list(delta[0].values())
+        for state in order:
+            for ch, nxt in delta[state].items():
+                f = fail[state]
+                while f and ch not in delta[f]:
+                    f = fail[f]
+                fail[nxt] = delta[f].get(ch, 0)
+                outputs[nxt] += outputs[fail[nxt]]
+                order.append(nxt)
+        for state in order:
+            if fail[state]:
+                inherited = dict(delta[fail[state]])
+                inherited.update(delta[state])
+                delta[state] = inherited
+        self._delta = delta
+        self._outputs = outputs
+
+    def scan(self, text, state=0, found=None):
+        # 从给定状态继续扫描，返回新状态；命中的关键词下标累加到 found
+        delta = self._delta
+        outputs = self._outputs
+        root = delta[0]
+        for ch in normalize_scan_text(text):
+            state = delta[state].get(ch) or root.get(ch, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return state
+
+    def find(self, text):
+        if not text or len(self._delta) == 1:
+            return []
+        found = set()
+        self.scan(text, 0, found)
+        return [self.keywords[idx] for idx in sorted(found)]
+
+    def stream(self):
+        return KeywordStream(self)
+
+
+class KeywordStream:
+    # 增量匹配：文本分块到达时保持自动机状态，跨块的关键词同样能命中
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.state = 0
+        self.found = set()
+
+    def feed(self, text):
+        if text and len(self.matcher._delta) > 1:
+            self.state = self.matcher.scan(text, self.state, self.found)
+        return bool(self.found)
+
+    @property
+    def hits(self):
+        return [self.matcher.keywords[idx] for idx in sorted(self.found)]
+
+
+keyword_matchers = {}
+keyword_matchers_lock = threading.Lock()
+KEYWORD_MATCHER_CACHE_SIZE = 16
+
+
+def get_keyword_matcher(keywords):
+    key = tuple(keywords)
+    with keyword_matchers_lock:
+        matcher = keyword_matchers.pop(key, None)
+        if matcher is None:
+            matcher = KeywordMatcher(key)
+        keyword_matchers[key] = matcher
+        while len(keyword_matchers) > KEYWORD_MATCHER_CACHE_SIZE:
+            keyword_matchers.pop(next(iter(keyword_matchers)))
+        return matcher
+
+
+def clear_keyword_matchers():
+    with keyword_matchers_lock:
+        keyword_matchers.clear()
+
+
+class MediaProbe:
+    # 一次 ffprobe -show_format -show_streams 的结果，元数据/字幕/音频/时长各阶段共用
+    def __init__(self, data):
+        self.format = data.get('format') or {}
+        self.streams = data.get('streams') or []
+
+    @property
+    def duration(self):
+        try:
+            return float(self.format.get('duration') or 0)
+        except (TypeError, ValueError):
+            return 0
+
+    def streams_of(self, codec_type):
+        return [stream for stream in self.streams if stream.get('codec_type') == codec_type and stream.get('index') is not None]
+
+    def tags_text(self):
+        # 与原先 format_tags / stream_tags 的 csv 输出保持同样的拼接方式
+        lines = []
+        format_tags = self.format.get('tags') or {}
+        if format_tags:
+            lines.append(",".join(str(v) for v in format_tags.values()))
+        for stream in self.streams:
+            tags = {str(k).lower(): v for k, v in (stream.get('tags') or {}).items()}
+            values = [str(tags[k]) for k in ('language', 'title', 'handler_name') if k in tags]
+            if values:
+                lines.append(",".join(values))
+        return "\n".join(lines)
+
+
+MEDIA_PROBE_CACHE_SIZE = 64
+media_probe_cache = {}
+media_probe_lock = threading.Lock()
+
+
+def get_file_signature(path):
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except OSError:
+        return None
+
+
+def invalidate_media_probe(*paths):
+    with media_probe_lock:
+        for path in paths:
+            media_probe_cache.pop(os.path.abspath(path), None)
+
+
+class PcmSegment:
+    # 内存映射的 pcm_s16le WAV：时长来自头部运算，切块是对 data 区的零拷贝切片
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._parse_header()
+        except:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        data_map = getattr(self, '_map', None)
+        if data_map is not None:
+            data_map.close()
+            self._map = None
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def read_duration(cls, path):
+        try:
+            with cls(path) as pcm:
+                return pcm.duration
+        except:
+            return 0
+
+    def _parse_header(self):
+        data = self._map
+        if len(data) < 12 or data[0:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError("不是 RIFF/WAVE 文件")
+        pos = 12
+        fmt = None
+        while pos + 8 <= len(data):
+            chunk_id = data[pos:pos + 4]
+            chunk_size = struct.unpack_from('<I', data, pos + 4)[0]
+            body = pos + 8
+            if chunk_id == b'fmt ':
+                fmt = struct.unpack_from('<HHIIHH', data, body)
+            elif chunk_id == b'data':
+                if not fmt:
+                    raise ValueError("WAV 缺少 fmt 块")
+                audio_format, self.channels, self.sample_rate, _, self.block_align, bits = fmt
+                if audio_format not in (1, 0xFFFE) or bits != 16 or not self.block_align or not self.sample_rate:
+                    raise ValueError(f"非 pcm_s16le 音频 (format={audio_format}, bits={bits})")
+                available = len(data) - body
+                # ffmpeg 写管道或被中断时 data 长度可能为 0/0xFFFFFFFF，以实际文件长度为准
+                if chunk_size in (0, 0xFFFFFFFF) or chunk_size > available:
+                    chunk_size = available
+                self.data_offset = body
+                self.data_size = chunk_size - chunk_size % self.block_align
+                self.byte_rate = self.sample_rate * self.block_align
+                return
+            pos = body + chunk_size + (chunk_size & 1)
+        raise ValueError("WAV 缺少 data 块")
+
+    @property
+    def duration(self):
+        return self.data_size / float(self.byte_rate)
+
+    def byte_range(self, start, duration=None):
+        begin = int(max(0.0, float(start)) * self.sample_rate) * self.block_align
+        begin = min(begin, self.data_size)
+        if duration is None:
+            end = self.data_size
+        else:
+            end = min(self.data_size, begin + int(max(0.0, float(duration)) * self.sample_rate) * self.block_align)
+        return self.data_offset + begin, self.data_offset + end
+
+    def view(self, start=0.0, duration=None):
+        begin, end = self.byte_range(start, duration)
+        return memoryview(self._map)[begin:end]
+
+    def wav_header(self, data_size):
+        return struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + data_size, b'WAVE', b'fmt ', 16, 1,
+                           self.channels, self.sample_rate, self.byte_rate, self.block_align, 16,
+                           b'data', data_size)
+
+    def wav_bytes(self, start=0.0, duration=None):
+        with self.view(start, duration) as chunk:
+            return self.wav_header(chunk.nbytes) + chunk
+
+    def digest(self, start=0.0, duration=None):
+        # 只哈希采样数据与格式，WAV 头部差异 (data 长度占位等) 不影响命中
+        h = hashlib.sha256(struct.pack('<IHH', self.sample_rate, self.channels, self.block_align))
+        with self.view(start, duration) as chunk:
+            h.update(chunk)
+        return h.hexdigest()
+
+
+class TranscriptCache:
+    # 转写结果持久缓存：PCM 内容哈希 + 识别端身份 -> 文本；按文本总字节数做 LRU 淘汰
+    # 关键词不参与键，命中后仍用当前关键词重新判定
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._conn = None
+        self._total = None
+
+    def _connect(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS transcript ("
+                         "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                         "created_at REAL NOT NULL, used_at REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_transcript_used_at ON transcript (used_at)")
+            conn.commit()
+            self._conn = conn
+            self._total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM transcript").fetchone()[0]
+        return self._conn
+
+    @staticmethod
+    def make_key(pcm_digest, identity):
+        return hashlib.sha256(f"{identity}\0{pcm_digest}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        if not key:
+            return None
+        with self._lock:
+            try:
+                conn = self._connect()
+                row = conn.execute("SELECT text FROM transcript WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                conn.execute("UPDATE transcript SET used_at = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+                return row[0]
+            except sqlite3.Error:
+                return None
+
+    def put(self, key, text):
+        if not key or text is None:
+            return
+        size = len(text.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            try:
+                conn = self._connect()
+                now = time.time()
+                row = conn.execute("SELECT size FROM transcript WHERE key = ?", (key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO transcript (key, text, size, created_at, used_at) VALUES (?, ?, ?, ?, ?)",
+                             (key, text, size, now, now))
+                self._total += size - (row[0] if row else 0)
+                while self._total > self.max_bytes:
+                    victims = conn.execute("SELECT key, size FROM transcript ORDER BY used_at LIMIT 64").fetchall()
+                    if not victims:
+                        self._total = 0
+                        break
+                    conn.executemany("DELETE FROM transcript WHERE key = ?", [(victim,) for victim, _ in victims])
+                    self._total -= sum(victim_size for _, victim_size in victims)
+                conn.commit()
+            except sqlite3.Error:
+                try:
+                    conn.rollback()
+                except:
+                    pass
+
+    def resize(self, max_bytes):
+        self.max_bytes = max(0, int(max_bytes))
+
+
+TRANSCRIPT_CACHE_PATH = os.path.join(BASE_DIR, "asr_cache.db")
+transcript_cache = None
+transcript_cache_lock = threading.Lock()
+
+
+def get_transcript_cache(config):
+    global transcript_cache
+    try:
+        max_mb = float(config.get('asr_transcript_cache_mb', 64))
+    except:
+        max_mb = 64
+    if max_mb <= 0:
+        return None
+    with transcript_cache_lock:
+        if transcript_cache is None:
+            transcript_cache = TranscriptCache(TRANSCRIPT_CACHE_PATH, max_mb * 1048576)
+        else:
+            transcript_cache.resize(max_mb * 1048576)
+        return transcript_cache
+
+
 class ScannerCore:
     CLOUD_ASR_CHUNK_OVERLAP = 2.0
+    VAD_TRIM_PADDING = 0.5
+    LOCAL_BATCH_MAX_DURATION = 1800.0
     RUNTIME_CLOUD_ASR_CONFIG_KEYS = ('cloud_asr_proxy_enabled', 'cloud_asr_proxy')
     _cloud_asr_cond = threading.Condition()
     _cloud_asr_active_total = 0
@@ -99,6 +537,9 @@ class ScannerCore:
                  rclone_remote="s25", config_refresh_callback=None):
         self.log_cb = logger_callback if logger_callback else print
         self.prog_cb = progress_callback if progress_callback else lambda p, s, e: None
+        self.hint_cb = None
+        # file_in_use_cb(path) -> True 表示文件仍被下载器持有 (下载中/做种)，不能原地改写
+        self.file_in_use_cb = None
         self.task_id = task_id
         self.root_dir_name = root_dir_name
         self.rclone_remote = rclone_remote
@@ -109,6 +550,12 @@ class ScannerCore:
         self.local_inference_session_token = None
         self._child_lock = threading.Lock()
         self._child_cores = set()
+        # 切块等并发路径里的管道子进程：{proc: cancel_event}，不占用 current_proc
+        self._proc_lock = threading.Lock()
+        self._pipe_procs = {}
+        self._touched_files = set()
+        # 本地推理准入每个文件只检查一次，同一文件的逐段子核心共用这份状态
+        self._inference_gate = {'lock': threading.Lock(), 'admitted': False}
         try:
             syslog.openlog("arup", syslog.LOG_PID, syslog.LOG_USER)
         except:
@@ -127,6 +574,7 @@ class ScannerCore:
         self.log("🛑 收到停止指令...")
 
         self._kill_current_proc()
+        self._kill_pipe_procs()
         with self._child_lock:
             children = list(self._child_cores)
         for child in children:
@@ -148,8 +596,7 @@ class ScannerCore:
             return {'creationflags': flags} if flags else {}
         return {}
 
-    def _kill_current_proc(self):
-        proc = self.current_proc
+    def _kill_proc(self, proc):
         if not proc:
             return
         try:
@@ -160,6 +607,16 @@ class ScannerCore:
         except:
             pass
 
+    def _kill_current_proc(self):
+        self._kill_proc(self.current_proc)
+
+    def _kill_pipe_procs(self, cancel_event=None):
+        # cancel_event 为空时结束全部管道子进程 (stop)，否则只结束该批次登记的
+        with self._proc_lock:
+            procs = [proc for proc, event in self._pipe_procs.items() if cancel_event is None or event is cancel_event]
+        for proc in procs:
+            self._kill_proc(proc)
+
     def get_cloud_asr_concurrency(self, config):
         try:
             return max(1, int(config.get('cloud_asr_concurrency', 3)))
@@ -242,7 +699,7 @@ class ScannerCore:
                 return False
         return True
 
-    def acquire_cloud_asr_slot(self, api_keys, global_limit):
+    def acquire_cloud_asr_slot(self, api_keys, global_limit, cancel_event=None):
         if not api_keys:
             raise RuntimeError("云端 API Key 未配置")
         cls = type(self)
@@ -254,7 +711,7 @@ class ScannerCore:
                 cls._cloud_asr_session_waiting[session_token] = cls._cloud_asr_session_waiting.get(session_token, 0) + 1
                 counted_wait = True
             try:
-                while not self._stopped:
+                while not self._stopped and not (cancel_event and cancel_event.is_set()):
                     has_priority = cls._cloud_asr_session_has_priority(session_token)
                     if has_priority and cls._cloud_asr_active_total < global_limit:
                         idx = cls._cloud_asr_next_key % len(api_keys)
@@ -321,6 +778,55 @@ class ScannerCore:
         finally:
             self.current_proc = None
 
+    def run_ffmpeg(self, cmd, timeout, stall_timeout=FFMPEG_STALL_SECONDS):
+        # ffmpeg 专用：-progress 写到 stdout，超过总时限或 stall_timeout 秒无进度即终止
+        if self._stopped: return None
+        cmd = [cmd[0], '-nostats', '-progress', 'pipe:1'] + list(cmd[1:])
+        watch = ProgressWatch()
+        stderr_file = tempfile.TemporaryFile()
+        try:
+            self.current_proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=stderr_file,
+                                                 **self._popen_group_kwargs())
+        except Exception as e:
+            if not self._stopped: self.log(f"命令出错: {e}")
+            self.current_proc = None
+            stderr_file.close()
+            return None
+        proc = self.current_proc
+        reader = watch.follow(proc.stdout)
+        deadline = time.time() + timeout
+        try:
+            while proc.poll() is None:
+                if self._stopped:
+                    break
+                if time.time() > deadline:
+                    self.log(f"⚠️ 命令超时 ({timeout}s)")
+                    break
+                if watch.stalled_for() > stall_timeout:
+                    self.log(f"⚠️ ffmpeg 已 {stall_timeout}s 无进度，判定卡死")
+                    break
+                try:
+                    proc.wait(timeout=0.5)
+                except subprocess.TimeoutExpired:
+                    pass
+            if proc.poll() is None:
+                self._kill_current_proc()
+                proc.wait()
+                reader.join(timeout=5)
+                return None
+            reader.join(timeout=5)
+            stderr_file.seek(0)
+            stderr = stderr_file.read().decode('utf-8', errors='ignore')
+            result = subprocess.CompletedProcess(cmd, proc.returncode, '', stderr)
+            if result.returncode != 0 and not self._stopped:
+                self.log(f"⚠️ 命令失败 (ffmpeg, code={result.returncode})")
+                if stderr.strip():
+                    self.log(f"↳ {stderr.strip()[-1200:]}")
+            return result
+        finally:
+            self.current_proc = None
+            stderr_file.close()
+
     def send_tg_msg(self, config, msg):
         token = config.get('tg_bot_token')
         chat_id = config.get('tg_chat_id')
@@ -331,26 +837,24 @@ class ScannerCore:
             except:
                 pass
 
-    # 🔥 [关键修改2] 彻底的内存释放函数
-    def drop_caches(self):
-        try:
-            # 1. 清理 Python 对象垃圾
-            gc.collect()
-
-            # 2. 🔥【核心】强制 C 语言层面的内存管理器归还物理内存给系统
-            # 如果没有这一步，top 命令里的 RES/RSS 内存占用很难降下来
-            try:
-                libc = ctypes.CDLL("libc.so.6")
-                libc.malloc_trim(0)
-            except:
-                pass
+    def track_file(self, *paths):
+        # 登记本任务读写过的源文件、重封装成品和段音频，release_memory 时对仍存在的逐个 DONTNEED；
+        # 只登记本阶段已经读完的文件，待推理的段音频不能提前登记
+        self._touched_files.update(path for path in paths if path)
 
-            # 3. 清理系统层面的 PageCache (辅助)
-            subprocess.run(['sync'])
-            with open('/proc/sys/vm/drop_caches', 'w') as f:
-                f.write('3')
+    def release_memory(self, config=None):
+        # 只对本任务读写过且仍存在的文件 DONTNEED；RSS 超过水位才 gc + malloc_trim
+        touched = [path for path in self._touched_files if os.path.exists(path)]
+        self._touched_files = set(touched)
+        advise_dontneed(touched)
+        try:
+            watermark_mb = float((config or {}).get('memory_trim_watermark_mb', 1024))
         except:
-            pass
+            watermark_mb = 1024
+        trimmed = trim_if_above(watermark_mb * 1048576)
+        if trimmed:
+            before, after = trimmed
+            self.log(f"🧹 [系统] 进程内存超过水位 {watermark_mb:.0f}MB，已整理: {before / 1048576:.0f}MB -> {after / 1048576:.0f}MB")
 
     def cleanup_empty_dirs(self, file_path):
         try:
@@ -365,41 +869,45 @@ class ScannerCore:
             pass
 
     def normalize_scan_text(self, text):
-        if not text: return ""
-        return SCAN_IGNORED_CHARS_RE.sub('', str(text)).lower()
+        return normalize_scan_text(text)
 
     def find_keywords(self, text, keywords):
         if not text or not keywords: return []
-        scan_text = self.normalize_scan_text(text)
-        hit_words = []
-        for kw in keywords:
-            normalized_kw = self.normalize_scan_text(kw)
-            if normalized_kw and normalized_kw in scan_text:
-                hit_words.append(kw)
-        return hit_words
+        return get_keyword_matcher(keywords).find(text)
 
-    def get_audio_streams(self, file_path):
-        res = self.run_cmd(
-            ['ffprobe', '-v', 'error', '-select_streams', 'a', '-show_entries', 'stream=index,codec_name', '-of',
-             'json', file_path], timeout=30)
+    def probe_media(self, path):
+        # 按 路径 + 大小 + mtime 缓存；文件被替换后签名变化自动失效
+        key = os.path.abspath(path)
+        signature = get_file_signature(path)
+        if signature is None:
+            return None
+        with media_probe_lock:
+            cached = media_probe_cache.pop(key, None)
+            if cached and cached[0] == signature:
+                media_probe_cache[key] = cached
+                return cached[1]
+        res = self.run_cmd(['ffprobe', '-v', 'error', '-show_format', '-show_streams', '-of', 'json', path], timeout=30)
         if not res or res.returncode != 0 or not res.stdout:
             return None
         try:
-            data = json.loads(res.stdout)
+            probe = MediaProbe(json.loads(res.stdout))
         except Exception as e:
-            self.log(f"⚠️ 音频流解析失败: {e}")
+            self.log(f"⚠️ 媒体信息解析失败: {e}")
             return None
+        with media_probe_lock:
+            media_probe_cache[key] = (signature, probe)
+            while len(media_probe_cache) > MEDIA_PROBE_CACHE_SIZE:
+                media_probe_cache.pop(next(iter(media_probe_cache)))
+        return probe
 
-        streams = []
-        for stream in data.get('streams', []):
-            index = stream.get('index')
-            if index is None:
-                continue
-            streams.append({
-                'index': str(index),
-                'codec': (stream.get('codec_name') or '').strip().lower()
-            })
-        return streams
+    def get_audio_streams(self, file_path):
+        probe = self.probe_media(file_path)
+        if probe is None:
+            return None
+        return [{
+            'index': str(stream['index']),
+            'codec': (stream.get('codec_name') or '').strip().lower()
+        } for stream in probe.streams_of('audio')]
 
     def is_copyable_audio_stream(self, stream):
         codec = stream.get('codec')
@@ -426,25 +934,15 @@ class ScannerCore:
         return args
 
     def get_subtitle_streams(self, file_path):
-        res = self.run_cmd(
-            ['ffprobe', '-v', 'error', '-select_streams', 's', '-show_entries',
-             'stream=index,codec_name:stream_tags=language,title,handler_name', '-of', 'json', file_path], timeout=30)
-        if not res or res.returncode != 0 or not res.stdout:
-            return None
-        try:
-            data = json.loads(res.stdout)
-        except Exception as e:
-            self.log(f"⚠️ 字幕流解析失败: {e}")
+        probe = self.probe_media(file_path)
+        if probe is None:
             return None
 
         streams = []
-        for stream in data.get('streams', []):
-            index = stream.get('index')
-            if index is None:
-                continue
+        for stream in probe.streams_of('subtitle'):
             tags = stream.get('tags') or {}
             streams.append({
-                'index': str(index),
+                'index': str(stream['index']),
                 'codec': (stream.get('codec_name') or '').strip().lower(),
                 'language': tags.get('language') or '',
                 'title': tags.get('title') or '',
@@ -466,7 +964,7 @@ class ScannerCore:
 
     def extract_subtitle_texts(self, source, streams):
         if not streams: return {}
-        timeout = max(120, min(300, 30 + len(streams) * 5))
+        timeout = scaled_timeout(source, minimum=120)
         texts = {}
         with tempfile.TemporaryDirectory(prefix='subscan_') as tmp_dir:
             outputs = {}
@@ -477,9 +975,12 @@ class ScannerCore:
                 outputs[idx] = output
                 cmd.extend(['-map', f'0:{idx}', '-f', 'webvtt', output])
 
-            res = self.run_cmd(cmd, timeout=timeout)
+            started_at = time.time()
+            res = self.run_ffmpeg(cmd, timeout, stall_timeout=SUBTITLE_STALL_SECONDS)
             if not res:
                 return texts
+            if res.returncode == 0:
+                record_transfer(source, os.path.getsize(source), time.time() - started_at)
 
             for idx, output in outputs.items():
                 if not os.path.exists(output):
@@ -491,6 +992,122 @@ class ScannerCore:
                     self.log(f"⚠️ 字幕轨 #{idx} 读取失败: {e}")
         return texts
 
+    def demux_subtitle_texts(self, source, streams):
+        # MKV 文本字幕直接从容器读取字幕 Block，跳过音视频负载，不启动 ffmpeg 转码
+        # 返回 {轨号: 文本}；非 MKV、编码/结构不受支持时返回 None，由 ffmpeg 路径兜底
+        if not streams or os.path.splitext(source)[1].lower() not in ('.mkv', '.mka', '.mks', '.webm'):
+            return None
+        probe = self.probe_media(source)
+        if probe is None:
+            return None
+        track_count = len([stream for stream in probe.streams if stream.get('codec_type') != 'attachment'])
+        started_at = time.time()
+        texts = read_mkv_subtitle_texts(source, streams, track_count)
+        if texts is not None:
+            self.log(f"⚡ 直接解析 MKV 字幕 {len(texts)} 轨 (免 ffmpeg)，用时 {time.time() - started_at:.1f}s")
+        return texts
+
+    def stream_subtitle_hits(self, source, streams, sub_keywords):
+        # 一个 ffmpeg 把各字幕轨同时输出到独立管道，每轨一个读线程边读边匹配。
+        # 已命中的轨只排空管道不再匹配 (不能停读，否则 ffmpeg 会阻塞在该输出上)；全部轨命中即提前结束。
+        # 返回 {轨号: 命中词列表}；不支持管道 (Windows) 或进程启动失败时返回 None
+        if os.name != 'posix' or not streams:
+            return None
+        matcher = get_keyword_matcher(sub_keywords)
+        timeout = scaled_timeout(source, minimum=120)
+        pipes = {}
+        progress_fds = None
+        cmd = ['ffmpeg', '-v', 'error', '-nostdin', '-nostats', '-y', '-i', source]
+        try:
+            progress_fds = os.pipe()
+            cmd[1:1] = ['-progress', f"pipe:{progress_fds[1]}"]
+            for stream in streams:
+                read_fd, write_fd = os.pipe()
+                pipes[stream['index']] = (read_fd, write_fd)
+                cmd.extend(['-map', f"0:{stream['index']}", '-f', 'webvtt', f"pipe:{write_fd}"])
+        except OSError:
+            for read_fd, write_fd in list(pipes.values()) + ([progress_fds] if progress_fds else []):
+                os.close(read_fd)
+                os.close(write_fd)
+            return None
+
+        matches = {idx: matcher.stream() for idx in pipes}
+        dirty_event = threading.Event()
+        dirty_lock = threading.Lock()
+        dirty_idxs = set()
+        stderr_file = tempfile.TemporaryFile()
+        try:
+            self.current_proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=stderr_file,
+                                                 pass_fds=[write_fd for _, write_fd in pipes.values()] + [progress_fds[1]],
+                                                 **self._popen_group_kwargs())
+        except Exception as e:
+            self.log(f"命令出错: {e}")
+            for read_fd, write_fd in list(pipes.values()) + [progress_fds]:
+                os.close(read_fd)
+                os.close(write_fd)
+            stderr_file.close()
+            return None
+        proc = self.current_proc
+        for _, write_fd in list(pipes.values()) + [progress_fds]:
+            os.close(write_fd)
+        watch = ProgressWatch()
+        progress_reader = watch.follow(os.fdopen(progress_fds[0], 'rb'))
+
+        def read_stream(idx, read_fd):
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+            matched = False
+            with os.fdopen(read_fd, 'rb', buffering=0) as pipe:
+                while True:
+                    chunk = pipe.read(65536)
+                    if not chunk:
+                        break
+                    if matched:
+                        continue
+                    if matches[idx].feed(decoder.decode(chunk)):
+                        matched = True
+                        with dirty_lock:
+                            dirty_idxs.add(idx)
+                            if len(dirty_idxs) == len(pipes):
+                                dirty_event.set()
+
+        readers = [threading.Thread(target=read_stream, args=(idx, read_fd), daemon=True)
+                   for idx, (read_fd, _) in pipes.items()]
+        for reader in readers:
+            reader.start()
+        deadline = time.time() + timeout
+        early_exit = False
+        try:
+            while proc.poll() is None:
+                if self._stopped:
+                    break
+                if dirty_event.is_set():
+                    early_exit = True
+                    break
+                if time.time() > deadline:
+                    self.log(f"⚠️ 命令超时 ({timeout}s)")
+                    break
+                if watch.stalled_for() > SUBTITLE_STALL_SECONDS:
+                    self.log(f"⚠️ ffmpeg 已 {SUBTITLE_STALL_SECONDS}s 无进度，判定卡死")
+                    break
+                dirty_event.wait(0.2)
+            if proc.poll() is None:
+                self._kill_current_proc()
+                proc.wait()
+            for reader in readers + [progress_reader]:
+                reader.join(timeout=10)
+            if proc.returncode and not early_exit and not self._stopped:
+                self.log(f"⚠️ 命令失败 (ffmpeg, code={proc.returncode})")
+                stderr_file.seek(0)
+                detail = stderr_file.read().decode('utf-8', errors='ignore').strip()
+                if detail:
+                    self.log(f"↳ {detail[-1200:]}")
+        finally:
+            self.current_proc = None
+            stderr_file.close()
+        if early_exit:
+            self.log(f"⏩ 字幕轨全部命中，提前结束提取")
+        return {idx: stream.hits for idx, stream in matches.items() if stream.found}
+
     def get_smart_audio_map(self, file_path):
         try:
             streams = self.get_audio_streams(file_path)
@@ -507,13 +1124,8 @@ class ScannerCore:
         return "0:a:0"
 
     def get_media_duration(self, path):
-        res = self.run_cmd(
-            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1',
-             path], timeout=30)
-        try:
-            return float(res.stdout.strip()) if res and res.stdout.strip() else 0
-        except:
-            return 0
+        probe = self.probe_media(path)
+        return probe.duration if probe else 0
 
     def verify_integrity(self, path):
         if not os.path.exists(path) or os.path.getsize(path) < 1024: return False
@@ -522,6 +1134,10 @@ class ScannerCore:
     def verify_audio_segment(self, path, min_duration=1.0):
         if not os.path.exists(path) or os.path.getsize(path) < 1024:
             return False
+        if path.lower().endswith('.wav'):
+            duration = PcmSegment.read_duration(path)
+            if duration:
+                return duration >= min_duration
         return self.get_media_duration(path) >= min_duration
 
     def check_keywords(self, text, keywords):
@@ -534,7 +1150,8 @@ class ScannerCore:
     def extract_audio(self, video, start, duration, output, map_arg="0:a:0", min_duration=1.0):
         cmd = ['ffmpeg', '-ss', str(start), '-t', str(duration), '-i', video,
                '-map', map_arg, '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', '-y', output]
-        res = self.run_cmd(cmd, timeout=120)
+        res = self.run_ffmpeg(cmd, self.extract_timeout(video, duration))
+        self.track_file(video)
         if not res or res.returncode != 0:
             return False
         if not self.verify_audio_segment(output, min_duration=min_duration):
@@ -543,6 +1160,105 @@ class ScannerCore:
             return False
         return True
 
+    def get_min_audio_duration(self, task):
+        return min(5.0, max(1.0, float(task['duration']) * 0.05))
+
+    def get_audio_extract_candidates(self, task):
+        candidates = [task]
+        if '片尾' in str(task['name']) and task['start'] > 0:
+            fallback_start = max(0, task['start'] - task['duration'])
+            if fallback_start < task['start']:
+                fallback_task = dict(task)
+                fallback_task['start'] = fallback_start
+                candidates.append(fallback_task)
+        return candidates
+
+    def extract_timeout(self, video, duration, minimum=60):
+        # 按提取时长占全片的比例估算要读的字节数
+        total = self.get_media_duration(video)
+        try:
+            size = os.path.getsize(video)
+        except OSError:
+            size = 0
+        nbytes = size * min(1.0, float(duration) / total) if total > 0 else size
+        return scaled_timeout(video, nbytes, minimum=minimum)
+
+    # 一次 ffmpeg 会话提取多个音频段：单个输入只 seek 一次到首段，按时间顺序顺读到末段，一次解码后 asplit/atrim 分流到各段
+    def extract_audio_segments(self, video, segments, map_arg="0:a:0"):
+        if not segments:
+            return True
+        if not str(map_arg).startswith('0:'):
+            return False
+        segments = sorted(segments, key=lambda item: float(item['start']))
+        span_start = float(segments[0]['start'])
+        span_end = max(float(item['start']) + float(item['duration']) for item in segments)
+        labels = [f"s{idx}" for idx in range(len(segments))]
+        graph = [f"[{map_arg}]asplit={len(labels)}" + ''.join(f"[{label}]" for label in labels)]
+        for idx, (label, segment) in enumerate(zip(labels, segments)):
+            rel_start = float(segment['start']) - span_start
+            graph.append(f"[{label}]atrim=start={rel_start:.3f}:duration={float(segment['duration']):.3f},"
+                         f"asetpts=PTS-STARTPTS[o{idx}]")
+
+        cmd = ['ffmpeg', '-v', 'error', '-ss', f"{span_start:.3f}", '-t', f"{span_end - span_start:.3f}", '-i', video,
+               '-filter_complex', ';'.join(graph)]
+        for idx, segment in enumerate(segments):
+            cmd.extend(['-map', f"[o{idx}]", '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', '-y', segment['output']])
+        res = self.run_ffmpeg(cmd, self.extract_timeout(video, span_end - span_start, minimum=max(120, 60 + len(segments) * 45)))
+        self.track_file(video)
+        return bool(res and res.returncode == 0)
+
+    def prefetch_audio_segments(self, file_path, task_id, audio_map, tasks):
+        plan = []
+        for task in tasks:
+            temp_audio, temp_meta = self.get_audio_cache_paths(task_id, task['name'])
+            min_audio_duration = self.get_min_audio_duration(task)
+            if any(self.can_reuse_audio_cache(temp_audio, temp_meta,
+                                              self.get_audio_cache_meta(file_path, candidate, audio_map),
+                                              min_duration=min_audio_duration)
+                   for candidate in self.get_audio_extract_candidates(task)):
+                continue
+            plan.append({'task': task, 'start': float(task['start']), 'duration': float(task['duration']),
+                         'output': temp_audio, 'meta': temp_meta, 'min_duration': min_audio_duration})
+
+        # 单段与逐段提取等价，交给 scan_one_audio_task 处理
+        if len(plan) < 2 or self._stopped:
+            return 0
+
+        for item in plan:
+            self.remove_audio_cache(item['output'], item['meta'], self.get_cloud_flac_path(item['output']))
+        started_at = time.time()
+        self.log(f"✂️ 批量提取音频: {len(plan)}段，单输入顺序读取，单次解码")
+        if not self.extract_audio_segments(file_path, plan, map_arg=audio_map):
+            for item in plan:
+                self.remove_audio_cache(item['output'])
+            if not self._stopped:
+                self.log("⚠️ 批量提取失败，回退逐段提取")
+            return 0
+
+        extracted = 0
+        for item in plan:
+            if self.verify_audio_segment(item['output'], min_duration=item['min_duration']):
+                self.write_audio_cache_meta(item['meta'], self.get_audio_cache_meta(file_path, item['task'], audio_map))
+                extracted += 1
+            else:
+                self.remove_audio_cache(item['output'])
+        self.log(f"✂️ 批量提取完成: {extracted}/{len(plan)}段，用时 {time.time() - started_at:.1f}s")
+        return extracted
+
+    def detect_audio_speech(self, audio_path, task):
+        if np is None:
+            return None
+        try:
+            with PcmSegment(audio_path) as pcm:
+                duration = pcm.duration
+                spans = detect_speech_spans(pcm)
+        except Exception as e:
+            self.log(f"⚠️ VAD 预筛失败，按全段识别 [{task['name']}]: {e}")
+            return None
+        speech_seconds = sum(end - start for start, end in spans)
+        self.log(f"🎙️ VAD 预筛 [{task['name']}]: 语音 {speech_seconds:.1f}s / {duration:.1f}s，{len(spans)}段")
+        return spans
+
     def get_cloud_flac_path(self, audio_path):
         base, _ = os.path.splitext(audio_path)
         return f"{base}_cloud.flac"
@@ -574,7 +1290,7 @@ class ScannerCore:
 
         self.remove_audio_cache(cloud_path)
         cmd = ['ffmpeg', '-i', audio_path, '-vn', '-acodec', 'flac', '-y', cloud_path]
-        res = self.run_cmd(cmd, timeout=120)
+        res = self.run_ffmpeg(cmd, scaled_timeout(audio_path, minimum=60))
         try:
             cloud_size = os.path.getsize(cloud_path)
         except:
@@ -590,15 +1306,49 @@ class ScannerCore:
             self.log("⚠️ FLAC 生成失败，回退使用 WAV 音频源")
         return audio_path, None
 
-    def extract_cloud_audio_chunk(self, audio_path, start, duration, output):
-        cmd = ['ffmpeg', '-ss', str(start), '-t', str(duration), '-i', audio_path,
-               '-vn', '-acodec', 'pcm_s16le', '-ar', '16000', '-ac', '1', '-y', output]
-        res = self.run_cmd(cmd, timeout=120)
-        min_duration = min(1.0, max(0.2, float(duration) * 0.5))
-        if res and res.returncode == 0 and self.verify_audio_segment(output, min_duration=min_duration):
-            return True
-        self.remove_audio_cache(output, self.get_cloud_flac_path(output))
-        return False
+    def run_pipe_cmd(self, cmd, data, timeout=120, cancel_event=None):
+        # 可被多个线程同时调用：子进程登记在 _pipe_procs，stop() 或对应批次取消时全部结束
+        def cancelled():
+            return self._stopped or (cancel_event is not None and cancel_event.is_set())
+
+        if cancelled(): return None
+        proc = None
+        try:
+            proc = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                **self._popen_group_kwargs()
+            )
+            with self._proc_lock:
+                self._pipe_procs[proc] = cancel_event
+            # 登记前可能已经发出停止/取消，补杀一次避免漏掉
+            if cancelled():
+                self._kill_proc(proc)
+            stdout, stderr = proc.communicate(input=data, timeout=timeout)
+            if cancelled():
+                return None
+            if proc.returncode != 0:
+                self.log(f"⚠️ 命令失败 ({cmd[0]}, code={proc.returncode})")
+                detail = (stderr or b'').decode('utf-8', errors='ignore').strip()
+                if detail:
+                    self.log(f"↳ {detail[-1200:]}")
+                return None
+            return stdout
+        except subprocess.TimeoutExpired:
+            self.log(f"⚠️ 命令超时 ({timeout}s)")
+            self._kill_proc(proc)
+            proc.communicate()
+            return None
+        except Exception as e:
+            if not cancelled(): self.log(f"命令出错: {e}")
+            return None
+        finally:
+            if proc:
+                with self._proc_lock:
+                    self._pipe_procs.pop(proc, None)
+
+    def encode_flac_bytes(self, wav_data, cancel_event=None):
+        return self.run_pipe_cmd(['ffmpeg', '-v', 'error', '-f', 'wav', '-i', 'pipe:0', '-vn', '-acodec', 'flac',
+                                  '-f', 'flac', 'pipe:1'], wav_data, timeout=120, cancel_event=cancel_event)
 
     def get_audio_cache_paths(self, task_id, segment_name):
         label = str(segment_name)
@@ -667,6 +1417,27 @@ class ScannerCore:
             except:
                 pass
 
+    def get_cloud_transcript_identity(self, config):
+        return f"cloud|{config.get('api_url') or ''}|{config.get('api_model') or ''}|zh"
+
+    def get_local_transcript_identity(self):
+        paths = get_sensevoice_gguf_paths()
+        parts = ['local']
+        for key in ('model', 'vad'):
+            try:
+                st = os.stat(paths[key])
+                parts.append(f"{os.path.basename(paths[key])}:{st.st_size}:{st.st_mtime_ns}")
+            except:
+                parts.append(os.path.basename(paths.get(key) or ''))
+        return '|'.join(parts)
+
+    def get_transcript_cache_key(self, audio_path, identity, start=0.0, duration=None):
+        try:
+            with PcmSegment(audio_path) as pcm:
+                return TranscriptCache.make_key(pcm.digest(start, duration), identity)
+        except:
+            return None
+
     def clean_transcription(self, text):
         if not text: return ""
         text = re.sub(r'<\|[^|]*\|>', '', text)
@@ -687,18 +1458,74 @@ class ScannerCore:
             filtered.append(line)
         return "\n".join(filtered or lines).strip()
 
-    def run_local_sensevoice_gguf(self, audio_path, segment_duration):
-        paths = get_sensevoice_gguf_paths()
+    def run_local_sensevoice_output(self, audio_path, segment_duration):
         if not sensevoice_gguf_ready():
             raise RuntimeError("本地 GGUF 模型资源缺失，请在设置页下载")
 
+        paths = get_sensevoice_gguf_paths()
         timeout = max(300, int(float(segment_duration or 0) * 3) + 120)
         cmd = [paths['binary'], '-m', paths['model'], '--vad', paths['vad'], '-a', audio_path]
         res = self.run_cmd(cmd, timeout=timeout)
         if not res or res.returncode != 0:
             raise RuntimeError("GGUF 推理命令失败")
-        text = self.extract_local_asr_text((res.stdout or '') + "\n" + (res.stderr or ''))
-        return self.clean_transcription(text)
+        return self.extract_local_asr_text((res.stdout or '') + "\n" + (res.stderr or ''))
+
+    def run_local_sensevoice_gguf(self, audio_path, segment_duration):
+        return self.clean_transcription(self.run_local_sensevoice_output(audio_path, segment_duration))
+
+    def parse_asr_timestamp(self, value):
+        seconds = 0.0
+        for part in value.replace(',', '.').split(':'):
+            seconds = seconds * 60 + float(part)
+        return seconds
+
+    def split_local_asr_output(self, output, offsets):
+        # 按输出行时间戳把批量转写拆回各段；任一文本行没有时间戳则无法拆分，返回 None
+        texts = {name: [] for name, _, _ in offsets}
+        for line in str(output or '').splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            m = LOCAL_ASR_TIMESTAMP_RE.match(line)
+            if not m:
+                if self.clean_transcription(line):
+                    return None
+                continue
+            try:
+                mid = (self.parse_asr_timestamp(m.group(1)) + self.parse_asr_timestamp(m.group(2))) / 2.0
+            except ValueError:
+                return None
+            owner = min(offsets, key=lambda item: 0.0 if item[1] <= mid <= item[2] else min(abs(mid - item[1]), abs(mid - item[2])))
+            texts[owner[0]].append(m.group(3))
+        return {name: self.clean_transcription(" ".join(parts)) for name, parts in texts.items()}
+
+    def write_local_batch_audio(self, output, items):
+        # 同格式 pcm_s16le 段首尾相接，段间补静音；返回 [(段名, 起点, 终点), ...]，格式不一致时返回 None
+        segments = []
+        try:
+            for item in items:
+                segments.append(PcmSegment(item['audio']))
+            if len({(pcm.sample_rate, pcm.channels, pcm.block_align) for pcm in segments}) != 1:
+                return None
+            first = segments[0]
+            gap_bytes = b'\0' * (int(LOCAL_BATCH_GAP_SECONDS * first.sample_rate) * first.block_align)
+            data_size = sum(pcm.data_size for pcm in segments) + len(gap_bytes) * (len(segments) - 1)
+            offsets = []
+            position = 0.0
+            with open(output, 'wb') as f:
+                f.write(first.wav_header(data_size))
+                for idx, (item, pcm) in enumerate(zip(items, segments)):
+                    if idx:
+                        f.write(gap_bytes)
+                        position += LOCAL_BATCH_GAP_SECONDS
+                    with pcm.view() as chunk:
+                        f.write(chunk)
+                    offsets.append((item['segment'], position, position + pcm.duration))
+                    position += pcm.duration
+            return offsets
+        finally:
+            for pcm in segments:
+                pcm.close()
 
     def get_retry_attempt_label(self, config):
         try:
@@ -819,8 +1646,21 @@ class ScannerCore:
                 return False
         return True
 
-    def acquire_local_inference_slot(self, limit):
+    def admit_local_inference(self):
+        gate = self._inference_gate
+        with gate['lock']:
+            if gate['admitted']:
+                return not self._stopped
+            if not self.wait_for_resources('inference'):
+                return False
+            gate['admitted'] = True
+            return True
+
+    def acquire_local_inference_slot(self, limit, admitted=False):
+        # admitted=True 表示调用方已为本批做过准入检查；否则按文件只检查一次
         global local_inference_active
+        if not admitted and not self.admit_local_inference():
+            return 0
         session_token = getattr(self, 'local_inference_session_token', None)
         counted_wait = False
         with local_inference_condition:
@@ -837,10 +1677,11 @@ class ScannerCore:
                     local_inference_session_waiting[session_token] = max(0, local_inference_session_waiting.get(session_token, 0) - 1)
                     local_inference_session_active[session_token] = local_inference_session_active.get(session_token, 0) + 1
                     counted_wait = False
-                return local_inference_active
+                active_slots = local_inference_active
             finally:
                 if counted_wait:
                     local_inference_session_waiting[session_token] = max(0, local_inference_session_waiting.get(session_token, 0) - 1)
+        return active_slots
 
     def release_local_inference_slot(self):
         global local_inference_active
@@ -852,50 +1693,31 @@ class ScannerCore:
             local_inference_condition.notify_all()
             return local_inference_active
 
-    def sanitize_metadata(self, source, meta_keywords):
-        if source.lower().endswith('.rmvb'): return
+    def wait_for_resources(self, stage, path=None, need_bytes=0):
+        # 重阶段开始前的准入检查；返回 False 表示等待中被停止
+        return admission_controller.wait(stage, path, need_bytes, lambda: self._stopped, self.log, self.hint_cb)
+
+    def plan_metadata_sanitize(self, source, meta_keywords, plan):
+        # 只判定并写入清洗计划，实际改写由 apply_remux_plan 统一执行
+        if source.lower().endswith('.rmvb'): return plan
         self.log("🧹 [检测] 检查元数据标签...")
-        res_format = self.run_cmd(['ffprobe', '-v', 'error', '-show_entries', 'format_tags', '-of', 'csv=p=0', source],
-                                  timeout=30)
-        res_stream = self.run_cmd(
-            ['ffprobe', '-v', 'error', '-show_entries', 'stream_tags=language,title,handler_name', '-of', 'csv=p=0',
-             source],
-            timeout=30
-        )
-
-        scan_text = ""
-        if res_format and res_format.stdout:
-            scan_text += res_format.stdout + "\n"
-        if res_stream and res_stream.stdout:
-            scan_text += res_stream.stdout
+        probe = self.probe_media(source)
+        self.track_file(source)
+        scan_text = probe.tags_text() if probe else ""
         hit_words = self.find_keywords(scan_text, meta_keywords)
 
         if hit_words:
-            self.log(f"🚫 发现敏感标签: {hit_words} -> 执行清洗...")
-            dir_name = os.path.dirname(source);
-            name, ext = os.path.splitext(os.path.basename(source))
-            output = os.path.join(dir_name, f"{name}_clean_meta{ext}")
-            cmd = ['ffmpeg', '-err_detect', 'ignore_err', '-i', source, '-map', '0:v:0']
-            cmd.extend(self.get_safe_audio_map_args(source))
-            cmd.extend(['-map', '0:s?', '-c', 'copy', '-dn', '-ignore_unknown', '-strict', '-2', '-map_metadata', '-1',
-                   '-metadata', 'title=', '-metadata', 'comment=',
-                   '-metadata', 'description=', '-metadata', 'synopsis=',
-                   '-metadata', 'artist=', '-metadata', 'album=', '-metadata', 'copyright=',
-                   '-metadata:s', 'title=', '-metadata:s', 'handler_name=',
-                   '-y', output])
-            res = self.run_cmd(cmd, timeout=300)
-            if res and res.returncode == 0 and self.verify_integrity(output):
-                shutil.move(output, source);
-                self.log("✅ 元数据已清洗")
-            else:
-                if os.path.exists(output): os.remove(output)
+            self.log(f"🚫 发现敏感标签: {hit_words} -> 计入清洗计划")
+            plan['clear_metadata'] = True
+            plan['meta_hits'] = hit_words
+        return plan
 
-    def check_subtitles(self, source, sub_keywords):
-        if not sub_keywords: return None
+    def plan_subtitle_strip(self, source, sub_keywords, plan):
+        if not sub_keywords: return plan
         started_at = time.time()
         self.log(f"📝 [检测] 分析字幕内容...")
         streams = self.get_subtitle_streams(source)
-        if not streams: return None
+        if not streams: return plan
 
         all_idxs = [stream['index'] for stream in streams]
         dirty_idxs = set()
@@ -903,7 +1725,9 @@ class ScannerCore:
 
         for stream in streams:
             idx = stream['index']
-            hit_words = self.find_keywords(self.subtitle_metadata_text(stream), sub_keywords)
+            # 元数据将被整体清除时，轨道标签不会留在成品里，只按编码判定
+            meta_text = (stream.get('codec') or '') if plan.get('clear_metadata') else self.subtitle_metadata_text(stream)
+            hit_words = self.find_keywords(meta_text, sub_keywords)
             if hit_words:
                 self.log(f"🚫 字幕轨 #{idx} 元数据命中: {', '.join(hit_words)}")
                 dirty_idxs.add(idx)
@@ -917,39 +1741,134 @@ class ScannerCore:
                 text_streams.append(stream)
 
         self.log(f"ℹ️ 字幕轨 {len(streams)} 条，待扫文本轨 {len(text_streams)} 条，图片轨 {image_count} 条")
-        subtitle_texts = self.extract_subtitle_texts(source, text_streams)
+        if text_streams and not self.wait_for_resources('extract', source):
+            return plan
+        subtitle_texts = self.demux_subtitle_texts(source, text_streams)
+        stream_hits = None
+        if subtitle_texts is None:
+            stream_hits = self.stream_subtitle_hits(source, text_streams, sub_keywords)
+            if stream_hits is None:
+                subtitle_texts = self.extract_subtitle_texts(source, text_streams)
+        if stream_hits is None:
+            stream_hits = {}
+            for stream in text_streams:
+                text = subtitle_texts.get(stream['index'], '')
+                if text:
+                    stream_hits[stream['index']] = self.find_keywords(text, sub_keywords)
         for stream in text_streams:
             idx = stream['index']
-            text = subtitle_texts.get(idx, '')
-            if not text:
-                continue
-            hit_words = self.find_keywords(text, sub_keywords)
+            hit_words = stream_hits.get(idx)
             if hit_words:
                 self.log(f"🚫 字幕轨 #{idx} 内容命中: {', '.join(hit_words)}")
                 dirty_idxs.add(idx)
 
+        self.track_file(source)
         self.log(f"⏱️ 字幕分析完成: {len(streams)}轨/命中{len(dirty_idxs)}轨，用时 {time.time() - started_at:.1f}s")
 
         if dirty_idxs:
-            self.log(f"🧹 剔除违规字幕...")
-            dir_name = os.path.dirname(source);
-            name, ext = os.path.splitext(os.path.basename(source))
-            output = os.path.join(dir_name, f"{name}_clean{ext}")
-            cmd = ['ffmpeg', '-err_detect', 'ignore_err', '-i', source, '-map', '0:v:0']
-            cmd.extend(self.get_safe_audio_map_args(source))
-            for idx in all_idxs:
-                if idx not in dirty_idxs: cmd.extend(['-map', f'0:{idx}'])
-            cmd.extend(['-c', 'copy', '-dn', '-ignore_unknown', '-y', output])
-            res = self.run_cmd(cmd, timeout=300)
-            if res and res.returncode == 0 and self.verify_integrity(output):
+            plan['keep_subtitles'] = [idx for idx in all_idxs if idx not in dirty_idxs]
+            plan['drop_subtitles'] = [idx for idx in all_idxs if idx in dirty_idxs]
+        return plan
+
+    def clear_tags_in_place(self, source, hit_words):
+        # MKV/MP4 头部原地改写标签；改写后复查，仍命中或文件异常则写回原字节并交给重封装。
+        # 文件仍被 aria2 持有时原地改写会破坏下载/做种中的分片，直接走重封装
+        if self.file_in_use_cb:
+            try:
+                in_use = self.file_in_use_cb(source)
+            except Exception:
+                in_use = True
+            if in_use:
+                self.log("ℹ️ 文件仍被 Aria2 下载/做种占用，跳过原地清洗，改用重封装")
+                return False
+        try:
+            undo = clear_tags(source)
+        except Exception as e:
+            self.log(f"⚠️ 原地清洗标签失败: {e}")
+            return False
+        if not undo:
+            return False
+        invalidate_media_probe(source)
+        probe = self.probe_media(source)
+        remaining = self.find_keywords(probe.tags_text(), hit_words) if probe else hit_words
+        if probe and probe.duration > 0 and not remaining:
+            self.log(f"✅ 元数据已原地清洗 (改写头部 {len(undo)} 处，免重封装)")
+            return True
+        try:
+            restore_regions(source, undo)
+        except Exception as e:
+            self.log(f"⚠️ 原地清洗回滚失败: {e}")
+        invalidate_media_probe(source)
+        self.log(f"↩️ 原地清洗后仍有标签{(' ' + ', '.join(remaining)) if remaining else ''}，改用重封装")
+        return False
+
+    def apply_remux_plan(self, source, plan):
+        # 一次 ffmpeg 拷贝流完成全部清洗：剔除字幕时输出 *_clean 新文件并删除原文件，仅清元数据时原地替换
+        # 返回清洗后的文件路径；计划为空或执行失败返回 None
+        clear_metadata = plan.get('clear_metadata')
+        drop_subtitles = plan.get('drop_subtitles')
+        if not clear_metadata and not drop_subtitles:
+            return None
+        # 只需清元数据时先尝试头部原地改写，O(头部大小) 而不是 O(文件大小)
+        if clear_metadata and not drop_subtitles and self.clear_tags_in_place(source, plan.get('meta_hits') or []):
+            return source
+        actions = []
+        if clear_metadata: actions.append("元数据")
+        if drop_subtitles: actions.append(f"字幕轨 {', '.join('#' + idx for idx in drop_subtitles)}")
+        self.log(f"🧹 执行清洗 (单次重封装): {' + '.join(actions)}")
+        if not self.wait_for_resources('remux', source, os.path.getsize(source)):
+            return None
+
+        dir_name = os.path.dirname(source);
+        name, ext = os.path.splitext(os.path.basename(source))
+        output = os.path.join(dir_name, f"{name}_clean{ext}" if drop_subtitles else f"{name}_clean_meta{ext}")
+        cmd = ['ffmpeg', '-err_detect', 'ignore_err', '-i', source, '-map', '0:v:0']
+        cmd.extend(self.get_safe_audio_map_args(source))
+        if drop_subtitles:
+            for idx in plan.get('keep_subtitles', []):
+                cmd.extend(['-map', f'0:{idx}'])
+        else:
+            cmd.extend(['-map', '0:s?'])
+        cmd.extend(['-c', 'copy', '-dn', '-ignore_unknown'])
+        if clear_metadata:
+            cmd.extend(['-strict', '-2', '-map_metadata', '-1',
+                        '-metadata', 'title=', '-metadata', 'comment=',
+                        '-metadata', 'description=', '-metadata', 'synopsis=',
+                        '-metadata', 'artist=', '-metadata', 'album=', '-metadata', 'copyright=',
+                        '-metadata:s', 'title=', '-metadata:s', 'handler_name='])
+        cmd.extend(['-y', output])
+        started_at = time.time()
+        res = self.run_ffmpeg(cmd, scaled_timeout(source, passes=2, minimum=120), stall_timeout=REMUX_STALL_SECONDS)
+        if res and res.returncode == 0 and self.verify_integrity(output):
+            # 同卷读一遍写一遍，按两倍体积计入吞吐
+            record_transfer(source, 2 * os.path.getsize(output), time.time() - started_at)
+            if drop_subtitles:
                 os.remove(source);
-                self.log(f"✅ 字幕清洗完成");
-                return output
+                invalidate_media_probe(source)
             else:
-                if os.path.exists(output): os.remove(output)
+                shutil.move(output, source);
+                invalidate_media_probe(output, source)
+                output = source
+            # 重封装整读一遍源文件、整写一遍成品，成品页缓存随本任务一起释放
+            self.track_file(output)
+            if clear_metadata: self.log("✅ 元数据已清洗")
+            if drop_subtitles: self.log(f"✅ 字幕清洗完成");
+            return output
+        invalidate_media_probe(output)
+        if os.path.exists(output): os.remove(output)
         return None
 
-    def scan_one_audio_task(self, file_path, task_id, audio_map, audio_keywords, enable_local, config, task):
+    def sanitize_metadata(self, source, meta_keywords):
+        plan = self.plan_metadata_sanitize(source, meta_keywords, {})
+        self.apply_remux_plan(source, plan)
+
+    def check_subtitles(self, source, sub_keywords):
+        plan = self.plan_subtitle_strip(source, sub_keywords, {})
+        if not plan.get('drop_subtitles'):
+            return None
+        return self.apply_remux_plan(source, plan)
+
+    def scan_one_audio_task(self, file_path, task_id, audio_map, audio_keywords, enable_local, config, task, defer_local=False):
         try:
             CLOUD_MAX_DURATION = max(0, int(config.get('cloud_asr_max_duration', 60)))
         except:
@@ -959,14 +1878,8 @@ class ScannerCore:
             return {"status": "cancelled"}
 
         temp_audio, temp_meta = self.get_audio_cache_paths(task_id, task['name'])
-        min_audio_duration = min(5.0, max(1.0, float(task['duration']) * 0.05))
-        extract_tasks = [task]
-        if '片尾' in str(task['name']) and task['start'] > 0:
-            fallback_start = max(0, task['start'] - task['duration'])
-            if fallback_start < task['start']:
-                fallback_task = dict(task)
-                fallback_task['start'] = fallback_start
-                extract_tasks.append(fallback_task)
+        min_audio_duration = self.get_min_audio_duration(task)
+        extract_tasks = self.get_audio_extract_candidates(task)
 
         cache_meta = None
         reused = False
@@ -1006,6 +1919,13 @@ class ScannerCore:
                 raise RuntimeError(f"音频提取失败: {task['name']}")
             self.write_audio_cache_meta(temp_meta, cache_meta)
 
+        speech_spans = self.detect_audio_speech(temp_audio, task) if config.get('enable_audio_vad', True) else None
+        if speech_spans == []:
+            self.log(f"🔇 VAD 预筛: 段 {task['name']} 未检测到语音，跳过识别")
+            self.remove_audio_cache(temp_audio, temp_meta, self.get_cloud_flac_path(temp_audio))
+            return {"status": "passed", "segment": task['name']}
+
+        asr_cache = get_transcript_cache(config)
         cloud_success = False
         cloud_audio = None
         cloud_artifacts = []
@@ -1021,28 +1941,47 @@ class ScannerCore:
                 data = {"model": config.get('api_model'), "language": "zh", "response_format": "json"}
                 api_keys = self.get_cloud_api_keys(config)
                 cloud_global_limit = self.get_cloud_asr_concurrency(config)
+                cloud_identity = self.get_cloud_transcript_identity(config)
 
-                def submit_cloud_audio(source_audio, label=None, log_request=True):
+                def submit_cloud_audio(source_audio, label=None, log_request=True, payload=None, cancel_event=None):
                     nonlocal cloud_audio
                     runtime_config = self.get_runtime_cloud_asr_config(config)
                     cloud_proxies = self.get_cloud_asr_proxies(runtime_config)
-                    cloud_audio, cloud_mime = self.prepare_cloud_audio(source_audio, config.get('asr_use_flac'), quiet=not log_request)
-                    if not cloud_audio:
-                        raise RuntimeError("ASR 音频无有效时长")
-                    if cloud_audio != source_audio:
-                        cloud_artifacts.append(cloud_audio)
-                    cloud_size = os.path.getsize(cloud_audio) if os.path.exists(cloud_audio) else 0
+                    if payload:
+                        # 内存切块: (文件名, WAV 字节)，FLAC 经管道编码，不落盘
+                        payload_name, payload_body = payload
+                        cloud_mime = None
+                        if config.get('asr_use_flac'):
+                            flac_body = self.encode_flac_bytes(payload_body, cancel_event=cancel_event)
+                            if cancel_event is not None and cancel_event.is_set():
+                                raise RuntimeError("云端识别已停止")
+                            if flac_body:
+                                payload_name = f"{os.path.splitext(payload_name)[0]}.flac"
+                                payload_body = flac_body
+                                cloud_mime = 'audio/flac'
+                        cloud_size = len(payload_body)
+                    else:
+                        cloud_audio, cloud_mime = self.prepare_cloud_audio(source_audio, config.get('asr_use_flac'), quiet=not log_request)
+                        if not cloud_audio:
+                            raise RuntimeError("ASR 音频无有效时长")
+                        if cloud_audio != source_audio:
+                            cloud_artifacts.append(cloud_audio)
+                        cloud_size = os.path.getsize(cloud_audio) if os.path.exists(cloud_audio) else 0
                     source_type = 'FLAC' if cloud_mime else 'WAV'
                     label_text = f" [{label}]" if label else ""
                     if log_request:
                         if cloud_proxies:
                             self.log("☁️ 云端音频上传代理已启用")
                         self.log(f"☁️ 云端识别中{label_text}... (source={source_type}, timeout=上传{upload_timeout}s/识别{read_timeout}s, size={cloud_size / 1048576:.1f}MB)")
-                    api_key = self.acquire_cloud_asr_slot(api_keys, cloud_global_limit)
+                    api_key = self.acquire_cloud_asr_slot(api_keys, cloud_global_limit, cancel_event=cancel_event)
                     if not api_key:
                         raise RuntimeError("云端识别已停止")
                     try:
                         headers = {"Authorization": f"Bearer {api_key}"}
+                        if payload:
+                            files = {"file": (payload_name, payload_body, cloud_mime) if cloud_mime else (payload_name, payload_body)}
+                            return requests.post(config.get('api_url'), headers=headers, files=files, data=data,
+                                                 timeout=(upload_timeout, read_timeout), proxies=cloud_proxies)
                         with open(cloud_audio, "rb") as f:
                             if cloud_mime:
                                 files = {"file": (os.path.basename(cloud_audio), f, cloud_mime)}
@@ -1053,7 +1992,7 @@ class ScannerCore:
                     finally:
                         self.release_cloud_asr_slot(api_key)
 
-                actual_audio_duration = self.get_media_duration(temp_audio) or float(task['duration'])
+                actual_audio_duration = PcmSegment.read_duration(temp_audio) or self.get_media_duration(temp_audio) or float(task['duration'])
                 if CLOUD_MAX_DURATION and actual_audio_duration > CLOUD_MAX_DURATION:
                     cloud_chunked = True
                     chunks = []
@@ -1068,47 +2007,144 @@ class ScannerCore:
                         chunk_start += chunk_step
 
                     self.log(f"☁️ 云端切块识别 [{task['name']}]: {actual_audio_duration:.1f}s -> {len(chunks)}块，每块≤{CLOUD_MAX_DURATION}s，重叠{chunk_overlap:.0f}s")
-                    chunk_statuses = []
-                    chunk_base, _ = os.path.splitext(temp_audio)
-                    for chunk_idx, (chunk_start, chunk_duration) in enumerate(chunks, 1):
-                        chunk_audio = f"{chunk_base}_cloud_part{chunk_idx:02d}.wav"
-                        chunk_flac = self.get_cloud_flac_path(chunk_audio)
-                        cloud_artifacts.extend([chunk_audio, chunk_flac])
-                        self.remove_audio_cache(chunk_audio, chunk_flac)
-                        if not self.extract_cloud_audio_chunk(temp_audio, chunk_start, chunk_duration, chunk_audio):
-                            chunk_statuses.append(f"{chunk_idx}/{len(chunks)}提取失败")
-                            self.log(f"⚠️ 云端切块失败 [{task['name']}]: {' '.join(chunk_statuses)}")
-                            raise RuntimeError(f"云端切块音频提取失败: {chunk_idx}/{len(chunks)}")
-                        resp = submit_cloud_audio(chunk_audio, f"{task['name']} {chunk_idx}/{len(chunks)}", log_request=False)
+                    chunk_total = len(chunks)
+                    chunk_base = os.path.basename(os.path.splitext(temp_audio)[0])
+                    chunk_results = {}
+                    failed_idx = None
+                    dirty_result = None
+                    silent_chunks = set()
+                    if speech_spans:
+                        silent_chunks = {
+                            chunk_idx for chunk_idx, (chunk_start, chunk_duration) in enumerate(chunks, 1)
+                            if not any(span_start < chunk_start + chunk_duration and span_end > chunk_start
+                                       for span_start, span_end in speech_spans)
+                        }
+                        if silent_chunks:
+                            self.log(f"🔇 VAD 预筛 [{task['name']}]: 跳过无语音块 "
+                                     f"{' '.join(f'{idx}/{chunk_total}' for idx in sorted(silent_chunks))}")
+                    cancel_event = threading.Event()
+                    pcm_lock = threading.Lock()
+                    pcm = PcmSegment(temp_audio)
+
+                    def submit_chunk(chunk_idx):
+                        chunk_start, chunk_duration = chunks[chunk_idx - 1]
+                        cache_key = None
+                        if asr_cache:
+                            with pcm_lock:
+                                if cancel_event.is_set() or pcm is None:
+                                    return None
+                                cache_key = TranscriptCache.make_key(pcm.digest(chunk_start, chunk_duration), cloud_identity)
+                            cached_text = asr_cache.get(cache_key)
+                            if cached_text is not None:
+                                return {'status_code': 200, 'text': cached_text, 'cached': True}
+                        # 切块字节在提交前才生成，内存只保留在途请求
+                        with pcm_lock:
+                            if cancel_event.is_set() or pcm is None:
+                                return None
+                            chunk_body = pcm.wav_bytes(chunk_start, chunk_duration)
+                        try:
+                            resp = submit_cloud_audio(None, f"{task['name']} {chunk_idx}/{chunk_total}", log_request=False,
+                                                      payload=(f"{chunk_base}_cloud_part{chunk_idx:02d}.wav", chunk_body),
+                                                      cancel_event=cancel_event)
+                        except RuntimeError:
+                            if cancel_event.is_set():
+                                return None
+                            raise
                         if resp.status_code != 200:
-                            c, m = self.get_retry_attempt_label(config)
-                            chunk_statuses.append(f"{chunk_idx}/{len(chunks)}×{resp.status_code}")
-                            self.log(f"⚠️ 云端切块失败 [{task['name']}] (第{c}/{m}次): {' '.join(chunk_statuses)}")
-                            cloud_success = False
-                            break
+                            return {'status_code': resp.status_code}
+                        chunk_text = self.clean_transcription(resp.json().get('text', ''))
+                        if cache_key:
+                            asr_cache.put(cache_key, chunk_text)
+                        return {'status_code': 200, 'text': chunk_text}
 
-                        text = self.clean_transcription(resp.json().get('text', ''))
-                        hit, reason = self.check_keywords(text, audio_keywords)
-                        if hit:
-                            hit_text = text or '<空>'
-                            chunk_statuses.append(f"{chunk_idx}/{len(chunks)} 命中 {hit_text}")
-                            self.log(f"☁️ 云端切块命中 [{task['name']}]: {' '.join(chunk_statuses)}")
-                            self.log(f"☁️ [违规] 段 {task['name']} 块 {chunk_idx}/{len(chunks)} 内容: {text}")
-                            self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
-                            return {"status": "dirty", "reason": reason, "segment": task['name']}
-                        if config.get('detailed_mode'):
-                            chunk_text = text or '<空>'
-                            chunk_statuses.append(f"{chunk_idx}/{len(chunks)} {chunk_text}")
+                    chunk_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(chunk_total, cloud_global_limit)))
+                    try:
+                        chunk_futures = {chunk_executor.submit(submit_chunk, chunk_idx): chunk_idx
+                                         for chunk_idx in range(1, chunk_total + 1) if chunk_idx not in silent_chunks}
+                        while chunk_futures and not self._stopped:
+                            done, _ = concurrent.futures.wait(
+                                chunk_futures.keys(), timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED
+                            )
+                            for future in done:
+                                chunk_idx = chunk_futures.pop(future)
+                                result = future.result()
+                                if result is None:
+                                    continue
+                                chunk_results[chunk_idx] = result
+                                if result['status_code'] != 200:
+                                    failed_idx = failed_idx or chunk_idx
+                                    continue
+                                hit, reason = self.check_keywords(result['text'], audio_keywords)
+                                if hit and not dirty_result:
+                                    result['hit'] = True
+                                    dirty_result = {"status": "dirty", "reason": reason, "segment": task['name']}
+                            if dirty_result or failed_idx:
+                                break
+                    finally:
+                        # cancel_futures 只取消排队中的块；在途块靠 cancel_event 退出，编码子进程在此一并结束
+                        cancel_event.set()
+                        self._kill_pipe_procs(cancel_event)
+                        chunk_executor.shutdown(wait=False, cancel_futures=True)
+                        with pcm_lock:
+                            pcm.close()
+                            pcm = None
+
+                    chunk_statuses = []
+                    for chunk_idx in sorted(set(chunk_results) | silent_chunks):
+                        result = chunk_results.get(chunk_idx)
+                        if result is None:
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total}🔇")
+                        elif result['status_code'] != 200:
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total}×{result['status_code']}")
+                        elif result.get('hit'):
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total} 命中 {result['text'] or '<空>'}")
+                        elif config.get('detailed_mode'):
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total} {result['text'] or '<空>'}")
+                        elif result.get('cached'):
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total}♻️")
                         else:
-                            chunk_statuses.append(f"{chunk_idx}/{len(chunks)}✓")
-                    else:
+                            chunk_statuses.append(f"{chunk_idx}/{chunk_total}✓")
+
+                    if dirty_result:
+                        hit_idx = next(idx for idx, result in chunk_results.items() if result.get('hit'))
+                        self.log(f"☁️ 云端切块命中 [{task['name']}]: {' '.join(chunk_statuses)}")
+                        self.log(f"☁️ [违规] 段 {task['name']} 块 {hit_idx}/{chunk_total} 内容: {chunk_results[hit_idx]['text']}")
+                    elif failed_idx:
+                        c, m = self.get_retry_attempt_label(config)
+                        self.log(f"⚠️ 云端切块失败 [{task['name']}] (第{c}/{m}次): {' '.join(chunk_statuses)}")
+                    elif not self._stopped:
                         cloud_success = True
+                    if dirty_result:
+                        self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
+                        return dirty_result
                     if cloud_success:
                         self.log(f"✅ 云端切块识别通过 [{task['name']}]: {' '.join(chunk_statuses)}")
                 else:
-                    resp = submit_cloud_audio(temp_audio, task['name'])
-                    if resp.status_code == 200:
+                    speech_range = None
+                    if speech_spans:
+                        trim_start = max(0.0, speech_spans[0][0] - type(self).VAD_TRIM_PADDING)
+                        trim_end = min(actual_audio_duration, speech_spans[-1][1] + type(self).VAD_TRIM_PADDING)
+                        if actual_audio_duration - (trim_end - trim_start) >= 1.0:
+                            self.log(f"🔇 VAD 预筛 [{task['name']}]: 裁掉首尾无语音 {trim_start:.1f}s - {trim_end:.1f}s / {actual_audio_duration:.1f}s")
+                            speech_range = (trim_start, trim_end - trim_start)
+                    cache_key = None
+                    if asr_cache:
+                        cache_key = self.get_transcript_cache_key(temp_audio, cloud_identity, *(speech_range or (0.0, None)))
+                    text = asr_cache.get(cache_key) if cache_key else None
+                    resp = None
+                    if text is not None:
+                        self.log(f"♻️ 转写缓存命中 [{task['name']}]，跳过云端请求")
+                    elif speech_range:
+                        with PcmSegment(temp_audio) as pcm:
+                            speech_payload = (os.path.basename(temp_audio), pcm.wav_bytes(*speech_range))
+                        resp = submit_cloud_audio(None, task['name'], payload=speech_payload)
+                    else:
+                        resp = submit_cloud_audio(temp_audio, task['name'])
+                    if resp is not None and resp.status_code == 200:
                         text = self.clean_transcription(resp.json().get('text', ''))
+                        if cache_key:
+                            asr_cache.put(cache_key, text)
+                    if text is not None:
                         hit, reason = self.check_keywords(text, audio_keywords)
                         if hit:
                             self.log(f"☁️ [违规] 段 {task['name']} 内容: {text}")
@@ -1149,44 +2185,59 @@ class ScannerCore:
                     self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
                 raise RuntimeError(f"云端失败且策略限制本地模型 -> 请求重排队")
 
-            local_limit = self.get_local_model_concurrency(config)
-            self.log(f"⏳ 等待本地模型资源槽... (并发上限 {local_limit})")
-            active_slots = self.acquire_local_inference_slot(local_limit)
-            if not active_slots:
-                return {"status": "cancelled"}
-            try:
-                if self._stopped:
+            local_key = self.get_transcript_cache_key(temp_audio, self.get_local_transcript_identity()) if asr_cache else None
+            text = asr_cache.get(local_key) if local_key else None
+            if text is not None:
+                self.log(f"♻️ 转写缓存命中 [{task['name']}]，跳过本地推理")
+                dur = 0.0
+            elif defer_local:
+                # 交给 run_audio_pending_tasks 合批推理，保留提取好的音频
+                self.remove_audio_cache(*[path for path in (cloud_audio, *cloud_artifacts) if path != temp_audio])
+                self.log(f"📦 段 {task['name']} 转入本地批量推理")
+                return {"status": "local_pending", "segment": task['name'], "audio": temp_audio, "meta": temp_meta,
+                        "duration": task['duration'], "cache_key": local_key}
+            else:
+                local_limit = self.get_local_model_concurrency(config)
+                self.log(f"⏳ 等待本地模型资源槽... (并发上限 {local_limit})")
+                active_slots = self.acquire_local_inference_slot(local_limit)
+                if not active_slots:
                     return {"status": "cancelled"}
-
-                self.log(f"🔒 获得本地模型资源槽 ({active_slots}/{local_limit})，本地 GGUF 推理中...")
-                self.drop_caches()
-
                 try:
-                    st = time.time();
-                    text = self.run_local_sensevoice_gguf(temp_audio, task['duration'])
-                    dur = time.time() - st
-
-                    hit, reason = self.check_keywords(text, audio_keywords)
-                    if hit:
-                        self.log(f"🏠 [违规] 本地内容: {text}")
-                        self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
-                        return {"status": "dirty", "reason": f"本地拦截: {reason}", "segment": task['name']}
+                    if self._stopped:
+                        return {"status": "cancelled"}
 
-                    if config.get('detailed_mode'):
-                        self.log(f"✅ [通过] 本地内容: {text or '<空>'}")
-                    elif not text:
-                        self.log(f"✅ 本地识别无文本，按无关键词通过 ({dur:.1f}s)")
-                    else:
-                        self.log(f"✅ 本地识别通过 ({dur:.1f}s)")
+                    self.log(f"🔒 获得本地模型资源槽 ({active_slots}/{local_limit})，本地 GGUF 推理中...")
+                    self.release_memory(config)
 
-                except Exception as e:
-                    self.log(f"❌ 本地模型崩溃: {e}")
-                    self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
-                    raise RuntimeError(f"本地模型失败: {e}")
-            finally:
-                self.drop_caches()
-                remaining_slots = self.release_local_inference_slot()
-                self.log(f"🧹 [系统] 本地 GGUF 推理资源已释放 (运行中 {remaining_slots}/{local_limit})")
+                    try:
+                        st = time.time();
+                        text = self.run_local_sensevoice_gguf(temp_audio, task['duration'])
+                        dur = time.time() - st
+                    except Exception as e:
+                        self.log(f"❌ 本地模型崩溃: {e}")
+                        self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
+                        raise RuntimeError(f"本地模型失败: {e}")
+                finally:
+                    # 推理读完后再登记本段音频，之前的 release_memory 不会把它从页缓存里踢掉
+                    self.track_file(temp_audio)
+                    self.release_memory(config)
+                    remaining_slots = self.release_local_inference_slot()
+                    self.log(f"🧹 [系统] 本地 GGUF 推理资源已释放 (运行中 {remaining_slots}/{local_limit})")
+                if local_key:
+                    asr_cache.put(local_key, text)
+
+            hit, reason = self.check_keywords(text, audio_keywords)
+            if hit:
+                self.log(f"🏠 [违规] 本地内容: {text}")
+                self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
+                return {"status": "dirty", "reason": f"本地拦截: {reason}", "segment": task['name']}
+
+            if config.get('detailed_mode'):
+                self.log(f"✅ [通过] 本地内容: {text or '<空>'}")
+            elif not text:
+                self.log(f"✅ 本地识别无文本，按无关键词通过 ({dur:.1f}s)")
+            else:
+                self.log(f"✅ 本地识别通过 ({dur:.1f}s)")
 
         self.remove_audio_cache(temp_audio, temp_meta, cloud_audio, *cloud_artifacts)
         return {"status": "passed", "segment": task['name']}
@@ -1214,20 +2265,35 @@ class ScannerCore:
                 checkpoint_cb(seg_name, 'failed', reason)
             self.log(f"🟥 音频段红灯: {seg_name} -> {reason}")
 
+        # 多段且启用本地模型时，云端失败/停用的段先收集起来，最后合批本地推理
+        defer_local = bool(enable_local) and len(pending) > 1
+        local_pending = []
+
+        def discard_local_pending():
+            for item in local_pending:
+                self.remove_audio_cache(item['audio'], item['meta'])
+
         if worker_limit <= 1:
             for _, task in pending:
                 if self._stopped:
                     return False, None
                 try:
-                    result = self.scan_one_audio_task(file_path, task_id, audio_map, audio_keywords, enable_local, config, task)
+                    result = self.scan_one_audio_task(file_path, task_id, audio_map, audio_keywords, enable_local, config, task,
+                                                      defer_local=defer_local)
                 except Exception as e:
                     mark_failed(task['name'], str(e))
                     raise
                 if result.get('status') == 'cancelled':
                     return False, None
                 if result.get('status') == 'dirty':
+                    discard_local_pending()
                     return True, result.get('reason')
+                if result.get('status') == 'local_pending':
+                    local_pending.append(result)
+                    continue
                 mark_passed(task['name'])
+            if local_pending:
+                return self.run_local_audio_batches(task_id, local_pending, audio_keywords, config, mark_passed, mark_failed)
             return False, None
 
         self.log(f"🚦 同任务音频并发: {len(pending)}段待测，最多{worker_limit}段同时识别；全部绿灯后通过")
@@ -1241,18 +2307,14 @@ class ScannerCore:
                     break
 
         def run_child(task):
-            child = ScannerCore(logger_callback=lambda msg: log_queue.put(msg), task_id=self.task_id,
-                                root_dir_name=self.root_dir_name, rclone_remote=self.rclone_remote,
-                                config_refresh_callback=self.config_refresh_callback)
-            child.prog_cb = lambda p, s, e: None
-            child.cloud_asr_session_token = self.cloud_asr_session_token
-            child.local_inference_session_token = self.local_inference_session_token
-            self._register_child_core(child)
+            child = self.spawn_child_core(lambda msg: log_queue.put(msg))
+            child._inference_gate = self._inference_gate
             try:
                 if self._stopped:
                     child.stop()
                     return {"status": "cancelled", "segment": task['name']}
-                return child.scan_one_audio_task(file_path, task_id, audio_map, audio_keywords, enable_local, config, task)
+                return child.scan_one_audio_task(file_path, task_id, audio_map, audio_keywords, enable_local, config, task,
+                                                 defer_local=defer_local)
             finally:
                 self._unregister_child_core(child)
 
@@ -1292,6 +2354,9 @@ class ScannerCore:
                         dirty_result = dirty_result or result
                         self.log(f"🚫 音频段命中: {result.get('segment') or task['name']}")
                         continue
+                    if result.get('status') == 'local_pending':
+                        local_pending.append(result)
+                        continue
                     mark_passed(result.get('segment') or task['name'])
 
                 if dirty_result:
@@ -1303,15 +2368,196 @@ class ScannerCore:
                         child.stop()
                     concurrent.futures.wait(future_map.keys())
                     flush_child_logs()
+                    discard_local_pending()
                     return True, dirty_result.get('reason')
 
             flush_child_logs()
             if first_error:
                 raise first_error
-            return False, None
         finally:
             executor.shutdown(wait=True, cancel_futures=True)
             flush_child_logs()
+        if local_pending:
+            return self.run_local_audio_batches(task_id, local_pending, audio_keywords, config, mark_passed, mark_failed)
+        return False, None
+
+    def spawn_child_core(self, logger_callback):
+        child = ScannerCore(logger_callback=logger_callback, task_id=self.task_id,
+                            root_dir_name=self.root_dir_name, rclone_remote=self.rclone_remote,
+                            config_refresh_callback=self.config_refresh_callback)
+        child.prog_cb = lambda p, s, e: None
+        child.hint_cb = self.hint_cb
+        child.file_in_use_cb = self.file_in_use_cb
+        child.cloud_asr_session_token = self.cloud_asr_session_token
+        child.local_inference_session_token = self.local_inference_session_token
+        self._register_child_core(child)
+        return child
+
+    def plan_local_audio_batches(self, local_pending, local_limit):
+        # 批数取本地并发上限，且单批总时长不超过 LOCAL_BATCH_MAX_DURATION；按原顺序连续切分
+        total_duration = sum(float(item['duration'] or 0) for item in local_pending)
+        batch_count = max(min(local_limit, len(local_pending)),
+                          int(math.ceil(total_duration / type(self).LOCAL_BATCH_MAX_DURATION)))
+        batch_count = max(1, min(batch_count, len(local_pending)))
+        size, extra = divmod(len(local_pending), batch_count)
+        batches = []
+        pos = 0
+        for idx in range(batch_count):
+            step = size + (1 if idx < extra else 0)
+            batches.append(local_pending[pos:pos + step])
+            pos += step
+        return batches
+
+    def run_local_audio_batch(self, core, task_id, batch_idx, items, local_limit, config):
+        batch_audio = None
+        offsets = None
+        if len(items) > 1:
+            batch_audio, _ = self.get_audio_cache_paths(task_id, f"local_batch{batch_idx}")
+            offsets = self.write_local_batch_audio(batch_audio, items)
+            if not offsets:
+                self.remove_audio_cache(batch_audio)
+                raise RuntimeError("批内音频格式不一致，无法合批")
+            audio_path = batch_audio
+            batch_duration = offsets[-1][2]
+        else:
+            audio_path = items[0]['audio']
+            batch_duration = items[0]['duration']
+        names = ", ".join(item['segment'] for item in items)
+        # 合批推理是最重的一步，每批各做一次准入检查
+        if not core.wait_for_resources('inference'):
+            self.remove_audio_cache(batch_audio)
+            return None
+        active_slots = core.acquire_local_inference_slot(local_limit, admitted=True)
+        if not active_slots:
+            self.remove_audio_cache(batch_audio)
+            return None
+        try:
+            core.log(f"🔒 获得本地模型资源槽 ({active_slots}/{local_limit})，批次{batch_idx} 推理中: {names} ({batch_duration:.0f}s)")
+            st = time.time()
+            output = core.run_local_sensevoice_output(audio_path, batch_duration)
+            dur = time.time() - st
+        finally:
+            self.remove_audio_cache(batch_audio)
+            core.track_file(*(item['audio'] for item in items))
+            core.release_memory(config)
+            remaining_slots = core.release_local_inference_slot()
+            core.log(f"🧹 [系统] 本地 GGUF 推理资源已释放 (运行中 {remaining_slots}/{local_limit})")
+        if offsets is None:
+            return {"items": items, "texts": {items[0]['segment']: self.clean_transcription(output)}, "duration": dur}
+        return {"items": items, "texts": self.split_local_asr_output(output, offsets),
+                "text": self.clean_transcription(output), "duration": dur}
+
+    def run_local_audio_batches(self, task_id, local_pending, audio_keywords, config, mark_passed, mark_failed):
+        local_limit = self.get_local_model_concurrency(config)
+        batches = self.plan_local_audio_batches(local_pending, local_limit)
+        self.log(f"📦 本地批量推理: {len(local_pending)}段 -> {len(batches)}批，每批一次模型加载 (并发上限 {local_limit})")
+        asr_cache = get_transcript_cache(config)
+        log_queue = queue.Queue()
+
+        def flush_child_logs():
+            while True:
+                try:
+                    self.log_cb(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+        def run_batch(batch_idx, items):
+            if len(batches) == 1:
+                return self.run_local_audio_batch(self, task_id, batch_idx, items, local_limit, config)
+            child = self.spawn_child_core(lambda msg: log_queue.put(msg))
+            try:
+                if self._stopped:
+                    child.stop()
+                    return None
+                return self.run_local_audio_batch(child, task_id, batch_idx, items, local_limit, config)
+            finally:
+                self._unregister_child_core(child)
+
+        def discard(items):
+            for item in items:
+                self.remove_audio_cache(item['audio'], item['meta'])
+
+        first_error = None
+        dirty_reason = None
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(batches))
+        try:
+            future_map = {executor.submit(run_batch, idx, items): items for idx, items in enumerate(batches, 1)}
+            while future_map:
+                done, _ = concurrent.futures.wait(
+                    future_map.keys(), timeout=0.5, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                flush_child_logs()
+                if self._stopped:
+                    for future in future_map:
+                        future.cancel()
+                    return False, None
+                for future in done:
+                    items = future_map.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self.log(f"❌ 本地模型崩溃: {e}")
+                        first_error = first_error or RuntimeError(f"本地模型失败: {e}")
+                        for item in items:
+                            mark_failed(item['segment'], str(e))
+                        discard(items)
+                        continue
+                    if result is None:
+                        return False, None
+
+                    texts = result['texts']
+                    if texts is None:
+                        # 输出无时间戳无法拆回各段：整批作为一个单元判定
+                        names = ", ".join(item['segment'] for item in items)
+                        hit, reason = self.check_keywords(result['text'], audio_keywords)
+                        if hit:
+                            self.log(f"🏠 [违规] 本地批次 [{names}] 内容: {result['text']}")
+                            dirty_reason = dirty_reason or f"本地拦截: {reason}"
+                        else:
+                            if config.get('detailed_mode'):
+                                self.log(f"✅ [通过] 本地批次 [{names}] 内容: {result['text'] or '<空>'}")
+                            else:
+                                self.log(f"✅ 本地批次识别通过 [{names}] ({result['duration']:.1f}s)")
+                            for item in items:
+                                mark_passed(item['segment'])
+                        discard(items)
+                        continue
+
+                    for item in items:
+                        text = texts.get(item['segment'], '')
+                        # texts 非空说明批内每个文本行都解析出了时间戳，拆出的逐段文本才可信，可以写缓存
+                        if asr_cache and item.get('cache_key'):
+                            asr_cache.put(item['cache_key'], text)
+                        hit, reason = self.check_keywords(text, audio_keywords)
+                        if hit:
+                            self.log(f"🏠 [违规] 段 {item['segment']} 本地内容: {text}")
+                            dirty_reason = dirty_reason or f"本地拦截: {reason}"
+                            continue
+                        if config.get('detailed_mode'):
+                            self.log(f"✅ [通过] 段 {item['segment']} 本地内容: {text or '<空>'}")
+                        else:
+                            self.log(f"✅ 本地识别通过 [{item['segment']}]")
+                        mark_passed(item['segment'])
+                    discard(items)
+
+                if dirty_reason:
+                    for future in future_map:
+                        future.cancel()
+                    with self._child_lock:
+                        children = list(self._child_cores)
+                    for child in children:
+                        child.stop()
+                    concurrent.futures.wait(future_map.keys())
+                    flush_child_logs()
+                    for items in future_map.values():
+                        discard(items)
+                    return True, dirty_reason
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            flush_child_logs()
+        if first_error:
+            raise first_error
+        return False, None
 
     def scan_audio_cloud_fallback_local(self, file_path, duration, task_id, audio_map, audio_keywords, enable_local,
                                         config, passed_segments=None, checkpoint_cb=None):
@@ -1347,6 +2593,10 @@ class ScannerCore:
         if not pending:
             return False, None
 
+        self.prefetch_audio_segments(file_path, task_id, audio_map, [task for _, task in pending])
+        if self._stopped:
+            return False, None
+
         session_token = None
         local_session_token = None
         previous_token = self.cloud_asr_session_token
@@ -1375,6 +2625,7 @@ class ScannerCore:
     def process_file(self, file_path, config, keywords_config, passed_segments=None, checkpoint_cb=None,
                      rename_cb=None):
         if self._stopped: return {"status": "cancelled"}
+        admission_controller.update_limits(config)
         try:
             if config.get('direct_upload'):
                 self.log("⏩ 直传模式")
@@ -1389,26 +2640,29 @@ class ScannerCore:
                 self.log(f"⏩ 非视频文件 ({ext}) -> 跳过检测，直接上传")
                 return {"status": "ready_to_upload"}
 
+            # 元数据与字幕只生成清洗计划，最后一次重封装统一落盘
+            remux_plan = {}
             if self._stopped: return {"status": "cancelled"}
-            if config.get('sanitize_metadata'): self.sanitize_metadata(current_path, keywords_config.get('meta', []))
+            if config.get('sanitize_metadata'): self.plan_metadata_sanitize(current_path, keywords_config.get('meta', []), remux_plan)
             self.prog_cb(10, "元数据处理完毕", "")
 
             if self._stopped: return {"status": "cancelled"}
-            if config.get('check_subtitles'):
-                new_path = self.check_subtitles(current_path, keywords_config.get('subtitle', []))
-                if new_path:
-                    current_path = new_path
-                    if rename_cb: rename_cb(current_path)
+            if config.get('check_subtitles'): self.plan_subtitle_strip(current_path, keywords_config.get('subtitle', []), remux_plan)
+            if self._stopped: return {"status": "cancelled"}
+            new_path = self.apply_remux_plan(current_path, remux_plan)
+            if new_path and new_path != current_path:
+                current_path = new_path
+                if rename_cb: rename_cb(current_path)
             self.prog_cb(30, "字幕处理完毕", "")
 
             if self._stopped: return {"status": "cancelled"}
             if config.get('check_audio'):
-                self.drop_caches();
+                self.release_memory(config)
+                if not self.wait_for_resources('extract', current_path):
+                    return {"status": "cancelled"}
                 self.log("🔍 准备音频检测...");
                 self.prog_cb(40, "准备音频检测", "")
-                d_res = self.run_cmd(['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of',
-                                      'default=noprint_wrappers=1:nokey=1', current_path])
-                duration = float(d_res.stdout) if d_res and d_res.stdout else 0
+                duration = self.get_media_duration(current_path)
                 if duration > 0:
                     map_arg = self.get_smart_audio_map(current_path)
                     hit, reason = self.scan_audio_cloud_fallback_local(
@@ -1441,6 +2695,9 @@ class ScannerCore:
             else:
                 self.log(f"❌ 流程中断: {e}")
             return {"status": "error", "msg": err_str}
+        finally:
+            # 检测结束后把本任务读过的源文件 / 重封装成品 / 段音频移出页缓存
+            self.release_memory(config)
 
     def upload_with_progress(self, local_path, remote_path=None):
         if self._stopped: return False
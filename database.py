@@ -20,17 +20,27 @@ class Keyword(db.Model):
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255))
-    filepath = db.Column(db.String(500))
-    status = db.Column(db.String(20))
+    filepath = db.Column(db.String(500), index=True)
+    status = db.Column(db.String(20), index=True)
     progress = db.Column(db.Integer, default=0)
     log = db.Column(db.Text, default="")
-    created_at = db.Column(db.DateTime, default=datetime.now)
+    created_at = db.Column(db.DateTime, default=datetime.now, index=True)
     finished_at = db.Column(db.DateTime, nullable=True)
 
     retry_count = db.Column(db.Integer, default=0)
     overrides = db.Column(db.Text, nullable=True)
     upload_speed = db.Column(db.String(20), default="")
     upload_eta = db.Column(db.String(20), default="")
+    aria_gid = db.Column(db.String(64), index=True, nullable=True)
+
+
+# 任务日志按行追加，避免每条日志都读出整段 Task.log 再整体写回；Task.log 仅保留创建时的首行和旧数据
+class TaskLogLine(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    task_id = db.Column(db.Integer, index=True, nullable=False)
+    content = db.Column(db.Text, default="")
+    upload_marker = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
 
 
 # 🔥 修改：User 现在是数据库模型，不再是简单的类
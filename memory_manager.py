@@ -0,0 +1,64 @@
+import ctypes
+import gc
+import os
+import threading
+
+# 内存/页缓存管理：只针对本任务读写过的文件做 DONTNEED，RSS 超过水位才整理堆；
+# 不 sync、不写 /proc/sys/vm/drop_caches，不需要 root，也不影响其他 worker 和 rclone 的页缓存。
+
+try:
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = 4096
+
+try:
+    _libc = ctypes.CDLL("libc.so.6")
+except OSError:
+    _libc = None
+
+_trim_lock = threading.Lock()
+
+
+def current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except:
+        return 0
+
+
+def advise_dontneed(paths):
+    # 脏页只会被提交回写而不会被丢弃，所以无需事先 sync
+    if not hasattr(os, 'posix_fadvise'):
+        return 0
+    released = 0
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            released += 1
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    return released
+
+
+def trim_if_above(watermark_bytes):
+    # 返回 (回收前 RSS, 回收后 RSS)；未超过水位或无法读取 RSS 时返回 None
+    if not watermark_bytes or watermark_bytes <= 0:
+        return None
+    rss = current_rss_bytes()
+    if not rss or rss <= watermark_bytes:
+        return None
+    with _trim_lock:
+        gc.collect()
+        if _libc is not None:
+            try:
+                _libc.malloc_trim(0)
+            except:
+                pass
+        return rss, current_rss_bytes()
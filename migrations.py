@@ -0,0 +1,49 @@
+import json
+from sqlalchemy import text
+
+# 轻量迁移：PRAGMA user_version 记录已执行到第几步。db.create_all() 只会建缺失的表，
+# 不会给已有表加列或索引，所以对旧库的结构变更都写成这里的一步，按序号执行一次。
+
+
+def column_exists(conn, table, column):
+    return any(row[1] == column for row in conn.execute(text(f"PRAGMA table_info({table})")))
+
+
+def migrate_task_aria_gid(conn):
+    # Aria2 回调去重原先靠 overrides 文本 LIKE 全表扫描，改为独立列并回填旧任务
+    if not column_exists(conn, 'task', 'aria_gid'):
+        conn.execute(text("ALTER TABLE task ADD COLUMN aria_gid VARCHAR(64)"))
+    rows = conn.execute(text(
+        "SELECT id, overrides FROM task WHERE aria_gid IS NULL AND overrides LIKE '%\"_aria_gid\"%'"
+    )).fetchall()
+    for task_id, overrides in rows:
+        try:
+            gid = str(json.loads(overrides).get('_aria_gid') or '').strip()
+        except (TypeError, ValueError, AttributeError):
+            continue
+        if gid:
+            conn.execute(text("UPDATE task SET aria_gid = :gid WHERE id = :id"), {'gid': gid, 'id': task_id})
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_task_aria_gid ON task (aria_gid)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_task_status ON task (status)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_task_filepath ON task (filepath)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_task_created_at ON task (created_at)"))
+
+
+MIGRATIONS = [
+    (1, 'Task.aria_gid 列与 status/filepath/created_at 索引', migrate_task_aria_gid),
+]
+
+
+def run_migrations(db):
+    # 在 db.create_all() 之后、任何 Task 查询之前调用；每一步与版本号写入在同一事务里
+    with db.engine.begin() as conn:
+        current = conn.execute(text("PRAGMA user_version")).scalar() or 0
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        with db.engine.begin() as conn:
+            step(conn)
+            conn.execute(text(f"PRAGMA user_version = {int(version)}"))
+        print(f"🧱 数据库迁移 #{version}: {name}")
+        current = version
+    return current
@@ -0,0 +1,346 @@
+import re
+import zlib
+
+from tag_editor import (
+    read_ebml_header, iter_ebml_children, MAX_HEADER_BYTES, EBML_HEADER, MKV_SEGMENT, MKV_SEEKHEAD, MKV_SEEK,
+    MKV_SEEK_ID, MKV_SEEK_POSITION, MKV_INFO, MKV_TRACKS, MKV_TRACK_ENTRY, MKV_TAGS, MKV_CLUSTER,
+)
+
+# 纯 Python 的 MKV 文本字幕解复用：只读取字幕轨的 Block，其余音视频 Block 只读头部即跳过，
+# 不经 ffmpeg 转 WebVTT。遇到无法安全处理的结构返回 None，由调用方回退 ffmpeg。
+
+MKV_WRITING_APP = 0x5741
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_CODEC_ID = 0x86
+MKV_CONTENT_ENCODINGS = 0x6D80
+MKV_CONTENT_ENCODING = 0x6240
+MKV_CONTENT_COMPRESSION = 0x5034
+MKV_CONTENT_COMP_ALGO = 0x4254
+MKV_CONTENT_COMP_SETTINGS = 0x4255
+MKV_CONTENT_ENCRYPTION = 0x5035
+MKV_CUES = 0x1C53BB6B
+MKV_CUE_POINT = 0xBB
+MKV_CUE_TRACK_POSITIONS = 0xB7
+MKV_CUE_TRACK = 0xF7
+MKV_CUE_CLUSTER_POSITION = 0xF1
+MKV_SIMPLE_BLOCK = 0xA3
+MKV_BLOCK_GROUP = 0xA0
+MKV_BLOCK = 0xA1
+LEVEL1_IDS = {MKV_SEEKHEAD, MKV_INFO, MKV_TRACKS, MKV_CUES, MKV_CLUSTER, MKV_TAGS, 0x1043A770, 0x1941A469}
+TRACK_TYPE_SUBTITLE = 0x11
+
+# CodecID -> (文本格式, ffprobe codec_name 集合)
+SUBTITLE_CODECS = {
+    'S_TEXT/UTF8': ('srt', {'subrip', 'srt', 'text'}),
+    'S_TEXT/ASCII': ('srt', {'subrip', 'srt', 'text'}),
+    'S_TEXT/ASS': ('ass', {'ass', 'ssa'}),
+    'S_TEXT/SSA': ('ass', {'ass', 'ssa'}),
+    'S_ASS': ('ass', {'ass', 'ssa'}),
+    'S_SSA': ('ass', {'ass', 'ssa'}),
+    'S_TEXT/WEBVTT': ('vtt', {'webvtt'}),
+}
+ASS_OVERRIDE_RE = re.compile(r'\{[^}]*\}')
+
+
+class UnsupportedLayout(Exception):
+    pass
+
+
+def read_header_at(f, pos):
+    f.seek(pos)
+    head = f.read(12)
+    if not head:
+        return None
+    return read_ebml_header(head, 0)
+
+
+def read_body(f, pos, header_len, size):
+    if size is None or size > MAX_HEADER_BYTES:
+        raise UnsupportedLayout("元素过大")
+    f.seek(pos + header_len)
+    return f.read(size)
+
+
+def uint_value(buf, pos, header_len, size):
+    return int.from_bytes(buf[pos + header_len:pos + header_len + size], 'big')
+
+
+def parse_tracks(buf):
+    tracks = []
+    for element_id, pos, header_len, size in iter_ebml_children(buf, 0, len(buf)):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        track = {'number': None, 'type': None, 'codec': '', 'compression': None}
+        for child_id, child_pos, child_header, child_size in iter_ebml_children(buf, pos + header_len, pos + header_len + size):
+            if child_id == MKV_TRACK_NUMBER:
+                track['number'] = uint_value(buf, child_pos, child_header, child_size)
+            elif child_id == MKV_TRACK_TYPE:
+                track['type'] = uint_value(buf, child_pos, child_header, child_size)
+            elif child_id == MKV_CODEC_ID:
+                track['codec'] = bytes(buf[child_pos + child_header:child_pos + child_header + child_size]).rstrip(b'\0').decode('ascii', 'ignore')
+            elif child_id == MKV_CONTENT_ENCODINGS:
+                track['compression'] = parse_content_encodings(buf, child_pos + child_header, child_pos + child_header + child_size)
+        tracks.append(track)
+    return tracks
+
+
+def parse_content_encodings(buf, start, end):
+    # 只支持单层 zlib 压缩或头部剥离；加密或多层编码视为不支持
+    encodings = [(pos, header_len, size) for element_id, pos, header_len, size in iter_ebml_children(buf, start, end)
+                 if element_id == MKV_CONTENT_ENCODING]
+    if len(encodings) != 1:
+        raise UnsupportedLayout("多重 ContentEncoding")
+    pos, header_len, size = encodings[0]
+    compression = None
+    for element_id, child_pos, child_header, child_size in iter_ebml_children(buf, pos + header_len, pos + header_len + size):
+        if element_id == MKV_CONTENT_ENCRYPTION:
+            raise UnsupportedLayout("加密字幕")
+        if element_id == MKV_CONTENT_COMPRESSION:
+            algo = 0
+            settings = b''
+            for comp_id, comp_pos, comp_header, comp_size in iter_ebml_children(buf, child_pos + child_header, child_pos + child_header + child_size):
+                if comp_id == MKV_CONTENT_COMP_ALGO:
+                    algo = uint_value(buf, comp_pos, comp_header, comp_size)
+                elif comp_id == MKV_CONTENT_COMP_SETTINGS:
+                    settings = bytes(buf[comp_pos + comp_header:comp_pos + comp_header + comp_size])
+            if algo == 0:
+                compression = ('zlib', b'')
+            elif algo == 3:
+                compression = ('strip', settings)
+            else:
+                raise UnsupportedLayout(f"不支持的压缩算法 {algo}")
+    return compression
+
+
+def decode_payload(payload, compression):
+    if compression:
+        kind, settings = compression
+        if kind == 'zlib':
+            payload = zlib.decompress(payload)
+        else:
+            payload = settings + payload
+    return payload
+
+
+def cue_text(payload, text_format):
+    text = payload.decode('utf-8', errors='ignore')
+    if text_format == 'ass':
+        # ReadOrder,Layer,Style,Name,MarginL,MarginR,MarginV,Effect,Text
+        parts = text.split(',', 8)
+        text = parts[8] if len(parts) == 9 else text
+        text = ASS_OVERRIDE_RE.sub('', text).replace('\\N', '\n').replace('\\n', '\n').replace('\\h', ' ')
+    return text.strip()
+
+
+# 每个 Cluster 子元素只读这么多字节：够覆盖 元素头 + (BlockGroup 内) Block 头 + 轨道号 + 时间码/标志
+PEEK_BYTES = 32
+
+
+def block_track(head, offset):
+    # Block 负载前的轨道号 (EBML vint)；返回 (轨道号, 是否 lacing, 时间码/标志之后的负载偏移)
+    first = head[offset] if offset < len(head) else 0
+    length = 9 - first.bit_length() if first else 0
+    if not 1 <= length <= 8 or len(head) < offset + length + 3:
+        raise UnsupportedLayout("Block 头部无效")
+    number = first & ((1 << (8 - length)) - 1)
+    for byte in head[offset + 1:offset + length]:
+        number = (number << 8) | byte
+    return number, bool(head[offset + length + 2] & 0x06), offset + length + 3
+
+
+def read_block(f, pos, header_len, size, wanted, head=None):
+    # 只读 Block 头部判断轨道；非目标轨不读负载。head 为已读到的、从 pos 开始的字节
+    if head is None or len(head) < header_len + 12:
+        f.seek(pos)
+        head = f.read(header_len + 12)
+    number, laced, payload_offset = block_track(head[:header_len + size], header_len)
+    if number not in wanted:
+        return None, None
+    if laced:
+        raise UnsupportedLayout("字幕 Block 使用了 lacing")
+    f.seek(pos + payload_offset)
+    return number, f.read(header_len + size - payload_offset)
+
+
+def peek_group_track(head, header_len):
+    # BlockGroup 的第一个子元素通常就是 Block：直接从已读字节里取轨道号，取不到返回 None
+    try:
+        element_id, size, block_header = read_ebml_header(head, header_len)
+        if element_id != MKV_BLOCK or size is None:
+            return None
+        return block_track(head, header_len + block_header)[0]
+    except (UnsupportedLayout, ValueError, IndexError):
+        return None
+
+
+def walk_cluster(f, cluster_pos, file_end, wanted, collect):
+    # 每个子元素一次小读取：元素头和 Block 轨道号一起读出，非字幕轨直接 seek 跳过负载
+    header = read_header_at(f, cluster_pos)
+    if not header or header[0] != MKV_CLUSTER:
+        raise UnsupportedLayout("Cluster 位置无效")
+    _, size, header_len = header
+    end = file_end if size is None else min(file_end, cluster_pos + header_len + size)
+    pos = cluster_pos + header_len
+    while pos < end:
+        f.seek(pos)
+        head = f.read(PEEK_BYTES)
+        if not head:
+            break
+        element_id, child_size, child_header = read_ebml_header(head, 0)
+        if size is None and element_id in LEVEL1_IDS:
+            return pos
+        if child_size is None:
+            raise UnsupportedLayout("Cluster 子元素长度未知")
+        if element_id == MKV_SIMPLE_BLOCK:
+            number, payload = read_block(f, pos, child_header, child_size, wanted, head)
+            if number is not None:
+                collect(number, payload)
+        elif element_id == MKV_BLOCK_GROUP:
+            group_track = peek_group_track(head, child_header)
+            if group_track is not None and group_track not in wanted:
+                # 非字幕轨的 BlockGroup (带参考帧的视频等) 整组跳过，不读负载
+                pass
+            elif child_size <= 65536:
+                group = read_body(f, pos, child_header, child_size)
+                for group_id, group_pos, group_header, group_size in iter_ebml_children(group, 0, len(group)):
+                    if group_id == MKV_BLOCK:
+                        number, payload = read_block(f, pos + child_header + group_pos, group_header, group_size, wanted)
+                        if number is not None:
+                            collect(number, payload)
+            else:
+                # 超大 BlockGroup 只可能是音视频帧，按 Block 头部判定后跳过
+                block_head = read_header_at(f, pos + child_header)
+                if block_head and block_head[0] == MKV_BLOCK:
+                    number, payload = read_block(f, pos + child_header, block_head[2], block_head[1], wanted)
+                    if number is not None:
+                        collect(number, payload)
+        pos += child_header + child_size
+    return end
+
+
+def read_mkv_subtitle_texts(path, streams, expected_tracks=None):
+    # streams: [{'index': '3', 'codec': 'ass'}, ...]，index 为 ffprobe 流序号 (与 TrackEntry 顺序一致)
+    # 返回 {index: 文本}；不支持时返回 None
+    try:
+        # 无缓冲读取：遍历 Cluster 时每次 seek 只读几十字节，缓冲读会为每个 Block 白读一整块缓冲区
+        with open(path, 'rb', buffering=0) as f:
+            f.seek(0, 2)
+            file_size = f.tell()
+            header = read_header_at(f, 0)
+            if not header or header[0] != EBML_HEADER or header[1] is None:
+                return None
+            seg_pos = header[2] + header[1]
+            header = read_header_at(f, seg_pos)
+            if not header or header[0] != MKV_SEGMENT:
+                return None
+            seg_data = seg_pos + header[2]
+            seg_end = file_size if header[1] is None else min(file_size, seg_data + header[1])
+
+            level1 = {}
+            pos = seg_data
+            while pos < seg_end:
+                header = read_header_at(f, pos)
+                if not header:
+                    break
+                element_id, size, header_len = header
+                level1.setdefault(element_id, []).append(pos)
+                if element_id == MKV_CLUSTER or size is None:
+                    break
+                pos += header_len + size
+            for seek_pos in list(level1.get(MKV_SEEKHEAD, [])):
+                _, size, header_len = read_header_at(f, seek_pos)
+                buf = read_body(f, seek_pos, header_len, size)
+                for element_id, entry_pos, entry_header, entry_size in iter_ebml_children(buf, 0, len(buf)):
+                    if element_id != MKV_SEEK:
+                        continue
+                    target_id = target_pos = None
+                    for child_id, child_pos, child_header, child_size in iter_ebml_children(buf, entry_pos + entry_header, entry_pos + entry_header + entry_size):
+                        if child_id == MKV_SEEK_ID:
+                            target_id = uint_value(buf, child_pos, child_header, child_size)
+                        elif child_id == MKV_SEEK_POSITION:
+                            target_pos = seg_data + uint_value(buf, child_pos, child_header, child_size)
+                    if target_id in (MKV_TRACKS, MKV_CUES, MKV_INFO) and target_pos is not None and target_pos not in level1.get(target_id, []):
+                        level1.setdefault(target_id, []).append(target_pos)
+
+            if not level1.get(MKV_TRACKS) or not level1.get(MKV_CLUSTER):
+                return None
+            tracks_pos = level1[MKV_TRACKS][0]
+            _, size, header_len = read_header_at(f, tracks_pos)
+            tracks = parse_tracks(read_body(f, tracks_pos, header_len, size))
+            if expected_tracks is not None and expected_tracks != len(tracks):
+                return None
+
+            wanted = {}
+            for stream in streams:
+                try:
+                    track = tracks[int(stream['index'])]
+                except (ValueError, IndexError):
+                    return None
+                codec = SUBTITLE_CODECS.get(track['codec'])
+                if track['type'] != TRACK_TYPE_SUBTITLE or not codec or (stream.get('codec') or '') not in codec[1]:
+                    return None
+                wanted[track['number']] = (stream['index'], codec[0], track['compression'])
+
+            writing_app = ''
+            for info_pos in level1.get(MKV_INFO, []):
+                _, size, header_len = read_header_at(f, info_pos)
+                info = read_body(f, info_pos, header_len, size)
+                for element_id, child_pos, child_header, child_size in iter_ebml_children(info, 0, len(info)):
+                    if element_id == MKV_WRITING_APP:
+                        writing_app = bytes(info[child_pos + child_header:child_pos + child_header + child_size]).decode('utf-8', 'ignore')
+
+            # mkvmerge 默认为字幕轨的每个 Block 建立 Cue，此时只访问 Cues 指到的 Cluster；
+            # 其他封装器的 Cues 通常只索引视频关键帧，必须顺序遍历全部 Cluster (只读 Block 头)
+            cluster_positions = None
+            if 'mkvmerge' in writing_app.lower() and level1.get(MKV_CUES):
+                cues_pos = level1[MKV_CUES][0]
+                _, size, header_len = read_header_at(f, cues_pos)
+                cues = read_body(f, cues_pos, header_len, size)
+                positions = set()
+                cued_tracks = set()
+                for element_id, point_pos, point_header, point_size in iter_ebml_children(cues, 0, len(cues)):
+                    if element_id != MKV_CUE_POINT:
+                        continue
+                    for child_id, child_pos, child_header, child_size in iter_ebml_children(cues, point_pos + point_header, point_pos + point_header + point_size):
+                        if child_id != MKV_CUE_TRACK_POSITIONS:
+                            continue
+                        track_number = cluster = None
+                        for pos_id, pos_pos, pos_header, pos_size in iter_ebml_children(cues, child_pos + child_header, child_pos + child_header + child_size):
+                            if pos_id == MKV_CUE_TRACK:
+                                track_number = uint_value(cues, pos_pos, pos_header, pos_size)
+                            elif pos_id == MKV_CUE_CLUSTER_POSITION:
+                                cluster = seg_data + uint_value(cues, pos_pos, pos_header, pos_size)
+                        if track_number in wanted and cluster is not None:
+                            positions.add(cluster)
+                            cued_tracks.add(track_number)
+                if cued_tracks == set(wanted):
+                    cluster_positions = sorted(positions)
+
+            texts = {number: [] for number in wanted}
+
+            def collect(number, payload):
+                _, text_format, compression = wanted[number]
+                text = cue_text(decode_payload(payload, compression), text_format)
+                if text:
+                    texts[number].append(text)
+
+            if cluster_positions is not None:
+                for cluster_pos in cluster_positions:
+                    walk_cluster(f, cluster_pos, seg_end, wanted, collect)
+            else:
+                pos = level1[MKV_CLUSTER][0]
+                while pos < seg_end:
+                    header = read_header_at(f, pos)
+                    if not header:
+                        break
+                    element_id, size, header_len = header
+                    if element_id == MKV_CLUSTER:
+                        pos = walk_cluster(f, pos, seg_end, wanted, collect)
+                    elif size is None:
+                        break
+                    else:
+                        pos += header_len + size
+    except (UnsupportedLayout, ValueError, OSError, IndexError, zlib.error, TypeError):
+        return None
+    return {wanted[number][0]: "\n".join(lines) for number, lines in texts.items()}
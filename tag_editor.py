@@ -0,0 +1,344 @@
+import os
+import struct
+import zlib
+
+# 容器头部原地改写：只动标签所在的少量字节，元素/box 长度保持不变，不做整文件重封装。
+# clear_tags() 返回撤销记录 [(偏移, 原始字节), ...]；容器不支持或结构无法安全改写时返回 None。
+
+MAX_HEADER_BYTES = 64 * 1024 * 1024
+
+# ---------- Matroska / WebM (EBML) ----------
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_SEEKHEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TITLE = 0x7BA9
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NAME = 0x536E
+MKV_TAGS = 0x1254C367
+MKV_CLUSTER = 0x1F43B675
+MKV_VOID = 0xEC
+MKV_CRC32 = 0xBF
+
+
+def read_ebml_id(data, pos):
+    first = data[pos]
+    length = 9 - first.bit_length() if first else 0
+    if not 1 <= length <= 4 or pos + length > len(data):
+        raise ValueError("无效 EBML ID")
+    return int.from_bytes(data[pos:pos + length], 'big'), length
+
+
+def read_ebml_size(data, pos):
+    first = data[pos]
+    length = 9 - first.bit_length() if first else 0
+    if not 1 <= length <= 8 or pos + length > len(data):
+        raise ValueError("无效 EBML 长度")
+    value = first & ((1 << (8 - length)) - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    unknown = value == (1 << (7 * length)) - 1
+    return (None if unknown else value), length
+
+
+def read_ebml_header(data, pos):
+    element_id, id_len = read_ebml_id(data, pos)
+    size, size_len = read_ebml_size(data, pos + id_len)
+    return element_id, size, id_len + size_len
+
+
+def iter_ebml_children(data, start, end):
+    pos = start
+    while pos < end:
+        element_id, size, header_len = read_ebml_header(data, pos)
+        if size is None or pos + header_len + size > end:
+            raise ValueError("EBML 子元素越界")
+        yield element_id, pos, header_len, size
+        pos += header_len + size
+
+
+def ebml_void(total_len):
+    # 生成总长恰为 total_len 的 Void 元素
+    for width in range(1, 9):
+        payload = total_len - 1 - width
+        if payload < 0:
+            break
+        if payload < (1 << (7 * width)) - 1:
+            return bytes([MKV_VOID]) + (payload | (1 << (7 * width))).to_bytes(width, 'big') + bytes(payload)
+    return None
+
+
+def fix_ebml_crc(buf, start, end):
+    # 主元素首个子元素为 CRC-32 时，按其后的全部数据重算
+    if start >= end:
+        return
+    element_id, _, header_len, size = next(iter_ebml_children(buf, start, end))
+    if element_id == MKV_CRC32 and size == 4:
+        crc_pos = start + header_len
+        buf[crc_pos:crc_pos + 4] = struct.pack('<I', zlib.crc32(bytes(buf[crc_pos + 4:end])) & 0xFFFFFFFF)
+
+
+def read_at(f, offset, length):
+    f.seek(offset)
+    return f.read(length)
+
+
+def read_element(f, offset, file_size, expected_id):
+    head = read_at(f, offset, 12)
+    element_id, size, header_len = read_ebml_header(head, 0)
+    if element_id != expected_id or size is None or size > MAX_HEADER_BYTES or offset + header_len + size > file_size:
+        return None
+    return bytearray(head[:header_len] + read_at(f, offset + header_len, size)), header_len
+
+
+def void_children(buf, start, end, targets, nested=None):
+    # 把 targets 中的子元素替换为等长 Void；nested 指定需要递归进入的主元素
+    changed = False
+    for element_id, pos, header_len, size in list(iter_ebml_children(buf, start, end)):
+        if element_id in targets:
+            void = ebml_void(header_len + size)
+            if void is None:
+                raise ValueError("无法生成等长 Void")
+            buf[pos:pos + header_len + size] = void
+            changed = True
+        elif nested and element_id in nested:
+            if void_children(buf, pos + header_len, pos + header_len + size, nested[element_id]):
+                fix_ebml_crc(buf, pos + header_len, pos + header_len + size)
+                changed = True
+    return changed
+
+
+def plan_mkv_edits(f, file_size):
+    head = read_at(f, 0, 64)
+    element_id, size, header_len = read_ebml_header(head, 0)
+    if element_id != EBML_HEADER or size is None:
+        return None
+    seg_pos = header_len + size
+    seg_head = read_at(f, seg_pos, 12)
+    element_id, seg_size, seg_header_len = read_ebml_header(seg_head, 0)
+    if element_id != MKV_SEGMENT:
+        return None
+    seg_data = seg_pos + seg_header_len
+    seg_end = file_size if seg_size is None else min(file_size, seg_data + seg_size)
+
+    # 顶层元素：Cluster 之前顺序扫描，之后的 (通常是 Tags) 通过 SeekHead 定位
+    level1 = {}
+    pos = seg_data
+    while pos < seg_end:
+        element_id, size, header_len = read_ebml_header(read_at(f, pos, 12), 0)
+        if element_id == MKV_CLUSTER:
+            break
+        if size is None:
+            return None
+        level1.setdefault(element_id, set()).add(pos)
+        pos += header_len + size
+
+    seekheads = set(level1.get(MKV_SEEKHEAD, ()))
+    visited = set()
+    while seekheads - visited:
+        seek_pos = min(seekheads - visited)
+        visited.add(seek_pos)
+        loaded = read_element(f, seek_pos, file_size, MKV_SEEKHEAD)
+        if not loaded:
+            continue
+        buf, header_len = loaded
+        for element_id, entry_pos, entry_header, entry_size in iter_ebml_children(buf, header_len, len(buf)):
+            if element_id != MKV_SEEK:
+                continue
+            target_id = target_pos = None
+            for child_id, child_pos, child_header, child_size in iter_ebml_children(buf, entry_pos + entry_header, entry_pos + entry_header + entry_size):
+                value = bytes(buf[child_pos + child_header:child_pos + child_header + child_size])
+                if child_id == MKV_SEEK_ID:
+                    target_id = int.from_bytes(value, 'big')
+                elif child_id == MKV_SEEK_POSITION:
+                    target_pos = seg_data + int.from_bytes(value, 'big')
+            if target_id in (MKV_SEEKHEAD, MKV_INFO, MKV_TRACKS, MKV_TAGS) and target_pos is not None and target_pos < seg_end:
+                level1.setdefault(target_id, set()).add(target_pos)
+                if target_id == MKV_SEEKHEAD:
+                    seekheads.add(target_pos)
+
+    edits = []
+    for offset in sorted(level1.get(MKV_INFO, ())):
+        loaded = read_element(f, offset, file_size, MKV_INFO)
+        if loaded:
+            buf, header_len = loaded
+            original = bytes(buf)
+            if void_children(buf, header_len, len(buf), {MKV_TITLE}):
+                fix_ebml_crc(buf, header_len, len(buf))
+                edits.append((offset, original, bytes(buf)))
+    for offset in sorted(level1.get(MKV_TRACKS, ())):
+        loaded = read_element(f, offset, file_size, MKV_TRACKS)
+        if loaded:
+            buf, header_len = loaded
+            original = bytes(buf)
+            if void_children(buf, header_len, len(buf), set(), nested={MKV_TRACK_ENTRY: {MKV_TRACK_NAME}}):
+                fix_ebml_crc(buf, header_len, len(buf))
+                edits.append((offset, original, bytes(buf)))
+    tags_found = False
+    for offset in sorted(level1.get(MKV_TAGS, ())):
+        loaded = read_element(f, offset, file_size, MKV_TAGS)
+        if loaded:
+            buf, _ = loaded
+            void = ebml_void(len(buf))
+            if void is None:
+                return None
+            edits.append((offset, bytes(buf), void))
+            tags_found = True
+    if tags_found:
+        # SeekHead 中指向 Tags 的条目一并作废，避免播放器跳到 Void
+        for offset in sorted(visited):
+            loaded = read_element(f, offset, file_size, MKV_SEEKHEAD)
+            if not loaded:
+                continue
+            buf, header_len = loaded
+            original = bytes(buf)
+            tag_seeks = set()
+            for element_id, entry_pos, entry_header, entry_size in iter_ebml_children(buf, header_len, len(buf)):
+                if element_id != MKV_SEEK:
+                    continue
+                for child_id, child_pos, child_header, child_size in iter_ebml_children(buf, entry_pos + entry_header, entry_pos + entry_header + entry_size):
+                    if child_id == MKV_SEEK_ID and int.from_bytes(buf[child_pos + child_header:child_pos + child_header + child_size], 'big') == MKV_TAGS:
+                        tag_seeks.add(entry_pos)
+            for entry_pos in tag_seeks:
+                _, size, entry_header = read_ebml_header(buf, entry_pos)
+                buf[entry_pos:entry_pos + entry_header + size] = ebml_void(entry_header + size)
+            if tag_seeks:
+                fix_ebml_crc(buf, header_len, len(buf))
+                edits.append((offset, original, bytes(buf)))
+    return edits
+
+
+# ---------- MP4 / MOV (ISO BMFF) ----------
+MP4_CONTAINERS = {b'trak', b'mdia', b'minf'}
+
+
+def read_box_header(data, pos, end):
+    if pos + 8 > end:
+        raise ValueError("box 头部越界")
+    size, box_type = struct.unpack_from('>I4s', data, pos)
+    header_len = 8
+    if size == 1:
+        if pos + 16 > end:
+            raise ValueError("box 头部越界")
+        size = struct.unpack_from('>Q', data, pos + 8)[0]
+        header_len = 16
+    elif size == 0:
+        size = end - pos
+    if size < header_len or pos + size > end:
+        raise ValueError("box 长度无效")
+    return box_type, size, header_len
+
+
+def free_box_edits(pos, size, header_len):
+    # 改名为 free 并清空内容，box 长度不变
+    return [(pos + 4, b'free'), (pos + header_len, bytes(size - header_len))]
+
+
+def plan_mp4_box_edits(buf, start, end, parent, edits):
+    pos = start
+    while pos < end:
+        box_type, size, header_len = read_box_header(buf, pos, end)
+        if box_type == b'cmov':
+            raise ValueError("压缩 moov 不支持原地改写")
+        if box_type in (b'udta', b'meta') and parent in (b'moov', b'trak'):
+            edits.extend(free_box_edits(pos, size, header_len))
+        elif box_type == b'hdlr' and parent in (b'mdia', b'minf'):
+            # FullBox(4) + pre_defined(4) + handler_type(4) + reserved(12) 之后为名称
+            name_pos = pos + header_len + 24
+            if name_pos < pos + size and any(buf[name_pos:pos + size]):
+                edits.append((name_pos, bytes(pos + size - name_pos)))
+        elif box_type in MP4_CONTAINERS:
+            plan_mp4_box_edits(buf, pos + header_len, pos + size, box_type, edits)
+        pos += size
+
+
+def plan_mp4_edits(f, file_size):
+    pos = 0
+    moov = None
+    edits = []
+    while pos + 8 <= file_size:
+        head = read_at(f, pos, 16)
+        size, box_type = struct.unpack_from('>I4s', head, 0)
+        header_len = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', head, 8)[0]
+            header_len = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_len or pos + size > file_size:
+            return None
+        if box_type == b'moov':
+            if moov is not None:
+                return None
+            moov = (pos, header_len, size)
+        elif box_type in (b'udta', b'meta') and size <= MAX_HEADER_BYTES:
+            for offset, data in free_box_edits(pos, size, header_len):
+                edits.append((offset, read_at(f, offset, len(data)), data))
+        pos += size
+    if moov is None or moov[2] > MAX_HEADER_BYTES:
+        return None
+    moov_pos, header_len, size = moov
+    buf = read_at(f, moov_pos, size)
+    box_edits = []
+    plan_mp4_box_edits(buf, header_len, size, b'moov', box_edits)
+    for offset, data in box_edits:
+        edits.append((moov_pos + offset, bytes(buf[offset:offset + len(data)]), data))
+    return edits
+
+
+# ---------- 入口 ----------
+def detect_container(path):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(12)
+    except OSError:
+        return None
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'mkv'
+    if head[4:8] in (b'ftyp', b'moov', b'free', b'wide', b'mdat', b'skip'):
+        return 'mp4'
+    return None
+
+
+def clear_tags(path):
+    container = detect_container(path)
+    if not container:
+        return None
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            edits = plan_mkv_edits(f, file_size) if container == 'mkv' else plan_mp4_edits(f, file_size)
+    except (OSError, ValueError, StopIteration, struct.error, IndexError):
+        return None
+    if edits is None:
+        return None
+    undo = []
+    try:
+        with open(path, 'r+b') as f:
+            for offset, original, data in edits:
+                if original == data:
+                    continue
+                undo.append((offset, original))
+                f.seek(offset)
+                f.write(data)
+                # 每处改写单独落盘，中途断电最多留下一处未完成的改写
+                f.flush()
+                os.fsync(f.fileno())
+    except OSError:
+        # 写到一半失败：已写入的区域按原样写回
+        restore_regions(path, undo)
+        return None
+    return undo
+
+
+def restore_regions(path, undo):
+    with open(path, 'r+b') as f:
+        for offset, original in reversed(undo):
+            f.seek(offset)
+            f.write(original)
+            f.flush()
+            os.fsync(f.fileno())
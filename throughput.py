@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+# 子进程时限估算：按卷 (st_dev) 记录实测的整文件读写吞吐 (EWMA)，按输入体积换算总时限；
+# 另外解析 ffmpeg -progress 输出，进度长时间不变即判定卡死，不必等满总时限。
+
+DEFAULT_BYTES_PER_SEC = 30 * 1024 * 1024
+MIN_BYTES_PER_SEC = 2 * 1024 * 1024
+MIN_SAMPLE_BYTES = 64 * 1024 * 1024
+EWMA_ALPHA = 0.3
+TIMEOUT_SAFETY = 3.0
+PROGRESS_KEYS = ('frame', 'total_size', 'out_time_us', 'out_time_ms')
+
+_rates = {}
+_rates_lock = threading.Lock()
+
+
+def volume_key(path):
+    for candidate in (path, os.path.dirname(path) or '.'):
+        try:
+            return os.stat(candidate).st_dev
+        except OSError:
+            continue
+    return None
+
+
+def estimate_rate(path):
+    with _rates_lock:
+        return _rates.get(volume_key(path), DEFAULT_BYTES_PER_SEC)
+
+
+def record_transfer(path, nbytes, seconds):
+    # 小文件多半命中页缓存，测出的速度不代表磁盘，不计入
+    if nbytes < MIN_SAMPLE_BYTES or seconds <= 0:
+        return None
+    key = volume_key(path)
+    if key is None:
+        return None
+    sample = max(MIN_BYTES_PER_SEC, nbytes / seconds)
+    with _rates_lock:
+        previous = _rates.get(key)
+        rate = sample if previous is None else previous + EWMA_ALPHA * (sample - previous)
+        _rates[key] = rate
+    return rate
+
+
+def scaled_timeout(path, nbytes=None, passes=1.0, minimum=60):
+    # passes: 需要完整读写该体积的次数 (重封装同卷读+写记 2)
+    if nbytes is None:
+        try:
+            nbytes = os.path.getsize(path)
+        except OSError:
+            nbytes = 0
+    rate = max(MIN_BYTES_PER_SEC, estimate_rate(path))
+    return int(minimum + TIMEOUT_SAFETY * passes * max(0, nbytes) / rate)
+
+
+class ProgressWatch:
+    # 读取 ffmpeg -progress 的 key=value 行；任一计数变化都刷新 last_change
+    def __init__(self):
+        self.last_change = time.time()
+        self.values = {}
+        self.finished = False
+
+    def feed(self, line):
+        key, _, value = line.strip().partition('=')
+        if key == 'progress' and value == 'end':
+            self.finished = True
+            self.last_change = time.time()
+        elif key in PROGRESS_KEYS and self.values.get(key) != value:
+            self.values[key] = value
+            self.last_change = time.time()
+
+    def stalled_for(self):
+        return time.time() - self.last_change
+
+    def follow(self, pipe):
+        def reader():
+            try:
+                for raw in iter(pipe.readline, b''):
+                    self.feed(raw.decode('utf-8', errors='ignore'))
+            except (OSError, ValueError):
+                pass
+            finally:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
+
+        thread = threading.Thread(target=reader, daemon=True)
+        thread.start()
+        return thread